@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+Benchmark clause classification across model tiers
+Runs the same clauses through the classification tier and the drafting tier
+(the large model) and reports latency and how often their risk levels agree.
+Caches are bypassed, so every call reaches the model.
+
+Usage: python benchmark_model_tiers.py [--clauses FILE] [--runs N] [--baseline MODEL] [--candidate MODEL] [--free-form]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+import django
+
+# Setup Django
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+
+from core.ai_service import ai_service
+from redlining.utils import CLAUSE_VERDICT_SCHEMA, build_clause_messages, parse_clause_analysis
+
+SAMPLE_CLAUSES = [
+    "The Receiving Party shall hold the Confidential Information in strict confidence and shall not disclose it to any third party without the prior written consent of the Disclosing Party.",
+    "This Agreement shall remain in effect for a period of two (2) years from the Effective Date.",
+    "The Receiving Party agrees to indemnify the Disclosing Party for any and all losses, of any kind and without limit, arising from any breach of this Agreement, however minor.",
+    "Confidential Information does not include information that is or becomes publicly available through no fault of the Receiving Party.",
+    "The Disclosing Party may amend the terms of this Agreement at any time without notice to the Receiving Party.",
+    "The obligations of confidentiality shall survive termination of this Agreement indefinitely.",
+    "Either party may terminate this Agreement upon thirty (30) days written notice to the other party.",
+    "The Receiving Party assigns to the Disclosing Party all intellectual property it develops during the term of this Agreement, whether or not related to the Confidential Information.",
+    "This Agreement shall be governed by the laws of the State of Delaware.",
+    "Upon request, the Receiving Party shall promptly return or destroy all Confidential Information in its possession.",
+]
+
+
+def load_clauses(path):
+    """Read clauses from a file, one per paragraph"""
+    with open(path, encoding='utf-8') as f:
+        return [block.strip() for block in f.read().split('\n\n') if block.strip()]
+
+
+def classify(clause_text, model, response_format):
+    """Classify one clause on a model, returning (risk level or None, seconds, response length)"""
+    started = time.monotonic()
+    response = ai_service.generate_response(build_clause_messages(clause_text), model=model, temperature=0.3, use_cache=False, task='classification', response_format=response_format)
+    elapsed = time.monotonic() - started
+    analysis = parse_clause_analysis(response) or {}
+    return analysis.get('risk_level'), elapsed, len(response)
+
+
+def run_tier(name, model, clauses, runs, response_format):
+    """Classify every clause on a model, returning the risk level from the last run, all latencies and response lengths"""
+    print(f"\n🧪 {name}: {model}")
+    levels = []
+    latencies = []
+    lengths = []
+    for clause_text in clauses:
+        for _ in range(runs):
+            level, elapsed, length = classify(clause_text, model, response_format)
+            latencies.append(elapsed)
+            lengths.append(length)
+        levels.append(level)
+        print(f"  {elapsed:6.2f}s  {level or 'unparsed':8}  {clause_text[:60]}")
+    return levels, latencies, lengths
+
+
+def summarize(name, latencies, levels, lengths):
+    ordered = sorted(latencies)
+    p95 = ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
+    parsed = sum(1 for level in levels if level)
+    print(f"  {name:10} mean {statistics.mean(latencies):6.2f}s  p50 {statistics.median(latencies):6.2f}s  p95 {p95:6.2f}s  total {sum(latencies):7.1f}s  parsed {parsed}/{len(levels)}  ~{statistics.mean(lengths) / 4:.0f} tokens")
+
+
+def main():
+    provider = ai_service.get_current_provider()
+    parser = argparse.ArgumentParser(description="Compare clause classification latency and agreement between model tiers")
+    parser.add_argument('--clauses', help="File with one clause per paragraph (default: built-in NDA samples)")
+    parser.add_argument('--runs', type=int, default=1, help="Calls per clause and model")
+    parser.add_argument('--baseline', default=ai_service.get_task_model('drafting', provider), help="Reference model (default: the drafting tier)")
+    parser.add_argument('--candidate', default=ai_service.get_task_model('classification', provider), help="Model under test (default: the classification tier)")
+    parser.add_argument('--free-form', action='store_true', help="Let the models answer without the JSON schema, to compare parse failures")
+    args = parser.parse_args()
+
+    clauses = load_clauses(args.clauses) if args.clauses else SAMPLE_CLAUSES
+    print("=" * 50)
+    print(f"Model Tier Benchmark ({provider}, {len(clauses)} clauses x {args.runs} runs)")
+    print("=" * 50)
+
+    response_format = None if args.free_form else CLAUSE_VERDICT_SCHEMA
+    candidate_levels, candidate_latencies, candidate_lengths = run_tier('Candidate', args.candidate, clauses, args.runs, response_format)
+    baseline_levels, baseline_latencies, baseline_lengths = run_tier('Baseline', args.baseline, clauses, args.runs, response_format)
+
+    compared = [(b, c) for b, c in zip(baseline_levels, candidate_levels) if b and c]
+    agreement = sum(1 for b, c in compared if b == c) / len(compared) if compared else 0.0
+    # Missing a red clause matters far more than any other disagreement
+    missed_red = sum(1 for b, c in compared if b == 'red' and c != 'red')
+
+    print("\n📊 Results")
+    summarize(args.candidate, candidate_latencies, candidate_levels, candidate_lengths)
+    summarize(args.baseline, baseline_latencies, baseline_levels, baseline_lengths)
+    speedup = statistics.mean(baseline_latencies) / statistics.mean(candidate_latencies)
+    print(f"  Speedup: {speedup:.1f}x")
+    print(f"  Agreement on risk level: {agreement:.0%} of {len(compared)} clauses both models parsed")
+    print(f"  Red clauses the candidate did not flag red: {missed_red}")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,44 +1,401 @@
 import os
+import time
 from django.conf import settings
 from openai import OpenAI
 import requests
 import json
+from .http_pool import http_pool
+from .response_cache import make_cache_key, response_cache
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from .health import HealthMonitor
+from .residency import ModelResidencyManager
+from .chat_sessions import chat_sessions
+from .backends import ModelNotFound, OllamaBackendPool
+from .scheduler import create_schedulers
+from .single_flight import SingleFlight
+from .streams import HedgeStats, StreamCancelled, StreamDeadlineExceeded, StreamStalled, abort_stream, race_streams
+from .structured import stop_after_json
+from .tokens import estimate_tokens
+
+# Returned instead of raising when OpenAI fails; never cached
+OPENAI_ERROR_RESPONSE = "I apologize, but I'm having trouble connecting to the AI service. Please try again later."
+
+
+class OpenAIResponseError(Exception):
+    """Raised when an OpenAI completion fails"""
 
 
 class AIService:
     """AI Service class to handle both OpenAI and Mistral AI providers"""
     
+    # Models used when a caller does not request a specific one
+    DEFAULT_MODELS = {
+        'mistral': 'mistral',
+        'openai': 'gpt-4',
+    }
+    
     def __init__(self):
         self.provider = getattr(settings, 'AI_PROVIDER', 'mistral')
         self.openai_client = None
-        self.mistral_base_url = getattr(settings, 'MISTRAL_BASE_URL', 'http://localhost:11434')
+        self.backends = OllamaBackendPool()
+        self.mistral_base_url = self.backends.primary_url
+        self.mistral_num_ctx = getattr(settings, 'MISTRAL_NUM_CTX', None)
+        self.task_models = getattr(settings, 'AI_TASK_MODELS', {})
+        self.circuit_breakers = {
+            'mistral': CircuitBreaker('mistral'),
+            'openai': CircuitBreaker('openai'),
+        }
+        self.schedulers = create_schedulers()
+        self.hedge_after = getattr(settings, 'AI_HEDGE_AFTER_SECONDS', 8)
+        self.hedge_tasks = getattr(settings, 'AI_HEDGE_TASKS', []) if getattr(settings, 'AI_HEDGE_ENABLED', False) else []
+        self.hedge_stats = HedgeStats()
+        self.stream_timeouts = getattr(settings, 'AI_STREAM_TIMEOUTS', {})
+        self.single_flight = SingleFlight() if getattr(settings, 'AI_SINGLE_FLIGHT_ENABLED', True) else None
         
-        if self.provider == 'openai':
-            openai_api_key = getattr(settings, 'OPENAI_API_KEY')
-            if openai_api_key:
+        # Configure OpenAI whenever a key is present so it can serve as the Mistral fallback
+        openai_api_key = getattr(settings, 'OPENAI_API_KEY', None)
+        if openai_api_key:
+            try:
                 self.openai_client = OpenAI(api_key=openai_api_key)
+            except Exception as e:
+                # A broken client only disables the fallback; Mistral keeps serving
+                print(f"OpenAI client could not be created, fallback disabled: {e}")
+        
+        self.health_monitor = HealthMonitor(self)
+        self.residency = ModelResidencyManager(self)
+    
+    def start_background_services(self):
+        """Start the background workers that keep provider state fresh and models loaded"""
+        self.health_monitor.start()
+        self.residency.start()
+    
+    def generate_response(self, messages, model=None, max_tokens=None, temperature=0.3, use_cache=True, session_key=None, followup=None, task='chat', client=None, affinity_key=None, cancel=None, response_format=None):
+        """Generate AI response using the configured provider
+
+        task ('chat', 'drafting' or 'classification') sets the scheduling priority, and client
+        (see core.scheduler.get_client_key) the caller whose fair share the request counts against.
+        The task also picks the model tier (AI_TASK_MODELS) used unless model is given, and
+        the max_tokens default.
+        Requests sharing an affinity_key (default: the session key) go to the same Ollama
+        backend where load allows, so its KV cache stays warm. Cancelling `cancel` (a
+        core.streams.CancellationToken) from another thread stops the request, whether it
+        is still queued or already streaming, and raises StreamCancelled. Identical requests
+        running at the same time share one generation (see core.single_flight).
+        response_format (a JSON schema, or 'json' for any JSON object) constrains the output
+        to JSON, which ends at the JSON's closing bracket; read it with core.structured.extract_json.
+        Passing session_key makes this a conversation turn: on Mistral the Ollama context
+        of the previous turn is reused and only the `followup` messages are sent, while
+        `messages` must still be the complete request for first turns and fallbacks.
+        """
+        request = self._build_request(messages, model, max_tokens, temperature, session_key, followup, task, client, affinity_key, cancel, response_format)
+        cache_key = self._get_cache_key(request, use_cache)
+        if cache_key:
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        response = self._generate_uncached(request)
+        store_key = self._get_store_key(request, cache_key)
+        if store_key and response and response != OPENAI_ERROR_RESPONSE:
+            response_cache.set(store_key, response)
+        return response
+    
+    def _generate_uncached(self, request):
+        """Generate AI response from the provider, with Mistral to OpenAI fallback"""
+        try:
+            return "".join(self._stream_shared(request)).strip()
+        except (OpenAIResponseError, CircuitOpenError) as e:
+            print(f"OpenAI API error: {e}")
+            return OPENAI_ERROR_RESPONSE
+    
+    def stream_response(self, messages, model=None, max_tokens=None, temperature=0.3, use_cache=True, session_key=None, followup=None, task='chat', client=None, affinity_key=None, cancel=None, response_format=None):
+        """Yield response tokens from the configured provider as they arrive (see generate_response)"""
+        request = self._build_request(messages, model, max_tokens, temperature, session_key, followup, task, client, affinity_key, cancel, response_format)
+        cache_key = self._get_cache_key(request, use_cache)
+        if cache_key:
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+        
+        # Only a stream that ran to completion is stored
+        response = ""
+        for token in self._stream_shared(request):
+            response += token
+            yield token
+        store_key = self._get_store_key(request, cache_key)
+        if store_key and response.strip():
+            response_cache.set(store_key, response.strip())
+    
+    def _build_request(self, messages, model, max_tokens, temperature, session_key, followup, task, client, affinity_key, cancel, response_format):
+        """Collect the parameters of one generation for the internal pipeline"""
+        return {
+            'messages': messages,
+            'model': model,
+            'max_tokens': max_tokens or self.get_task_profile(task).get('max_tokens', 1000),
+            'temperature': temperature,
+            'session_key': session_key,
+            'followup': followup,
+            'task': task,
+            'client': client,
+            'affinity_key': affinity_key or session_key,
+            'limits': None,
+            'cancel': cancel,
+            'response_format': response_format,
+            # Which provider answered, filled in by the generation; shared by copies of the request
+            'served_by': {},
+        }
+    
+    def _stream_limits(self, task):
+        """First-token and inter-token timeouts and the absolute deadline for a task's generation"""
+        timeouts = self.stream_timeouts.get(task) or self.stream_timeouts.get('drafting') or {'idle': 60, 'deadline': 300}
+        return {
+            'first_token': timeouts.get('first_token', timeouts['idle']),
+            'idle': timeouts['idle'],
+            'deadline': time.monotonic() + timeouts['deadline'],
+        }
     
-    def generate_response(self, messages, model=None, max_tokens=1000, temperature=0.3):
-        """Generate AI response using the configured provider"""
+    def _stream_shared(self, request):
+        """Yield response tokens, sharing one generation among concurrent identical requests"""
+        # Conversation turns depend on session state, so each one runs on its own
+        if self.single_flight is None or request['session_key']:
+            return self._stream_generation(request)
+        model = request['model'] or self.get_task_model(request['task'])
+        key = make_cache_key(self.provider, model, request['messages'], request['temperature'], request['max_tokens'], request['response_format'])
+        # The shared generation is scheduled as the first caller's request
+        return self.single_flight.stream(key, lambda cancel: self._stream_generation(dict(request, cancel=cancel)), request['cancel'])
+    
+    def _stream_generation(self, request):
+        """Yield response tokens from the provider, ending a JSON response at its closing bracket"""
+        stream = self._stream_uncached(request)
+        if request['response_format'] is None:
+            return stream
+        return stop_after_json(stream)
+    
+    def _stream_uncached(self, request):
+        """Yield response tokens from the provider, with Mistral to OpenAI fallback"""
         if self.provider == 'mistral':
+            started = False
             try:
-                return self._generate_mistral_response(messages, model, max_tokens, temperature)
+                for token in self._guarded_stream('mistral', request):
+                    started = True
+                    yield token
+                # A hedge sent to OpenAI may have produced the answer instead
+                hedge = request['served_by'].pop('openai_hedge', None)
+                if hedge is not None and hedge.get('won'):
+                    request['served_by'].update(provider='openai', hedged=True)
+                else:
+                    request['served_by']['provider'] = 'mistral'
+                return
+            except (StreamCancelled, StreamDeadlineExceeded):
+                raise
+            except CircuitOpenError as e:
+                # Skip the Mistral timeout entirely while its circuit is open
+                print(f"{e}, routing to OpenAI fallback")
             except Exception as e:
+                # Tokens already sent to the caller cannot be taken back, so only
+                # fall back when Mistral failed before producing any output
+                if started:
+                    raise
                 print(f"Mistral failed, trying OpenAI fallback: {e}")
-                # Fallback to OpenAI if Mistral fails
-                if self.openai_client:
-                    return self._generate_openai_response(messages, model, max_tokens, temperature)
-                else:
-                    raise Exception("Mistral AI is not available and OpenAI is not configured. Please install Ollama or configure OpenAI API key.")
+            if not self.openai_client:
+                raise Exception("Mistral AI is not available and OpenAI is not configured. Please install Ollama or configure OpenAI API key.")
+            yield from self._guarded_stream('openai', request)
+            request['served_by']['provider'] = 'openai'
         elif self.provider == 'openai':
-            return self._generate_openai_response(messages, model, max_tokens, temperature)
+            yield from self._guarded_stream('openai', request)
+            request['served_by']['provider'] = 'openai'
         else:
             raise ValueError(f"Unsupported AI provider: {self.provider}")
     
+    def _provider_stream(self, provider, request, handle=None):
+        """Start the raw token stream for a request on one provider"""
+        model = request['model'] or self.get_task_model(request['task'], provider)
+        args = (request['messages'], model, request['max_tokens'], request['temperature'])
+        response_format = request['response_format']
+        limits = request['limits']
+        cancel = request['cancel']
+        if provider == 'mistral' and request['task'] in self.hedge_tasks and not request['session_key']:
+            return race_streams(
+                lambda handle: self._stream_mistral_response(*args, affinity_key=request['affinity_key'], handle=handle, limits=limits, response_format=response_format),
+                lambda handle, primary_handle: self._start_hedge(request, handle, primary_handle),
+                self.hedge_after,
+                self.hedge_stats,
+                cancel
+            )
+        if cancel is not None and handle is None:
+            handle = {}
+            return self._cancellable(self._provider_stream(provider, request, handle), handle, cancel)
+        
+        if provider == 'openai':
+            return self._stream_openai_response(*args, handle=handle, limits=limits, response_format=response_format)
+        if request['session_key']:
+            # Conversation turns depend on one backend's stored context, so they are never hedged
+            return self._stream_mistral_session(request['followup'], request['session_key'], *args, affinity_key=request['affinity_key'], handle=handle, limits=limits)
+        return self._stream_mistral_response(*args, affinity_key=request['affinity_key'], handle=handle, limits=limits, response_format=response_format)
+    
+    def _cancellable(self, stream, handle, cancel):
+        """Abort the live response published in handle as soon as cancel is cancelled"""
+        unregister = cancel.on_cancel(lambda: abort_stream(handle))
+        try:
+            yield from stream
+        finally:
+            unregister()
+    
+    def _start_hedge(self, request, handle, primary_handle):
+        """Start a second copy of a slow Mistral request on another backend, or on OpenAI
+
+        The hedge's scheduler slot is taken here, without waiting, and released by the
+        returned stream. Returns None when neither has a free slot: hedging into a queue
+        would only add load.
+        """
+        if len(self.backends) > 1 and self.schedulers['mistral'].try_acquire(request['task'], request['client']):
+            return self._stream_hedge_backend(request, handle, primary_handle.get('base_url'))
+        if self.openai_client and self.schedulers['openai'].try_acquire(request['task'], request['client']):
+            # race_streams marks the handle if this copy wins, so the answer is cached as OpenAI's
+            request['served_by']['openai_hedge'] = handle
+            return self._guarded_stream('openai', dict(request, model=None), handle, acquired=True)
+        return None
+    
+    def _stream_hedge_backend(self, request, handle, primary_url):
+        """Yield tokens for the hedge copy of a request from an Ollama backend other than the primary's"""
+        with self.schedulers['mistral'].slot(request['task'], request['client'], acquired=True):
+            with self.backends.backend(exclude={primary_url}) as lease:
+                model = request['model'] or self.get_task_model(request['task'], 'mistral')
+                yield from self._stream_mistral_response(request['messages'], model, request['max_tokens'], request['temperature'], lease=lease, handle=handle, limits=request['limits'], response_format=request['response_format'])
+    
+    def _guarded_stream(self, provider, request, handle=None, acquired=False):
+        """Run a provider stream through that provider's circuit breaker and scheduler
+
+        With acquired set, the caller already holds a scheduler slot, which the stream releases.
+        """
+        breaker = self.circuit_breakers[provider]
+        if not breaker.allow_request():
+            if acquired:
+                self.schedulers[provider].release(request['client'])
+            raise CircuitOpenError(f"{provider} circuit is open")
+        
+        outcome = None
+        try:
+            # Wait for a slot on the provider; higher-priority tasks are admitted first,
+            # and clients within a priority class take turns by fair share
+            with self.schedulers[provider].slot(request['task'], request['client'], request['cancel'], acquired):
+                if request['limits'] is None:
+                    # The deadline starts at the first admission and also covers any fallback
+                    request['limits'] = self._stream_limits(request['task'])
+                yield from self._provider_stream(provider, request, handle)
+            outcome = True
+        except (StreamCancelled, StreamDeadlineExceeded, ModelNotFound):
+            raise
+        except Exception:
+            outcome = False
+            raise
+        finally:
+            if outcome is True:
+                breaker.record_success()
+            elif outcome is False:
+                breaker.record_failure()
+            else:
+                # The consumer stopped reading, the stream was cancelled, the deadline was spent
+                # or the model is not installed; this says nothing about provider health
+                breaker.release()
+    
     def _generate_mistral_response(self, messages, model=None, max_tokens=1000, temperature=0.3):
         """Generate response using local Mistral via Ollama with streaming"""
+        return "".join(self._stream_mistral_response(messages, model, max_tokens, temperature)).strip()
+    
+    def _stream_on_backend(self, affinity_key, start_stream):
+        """Run a Mistral stream on a pooled backend, moving to another one if it fails
+
+        start_stream(lease) starts the stream on a leased backend. A failure before any
+        output, a stall included, moves to the next backend. Once tokens have reached the
+        caller the stream is not restarted, as the new output would repeat them, so the
+        failure (StreamStalled for a stall) is raised to the caller. Neither is a request
+        whose deadline has passed (StreamDeadlineExceeded).
+        """
+        tried = set()
+        while True:
+            started = False
+            try:
+                with self.backends.backend(affinity_key, exclude=tried) as lease:
+                    for token in start_stream(lease):
+                        started = True
+                        yield token
+                return
+            except (StreamCancelled, StreamDeadlineExceeded):
+                raise
+            except Exception as e:
+                tried.add(lease['base_url'])
+                if started or len(tried) >= len(self.backends):
+                    raise
+                print(f"Ollama backend {lease['base_url']} failed, trying another backend: {e}")
+    
+    def _stream_mistral_session(self, followup, session_key, messages, model=None, max_tokens=1000, temperature=0.3, affinity_key=None, lease=None, handle=None, limits=None):
+        """Yield Mistral tokens for a conversation turn, continuing from the stored Ollama context"""
+        if lease is None:
+            yield from self._stream_on_backend(
+                affinity_key or session_key,
+                lambda lease: self._stream_mistral_session(followup, session_key, messages, model, max_tokens, temperature, lease=lease, handle=handle, limits=limits)
+            )
+            return
+        
+        model = model or self.get_default_model('mistral')
+        prompt_messages = followup or messages
+        reserve = estimate_tokens(self._convert_messages_to_prompt(prompt_messages)) + max_tokens
+        # A stored context is only valid on the backend that produced it
+        context = chat_sessions.get(session_key, model, lease['base_url'], reserve_tokens=reserve, max_context_tokens=self.get_num_ctx(model))
+        final = {}
+        
+        started = False
+        try:
+            if context is None:
+                # First turn, or the stored context is gone: send the full request
+                yield from self._stream_mistral_response(messages, model, max_tokens, temperature, final=final, lease=lease, handle=handle, limits=limits)
+            else:
+                for token in self._stream_mistral_response(prompt_messages, model, max_tokens, temperature, context=context, final=final, lease=lease, handle=handle, limits=limits):
+                    started = True
+                    yield token
+        except (StreamCancelled, StreamStalled, StreamDeadlineExceeded):
+            # The request was stopped or ran out of time, which says nothing about the
+            # stored context, and running it again without the context would repeat it
+            if context is None or started:
+                chat_sessions.invalidate(session_key, model)
+            raise
+        except Exception:
+            if context is None or started:
+                chat_sessions.invalidate(session_key, model)
+                raise
+            # The stored context was rejected, so retry once as a self-contained request
+            chat_sessions.invalidate(session_key, model, fallback=True)
+            yield from self._stream_mistral_response(messages, model, max_tokens, temperature, final=final, lease=lease, handle=handle, limits=limits)
+        
+        if final.get('context'):
+            chat_sessions.set(session_key, model, lease['base_url'], final['context'])
+    
+    def _stream_mistral_response(self, messages, model=None, max_tokens=1000, temperature=0.3, context=None, final=None, affinity_key=None, lease=None, handle=None, limits=None, response_format=None):
+        """Yield response tokens from local Mistral via Ollama
+
+        context continues from the KV state of an earlier response; final, if given, is
+        filled with Ollama's closing chunk (token counts, timings and the new context).
+        The request runs on the backend of `lease`, or on one leased from the pool.
+        handle, if given, receives the live response so another thread can abort it.
+        limits ({'first_token', 'idle', 'deadline'}) bound the wait for the first token,
+        between tokens and for the whole stream; running out of the deadline raises
+        StreamDeadlineExceeded, the other two StreamStalled.
+        response_format is passed to Ollama as the output format (a JSON schema or 'json').
+        """
+        if lease is None:
+            yield from self._stream_on_backend(
+                affinity_key,
+                lambda lease: self._stream_mistral_response(messages, model, max_tokens, temperature, context, final, lease=lease, handle=handle, limits=limits, response_format=response_format)
+            )
+            return
+        
+        if handle is not None and handle.get('cancelled'):
+            raise StreamCancelled("Mistral stream cancelled")
+        self._check_deadline(limits, "Mistral AI")
         if not model:
-            model = "mistral"  # Default Mistral model
+            model = self.get_default_model('mistral')
         
         # Convert messages to Ollama format
         prompt = self._convert_messages_to_prompt(messages)
@@ -47,24 +404,49 @@ class AIService:
             "model": model,
             "prompt": prompt,
             "stream": True,  # Enable streaming
+            "keep_alive": self.residency.keep_alive,  # Keep the model loaded between requests
             "options": {
                 "temperature": temperature,
                 "num_predict": max_tokens
             }
         }
+        num_ctx = self.get_num_ctx(model)
+        if num_ctx:
+            payload["options"]["num_ctx"] = num_ctx
+        if response_format is not None:
+            payload["format"] = response_format
+        if context:
+            payload["context"] = context
+        self.residency.note_used(model)
         
+        response = None
+        started = time.monotonic()
+        received = False
+        read_timeout, deadline_bound = self._read_timeout(limits, 'first_token')
+        if handle is not None:
+            handle['base_url'] = lease['base_url']
         try:
-            response = requests.post(
-                f"{self.mistral_base_url}/api/generate",
+            response = http_pool.post(
+                lease['base_url'],
+                "/api/generate",
                 json=payload,
                 stream=True,  # Enable streaming in requests
-                timeout=300  # 5 minutes for streaming
+                # Ollama sends headers with the first token, so this bounds time to first token
+                read_timeout=read_timeout,
+                # Lets a hedge that lost be cut off while it still waits for that first token
+                handle=handle
             )
+            if handle is not None:
+                handle['response'] = response
+                if handle.get('cancelled'):
+                    raise StreamCancelled("Mistral stream cancelled")
             response.raise_for_status()
             
-            # Collect streaming response
-            full_response = ""
             for line in response.iter_lines():
+                if limits is not None:
+                    self._check_deadline(limits, "Mistral AI")
+                    read_timeout, deadline_bound = self._read_timeout(limits, 'idle')
+                    http_pool.set_read_timeout(response, read_timeout)
                 if line:
                     try:
                         # Parse JSON from each line
@@ -76,54 +458,151 @@ class AIService:
                             break
                             
                         json_data = json.loads(data)
-                        if 'response' in json_data:
-                            full_response += json_data['response']
-                            
                     except json.JSONDecodeError:
                         continue
                     except Exception as e:
                         print(f"Error parsing streaming response: {e}")
                         continue
+                    
+                    if json_data.get('response'):
+                        lease.setdefault('first_token_seconds', time.monotonic() - started)
+                        received = True
+                        yield json_data['response']
+                    if json_data.get('done'):
+                        if final is not None:
+                            final.update(json_data)
+                        break
             
-            return full_response.strip()
-            
-        except requests.exceptions.Timeout as e:
-            print(f"Mistral API timeout: {e}")
-            raise Exception("Mistral AI is taking too long to respond. Please try again.")
-        except requests.exceptions.RequestException as e:
-            print(f"Mistral API error: {e}")
-            # Raise exception to trigger fallback
-            raise Exception(f"Mistral AI connection failed: {str(e)}")
+        except (StreamCancelled, StreamDeadlineExceeded):
+            raise
+        except Exception as e:
+            if handle is not None and handle.get('cancelled'):
+                # The read failed because the stream was aborted on purpose
+                raise StreamCancelled("Mistral stream cancelled") from e
+            if limits is not None and ('timed out' in str(e).lower() or isinstance(e, requests.exceptions.Timeout)):
+                if deadline_bound:
+                    raise StreamDeadlineExceeded("Mistral AI did not finish within the deadline") from e
+                print(f"Mistral stream stalled: {e}")
+                if not received:
+                    raise StreamStalled(f"Mistral AI sent no first token within {limits['first_token']:g}s") from e
+                raise StreamStalled(f"Mistral AI stopped responding for {limits['idle']:g}s") from e
+            if isinstance(e, requests.exceptions.HTTPError) and e.response is not None and e.response.status_code == 404:
+                print(f"Mistral model {model} not found on {lease['base_url']}: {e}")
+                raise ModelNotFound(f"Ollama at {lease['base_url']} does not have the model {model} (run: ollama pull {model})") from e
+            if isinstance(e, requests.exceptions.Timeout):
+                print(f"Mistral API timeout: {e}")
+                raise Exception("Mistral AI is taking too long to respond. Please try again.")
+            if isinstance(e, requests.exceptions.RequestException):
+                print(f"Mistral API error: {e}")
+                # Raise exception to trigger fallback
+                raise Exception(f"Mistral AI connection failed: {str(e)}")
+            raise
+        finally:
+            # Release the upstream connection even if the consumer stops early
+            if response is not None:
+                response.close()
     
     def _generate_openai_response(self, messages, model=None, max_tokens=1000, temperature=0.3):
         """Generate response using OpenAI with streaming"""
         if not self.openai_client:
             raise ValueError("OpenAI client not configured")
         
+        try:
+            return "".join(self._stream_openai_response(messages, model, max_tokens, temperature))
+        except OpenAIResponseError as e:
+            print(f"OpenAI API error: {e}")
+            return OPENAI_ERROR_RESPONSE
+    
+    def _stream_openai_response(self, messages, model=None, max_tokens=1000, temperature=0.3, handle=None, limits=None, response_format=None):
+        """Yield response tokens from OpenAI (handle, if given, receives the live stream; limits as for Mistral)
+
+        Any response_format turns on JSON mode, which guarantees a JSON object but not the schema.
+        """
+        if not self.openai_client:
+            raise ValueError("OpenAI client not configured")
+        
         if not model:
-            model = "gpt-4"  # Default OpenAI model
+            model = self.get_default_model('openai')
         
+        self._check_deadline(limits, "OpenAI")
+        read_timeout, deadline_bound = self._read_timeout(limits, 'idle')
+        response = None
         try:
-            # Use streaming for OpenAI as well
             response = self.openai_client.chat.completions.create(
                 model=model,
                 messages=messages,
                 max_tokens=max_tokens,
                 temperature=temperature,
-                stream=True  # Enable streaming
+                stream=True,  # Enable streaming
+                **({'response_format': {'type': 'json_object'}} if response_format is not None else {}),
+                **({'timeout': read_timeout} if limits is not None else {})
             )
+            if handle is not None:
+                handle['response'] = response
             
-            # Collect streaming response
-            full_response = ""
             for chunk in response:
-                if chunk.choices[0].delta.content is not None:
-                    full_response += chunk.choices[0].delta.content
-            
-            return full_response
-            
+                self._check_deadline(limits, "OpenAI")
+                if chunk.choices and chunk.choices[0].delta.content is not None:
+                    yield chunk.choices[0].delta.content
+        except StreamDeadlineExceeded:
+            raise
         except Exception as e:
-            print(f"OpenAI API error: {e}")
-            return "I apologize, but I'm having trouble connecting to the AI service. Please try again later."
+            if handle is not None and handle.get('cancelled'):
+                raise StreamCancelled("OpenAI stream cancelled") from e
+            if deadline_bound and 'timed out' in str(e).lower():
+                raise StreamDeadlineExceeded("OpenAI did not finish within the deadline") from e
+            raise OpenAIResponseError(str(e)) from e
+        finally:
+            if response is not None:
+                response.response.close()
+    
+    def _remaining(self, limits):
+        """Seconds left before the deadline in limits (None without limits)"""
+        if limits is None:
+            return None
+        return max(limits['deadline'] - time.monotonic(), 0.001)
+    
+    def _read_timeout(self, limits, bound):
+        """Read timeout for the next wait, the `bound` timeout of limits capped by the deadline
+
+        Returns (timeout, deadline_bound), where deadline_bound says whether the deadline is
+        the tighter of the two, so a timeout means the deadline was spent rather than a stall.
+        """
+        if limits is None:
+            return None, False
+        remaining = self._remaining(limits)
+        if remaining <= limits[bound]:
+            return remaining, True
+        return limits[bound], False
+    
+    def _check_deadline(self, limits, provider_name):
+        """Raise StreamDeadlineExceeded once the deadline in limits has passed"""
+        if limits is not None and time.monotonic() >= limits['deadline']:
+            raise StreamDeadlineExceeded(f"{provider_name} did not finish within the deadline")
+    
+    def _get_cache_key(self, request, use_cache):
+        """Response cache key for a call, or None when the call should bypass the cache"""
+        # Conversation turns depend on session state, so they are never cached
+        if not use_cache or request['session_key'] or not response_cache.accepts(request['temperature']):
+            return None
+        model = request['model'] or self.get_task_model(request['task'])
+        return make_cache_key(self.provider, model, request['messages'], request['temperature'], request['max_tokens'], request['response_format'])
+    
+    def _get_store_key(self, request, cache_key):
+        """Cache key to store a finished response under: that of the provider and model which produced it
+
+        None when the call bypasses the cache or it is not known which provider answered,
+        e.g. for requests that shared another caller's generation (which stores it itself).
+        """
+        provider = request['served_by'].get('provider')
+        if not cache_key or provider is None:
+            return None
+        if provider == self.provider:
+            return cache_key
+        # A fallback or hedge answer must not be served later as the configured provider's
+        model = None if request['served_by'].get('hedged') else request['model']
+        model = model or self.get_task_model(request['task'], provider)
+        return make_cache_key(provider, model, request['messages'], request['temperature'], request['max_tokens'], request['response_format'])
     
     def _convert_messages_to_prompt(self, messages):
         """Convert OpenAI-style messages to a single prompt for Mistral"""
@@ -154,11 +633,68 @@ class AIService:
         """Get the current AI provider"""
         return self.provider
     
+    def get_circuit_states(self):
+        """Get the circuit breaker state of every provider"""
+        return {provider: breaker.get_state() for provider, breaker in self.circuit_breakers.items()}
+    
+    def get_backend_stats(self):
+        """Get load, health and ejection state of every Ollama backend"""
+        return self.backends.get_stats()
+    
+    def get_hedge_stats(self):
+        """Get how often slow requests were hedged and how often the hedge won"""
+        stats = self.hedge_stats.get_stats()
+        stats.update(enabled=bool(self.hedge_tasks), tasks=self.hedge_tasks, hedge_after_seconds=self.hedge_after)
+        return stats
+    
+    def get_single_flight_stats(self):
+        """Get how many requests were merged onto an identical request already in flight"""
+        if self.single_flight is None:
+            return {'enabled': False}
+        return dict(self.single_flight.get_stats(), enabled=True)
+    
+    def get_scheduler_stats(self):
+        """Get queue depth and wait-time metrics of every provider scheduler"""
+        return {provider: scheduler.get_stats() for provider, scheduler in self.schedulers.items()}
+    
+    def get_default_model(self, provider=None):
+        """Get the default model for a provider (the current one if not given)"""
+        return self.DEFAULT_MODELS.get(provider or self.provider)
+    
+    def get_task_profile(self, task):
+        """Get the model tier of a task: its model per provider and its max_tokens and num_ctx defaults"""
+        return self.task_models.get(task) or {}
+    
+    def get_task_model(self, task, provider=None):
+        """Get the model serving a task on a provider (the current one if not given)"""
+        provider = provider or self.provider
+        return self.get_task_profile(task).get(provider) or self.get_default_model(provider)
+    
+    def get_num_ctx(self, model):
+        """Get the context window to request for an Ollama model
+    
+        Ollama reloads a model whenever num_ctx changes, so a model shared by several
+        task tiers always gets the largest of their sizes.
+        """
+        sizes = [profile['num_ctx'] for profile in self.task_models.values() if profile.get('mistral') == model and profile.get('num_ctx')]
+        return max(sizes) if sizes else self.mistral_num_ctx
+    
+    def get_ollama_models(self):
+        """Get the distinct Ollama models of all task tiers"""
+        models = [profile['mistral'] for profile in self.task_models.values() if profile.get('mistral')]
+        return list(dict.fromkeys(models)) or [self.get_default_model('mistral')]
+    
+    def get_health(self, provider=None, refresh=False):
+        """Get the cached background health check of a provider, optionally re-probing it first"""
+        if refresh:
+            self.health_monitor.probe(provider or self.provider)
+        return self.health_monitor.get_status(provider)
+    
     def test_connection(self):
-        """Test the connection to the current AI provider"""
+        """Test the connection to the current AI provider with a live generation"""
         if self.provider == 'mistral':
             try:
-                response = requests.get(f"{self.mistral_base_url}/api/tags", timeout=10)
+                response = http_pool.get(self.mistral_base_url, "/api/tags", read_timeout=10)
                 if response.status_code == 200:
                     # Try to warm up the model with a simple streaming request
                     try:
@@ -171,11 +707,12 @@ class AIService:
                                 "num_predict": 10
                             }
                         }
-                        warmup_response = requests.post(
-                            f"{self.mistral_base_url}/api/generate",
+                        warmup_response = http_pool.post(
+                            self.mistral_base_url,
+                            "/api/generate",
                             json=warmup_payload,
                             stream=True,
-                            timeout=30
+                            read_timeout=30
                         )
                         if warmup_response.status_code == 200:
                             # Collect streaming response
@@ -189,6 +726,7 @@ class AIService:
                                             break
                                     except:
                                         continue
+                            warmup_response.close()
                             return {"status": "connected", "provider": "mistral", "models": response.json(), "warmed_up": True}
                         else:
                             return {"status": "connected", "provider": "mistral", "models": response.json(), "warmed_up": False}
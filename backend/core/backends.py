@@ -0,0 +1,197 @@
+import hashlib
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from .http_pool import http_pool
+from .streams import StreamCancelled, StreamDeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+
+class ModelNotFound(Exception):
+    """A backend does not have the requested model; a configuration problem, not a backend failure"""
+
+
+class OllamaBackendPool:
+    """Spread generations over several Ollama hosts
+
+    Each request goes to the available backend with the fewest requests in flight.
+    Requests with an affinity key (e.g. a document) prefer the same backend every time,
+    chosen by rendezvous hashing, so its KV cache and stored contexts stay warm, unless
+    that backend is more than affinity_slack requests busier than the least loaded one.
+    A backend is ejected for eject_seconds after failure_threshold consecutive failures,
+    when its time to first token grows to slow_factor times that of the fastest other
+    backend, or when its health check fails.
+    """
+
+    def __init__(self, base_urls=None, failure_threshold=None, eject_seconds=None, slow_factor=None, slow_min_seconds=None, affinity_slack=None):
+        base_urls = base_urls or getattr(settings, 'MISTRAL_BASE_URLS', None) or [getattr(settings, 'MISTRAL_BASE_URL', 'http://localhost:11434')]
+        self.failure_threshold = failure_threshold or getattr(settings, 'OLLAMA_BACKEND_FAILURE_THRESHOLD', 3)
+        self.eject_seconds = eject_seconds or getattr(settings, 'OLLAMA_BACKEND_EJECT_SECONDS', 30)
+        self.slow_factor = slow_factor or getattr(settings, 'OLLAMA_BACKEND_SLOW_FACTOR', 3.0)
+        self.slow_min_seconds = slow_min_seconds or getattr(settings, 'OLLAMA_BACKEND_SLOW_MIN_SECONDS', 2.0)
+        self.affinity_slack = affinity_slack if affinity_slack is not None else getattr(settings, 'OLLAMA_AFFINITY_SLACK', 2)
+        self.base_urls = [url.rstrip('/') for url in base_urls]
+        self._backends = {
+            url: {
+                'healthy': True,
+                'ejected_until': 0.0,
+                'outstanding': 0,
+                'consecutive_failures': 0,
+                'first_token_ewma': None,
+                'requests': 0,
+                'failures': 0,
+                'ejections': 0,
+                'affinity_routed': 0,
+                'last_error': None,
+            }
+            for url in self.base_urls
+        }
+        self._lock = threading.Lock()
+
+    @property
+    def primary_url(self):
+        return self.base_urls[0]
+
+    def __len__(self):
+        return len(self.base_urls)
+
+    @contextmanager
+    def backend(self, affinity_key=None, exclude=()):
+        """Lease a backend for one request; yields a dict with its 'base_url'
+
+        Callers may set lease['first_token_seconds'] so slow backends can be detected.
+        A request abandoned by its consumer, cancelled, out of time or for a model the
+        backend does not have counts as neither success nor failure.
+        """
+        lease = {'base_url': self.acquire(affinity_key, exclude)}
+        outcome = None
+        try:
+            yield lease
+            outcome = True
+        except (StreamCancelled, StreamDeadlineExceeded, ModelNotFound):
+            raise
+        except Exception as e:
+            outcome = False
+            lease['error'] = str(e)
+            raise
+        finally:
+            self.release(lease, outcome)
+
+    def acquire(self, affinity_key=None, exclude=()):
+        """Pick a backend, other than those in exclude where possible, and count the request against it"""
+        with self._lock:
+            now = time.monotonic()
+            untried = [url for url in self.base_urls if url not in exclude] or list(self.base_urls)
+            candidates = [url for url in untried if self._is_available(url, now)]
+            if not candidates:
+                # Every backend is down or ejected; trying one beats failing outright
+                candidates = untried
+
+            least = min(self._backends[url]['outstanding'] for url in candidates)
+            chosen = None
+            if affinity_key:
+                preferred = max(candidates, key=lambda url: hashlib.sha256(f"{affinity_key}|{url}".encode()).digest())
+                if self._backends[preferred]['outstanding'] <= least + self.affinity_slack:
+                    chosen = preferred
+                    self._backends[chosen]['affinity_routed'] += 1
+            if chosen is None:
+                chosen = random.choice([url for url in candidates if self._backends[url]['outstanding'] == least])
+
+            self._backends[chosen]['outstanding'] += 1
+            self._backends[chosen]['requests'] += 1
+            return chosen
+
+    def release(self, lease, outcome):
+        """Finish a leased request; outcome is True, False, or None if it was abandoned"""
+        url = lease['base_url']
+        with self._lock:
+            backend = self._backends[url]
+            backend['outstanding'] -= 1
+            if outcome is False:
+                backend['failures'] += 1
+                backend['consecutive_failures'] += 1
+                backend['last_error'] = lease.get('error')
+                if backend['consecutive_failures'] >= self.failure_threshold:
+                    self._eject(url, f"{backend['consecutive_failures']} consecutive failures")
+            elif outcome is True:
+                backend['consecutive_failures'] = 0
+
+            first_token = lease.get('first_token_seconds')
+            if first_token is not None:
+                previous = backend['first_token_ewma']
+                backend['first_token_ewma'] = first_token if previous is None else 0.8 * previous + 0.2 * first_token
+                self._check_slow(url)
+
+    def check(self):
+        """Health-check every backend, re-admitting recovered ones; returns per-backend results"""
+        results = {}
+        for url in self.base_urls:
+            try:
+                response = http_pool.get(url, "/api/tags", read_timeout=10)
+                healthy = response.status_code == 200
+                results[url] = {'status': 'connected', 'models': response.json()} if healthy else {'status': 'error', 'message': f"Connection failed ({response.status_code})"}
+            except Exception as e:
+                healthy = False
+                results[url] = {'status': 'error', 'message': str(e)}
+
+            with self._lock:
+                backend = self._backends[url]
+                if healthy and not backend['healthy']:
+                    logger.info(f"Ollama backend {url} is healthy again")
+                    backend['consecutive_failures'] = 0
+                    backend['first_token_ewma'] = None
+                backend['healthy'] = healthy
+                if not healthy:
+                    backend['last_error'] = results[url]['message']
+        return results
+
+    def get_stats(self):
+        with self._lock:
+            now = time.monotonic()
+            stats = {}
+            for url, backend in self._backends.items():
+                ewma = backend['first_token_ewma']
+                stats[url] = {
+                    'available': self._is_available(url, now),
+                    'healthy': backend['healthy'],
+                    'ejected_for_seconds': round(max(backend['ejected_until'] - now, 0), 1),
+                    'outstanding': backend['outstanding'],
+                    'requests': backend['requests'],
+                    'failures': backend['failures'],
+                    'ejections': backend['ejections'],
+                    'affinity_routed': backend['affinity_routed'],
+                    'first_token_ms': round(ewma * 1000, 1) if ewma is not None else None,
+                    'last_error': backend['last_error'],
+                }
+            return stats
+
+    def _is_available(self, url, now):
+        backend = self._backends[url]
+        return backend['healthy'] and backend['ejected_until'] <= now
+
+    def _check_slow(self, url):
+        """Eject a backend whose first-token latency is far behind the fastest other one"""
+        ewma = self._backends[url]['first_token_ewma']
+        now = time.monotonic()
+        others = [
+            backend['first_token_ewma'] for other, backend in self._backends.items()
+            if other != url and backend['first_token_ewma'] is not None and self._is_available(other, now)
+        ]
+        if others and ewma > self.slow_min_seconds and ewma > self.slow_factor * min(others):
+            self._eject(url, f"first token after {ewma:.1f}s vs {min(others):.1f}s elsewhere")
+            # Start measuring afresh when it comes back
+            self._backends[url]['first_token_ewma'] = None
+
+    def _eject(self, url, reason):
+        backend = self._backends[url]
+        if len(self.base_urls) == 1:
+            # With a single backend there is nowhere else to send traffic
+            return
+        backend['ejected_until'] = time.monotonic() + self.eject_seconds
+        backend['ejections'] += 1
+        backend['consecutive_failures'] = 0
+        logger.warning(f"Ejected Ollama backend {url} for {self.eject_seconds}s: {reason}")
@@ -0,0 +1,73 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+
+
+class ChatSessionStore:
+    """Ollama conversation contexts per (session, model), so follow-up turns skip prefill
+
+    Each entry holds the `context` token list Ollama returned for the previous turn and
+    the backend that produced it. Entries expire after a TTL, are evicted least recently
+    used beyond max_sessions, and are dropped once they outgrow the model context
+    (max_context_tokens, unless the caller passes the window of the session's model).
+    """
+
+    def __init__(self, max_sessions=None, ttl=None, max_context_tokens=None):
+        self.max_sessions = max_sessions or getattr(settings, 'CHAT_SESSION_MAX_SESSIONS', 64)
+        self.ttl = ttl or getattr(settings, 'CHAT_SESSION_TTL', 1800)
+        self.max_context_tokens = max_context_tokens or getattr(settings, 'MISTRAL_NUM_CTX', 4096)
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'fallbacks': 0}
+
+    def get(self, session_key, model, base_url, reserve_tokens=0, max_context_tokens=None):
+        """Return the stored context for a session, or None if it is missing or no longer usable"""
+        key = (session_key, model)
+        max_context_tokens = max_context_tokens or self.max_context_tokens
+        with self._lock:
+            session = self._sessions.get(key)
+            usable = (
+                session is not None
+                and time.monotonic() - session['updated_at'] < self.ttl
+                and session['base_url'] == base_url
+                and len(session['context']) + reserve_tokens < max_context_tokens
+            )
+            if not usable:
+                if session is not None:
+                    del self._sessions[key]
+                    self.stats['evictions'] += 1
+                self.stats['misses'] += 1
+                return None
+
+            self._sessions.move_to_end(key)
+            self.stats['hits'] += 1
+            return session['context']
+
+    def set(self, session_key, model, base_url, context):
+        """Store the context returned by the latest turn"""
+        key = (session_key, model)
+        with self._lock:
+            self._sessions[key] = {'context': context, 'base_url': base_url, 'updated_at': time.monotonic()}
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def invalidate(self, session_key, model, fallback=False):
+        """Forget a session, e.g. after its context was rejected"""
+        with self._lock:
+            self._sessions.pop((session_key, model), None)
+            if fallback:
+                self.stats['fallbacks'] += 1
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['sessions'] = len(self._sessions)
+            stats['context_tokens'] = sum(len(session['context']) for session in self._sessions.values())
+        return stats
+
+
+# Global chat session store
+chat_sessions = ChatSessionStore()
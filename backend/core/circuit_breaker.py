@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import deque
+from django.conf import settings
+
+
+class CircuitOpenError(Exception):
+    """Raised when a provider is skipped because its circuit is open"""
+
+
+class CircuitBreaker:
+    """Failure-rate circuit breaker for one AI provider
+
+    Closed: calls flow and outcomes are recorded in a sliding window.
+    Open: calls are rejected until open_seconds have passed.
+    Half-open: a limited number of probe calls decide whether to close or reopen.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_rate=None, window_size=None, minimum_calls=None, open_seconds=None, half_open_probes=None):
+        self.name = name
+        self.failure_rate = failure_rate or getattr(settings, 'AI_CIRCUIT_FAILURE_RATE', 0.5)
+        self.window_size = window_size or getattr(settings, 'AI_CIRCUIT_WINDOW_SIZE', 20)
+        self.minimum_calls = minimum_calls or getattr(settings, 'AI_CIRCUIT_MINIMUM_CALLS', 3)
+        self.open_seconds = open_seconds or getattr(settings, 'AI_CIRCUIT_OPEN_SECONDS', 30)
+        self.half_open_probes = half_open_probes or getattr(settings, 'AI_CIRCUIT_HALF_OPEN_PROBES', 1)
+        self.state = self.CLOSED
+        self._outcomes = deque(maxlen=self.window_size)
+        self._opened_at = None
+        self._probes_in_flight = 0
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """Return True if a call may go to the provider now"""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    self._rejected += 1
+                    return False
+                self.state = self.HALF_OPEN
+                self._probes_in_flight = 0
+
+            if self.state == self.HALF_OPEN:
+                if self._probes_in_flight >= self.half_open_probes:
+                    self._rejected += 1
+                    return False
+                self._probes_in_flight += 1
+
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._close()
+            else:
+                self._outcomes.append(True)
+
+    def record_failure(self):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._open()
+                return
+            self._outcomes.append(False)
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self.minimum_calls and failures / len(self._outcomes) >= self.failure_rate:
+                self._open()
+
+    def release(self):
+        """Give back a half-open probe slot when the call ended without an outcome"""
+        with self._lock:
+            if self.state == self.HALF_OPEN and self._probes_in_flight:
+                self._probes_in_flight -= 1
+
+    def get_state(self):
+        with self._lock:
+            failures = self._outcomes.count(False)
+            state = {
+                'state': self.state,
+                'failure_rate': round(failures / len(self._outcomes), 3) if self._outcomes else 0.0,
+                'window_calls': len(self._outcomes),
+                'rejected_calls': self._rejected,
+            }
+            if self.state == self.OPEN:
+                state['retry_in_seconds'] = round(max(self.open_seconds - (time.monotonic() - self._opened_at), 0), 1)
+            return state
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._probes_in_flight = 0
+
+    def _close(self):
+        self.state = self.CLOSED
+        self._outcomes.clear()
+        self._probes_in_flight = 0
@@ -0,0 +1,95 @@
+import logging
+import threading
+import time
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class HealthMonitor:
+    """Probe the AI providers on an interval in the background and cache the results
+
+    Probes only list models: they never load a model into memory or spend tokens.
+    """
+
+    def __init__(self, service, interval=None):
+        self.service = service
+        self.interval = interval or getattr(settings, 'AI_HEALTH_CHECK_INTERVAL', 30)
+        self._results = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Start the background probe thread once per process"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='ai-health-monitor', daemon=True)
+            self._thread.start()
+
+    def probe(self, provider):
+        """Run a cheap connectivity check against one provider and cache the result"""
+        started = time.monotonic()
+        if provider == 'mistral':
+            result = self._probe_mistral()
+        elif provider == 'openai':
+            result = self._probe_openai()
+        else:
+            result = {'status': 'error', 'provider': provider, 'message': 'Unknown provider'}
+
+        result['latency_ms'] = round((time.monotonic() - started) * 1000, 1)
+        result['checked_at'] = timezone.now()
+        with self._lock:
+            self._results[provider] = result
+        return result
+
+    def probe_all(self):
+        """Probe every provider that could serve requests"""
+        providers = ['mistral']
+        if self.service.openai_client:
+            providers.append('openai')
+        for provider in providers:
+            try:
+                self.probe(provider)
+            except Exception as e:
+                logger.warning(f"Health probe for {provider} failed: {e}")
+
+    def get_status(self, provider=None):
+        """Return the cached health of a provider (the current one if not given) with its age"""
+        self.start()
+        provider = provider or self.service.get_current_provider()
+        with self._lock:
+            result = self._results.get(provider)
+        if result is None:
+            # Nothing cached yet (e.g. just after startup), so probe now; this stays cheap
+            result = self.probe(provider)
+
+        status = dict(result)
+        status['age_seconds'] = round((timezone.now() - result['checked_at']).total_seconds(), 1)
+        status['checked_at'] = result['checked_at'].isoformat()
+        return status
+
+    def _run(self):
+        while True:
+            self.probe_all()
+            time.sleep(self.interval)
+
+    def _probe_mistral(self):
+        # Checking every backend also re-admits recovered ones to the pool
+        backends = self.service.backends.check()
+        connected = [result for result in backends.values() if result['status'] == 'connected']
+        if connected:
+            return {"status": "connected", "provider": "mistral", "models": connected[0]['models'], "backends": backends}
+        messages = "; ".join(f"{url}: {result['message']}" for url, result in backends.items())
+        return {"status": "error", "provider": "mistral", "message": messages, "backends": backends}
+
+    def _probe_openai(self):
+        if not self.service.openai_client:
+            return {"status": "error", "provider": "openai", "message": "OpenAI client not configured"}
+        try:
+            # Listing models checks the key and connectivity without generating tokens
+            self.service.openai_client.models.list()
+            return {"status": "connected", "provider": "openai"}
+        except Exception as e:
+            return {"status": "error", "provider": "openai", "message": str(e)}
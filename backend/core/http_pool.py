@@ -0,0 +1,132 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from django.conf import settings
+
+# The stream handle (see core.streams.abort_stream) of the request being sent on this thread
+_sending = threading.local()
+
+
+class _PublishingMixin:
+    """Publish the connection a request goes out on in its stream handle
+
+    Ollama sends no response headers until the first token, so without this a
+    request could not be aborted while it waits for them.
+    """
+
+    def _make_request(self, conn, *args, **kwargs):
+        handle = getattr(_sending, 'handle', None)
+        if handle is not None:
+            handle['connection'] = conn
+            if handle.get('cancelled'):
+                raise ConnectionAbortedError("Request aborted before it was sent")
+        return super()._make_request(conn, *args, **kwargs)
+
+
+class PublishingHTTPConnectionPool(_PublishingMixin, HTTPConnectionPool):
+    pass
+
+
+class PublishingHTTPSConnectionPool(_PublishingMixin, HTTPSConnectionPool):
+    pass
+
+
+class HTTPPool:
+    """Keep-alive HTTP sessions with a bounded connection pool per backend URL"""
+
+    def __init__(self, pool_size=None, connect_timeout=None, read_timeout=None):
+        self.pool_size = pool_size or getattr(settings, 'OLLAMA_POOL_SIZE', 10)
+        self.connect_timeout = connect_timeout or getattr(settings, 'OLLAMA_CONNECT_TIMEOUT', 5)
+        self.read_timeout = read_timeout or getattr(settings, 'OLLAMA_READ_TIMEOUT', 300)
+        self._sessions = {}
+        self._requests = {}
+        self._lock = threading.Lock()
+
+    def get_session(self, base_url):
+        """Return the shared session for a backend URL, creating it on first use"""
+        base_url = base_url.rstrip('/')
+        with self._lock:
+            session = self._sessions.get(base_url)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                adapter.poolmanager.pool_classes_by_scheme = {
+                    'http': PublishingHTTPConnectionPool,
+                    'https': PublishingHTTPSConnectionPool,
+                }
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers['Connection'] = 'keep-alive'
+                self._sessions[base_url] = session
+                self._requests[base_url] = 0
+            return session
+
+    def timeout(self, read_timeout=None):
+        """Build a (connect, read) timeout tuple"""
+        return (self.connect_timeout, read_timeout or self.read_timeout)
+
+    def request(self, method, base_url, path, read_timeout=None, handle=None, **kwargs):
+        """Send a request to a backend over its pooled session
+
+        With a stream handle, the connection is published in it while the request is
+        sent, so abort_stream can cut the request off before any response arrives.
+        """
+        session = self.get_session(base_url)
+        with self._lock:
+            self._requests[base_url.rstrip('/')] += 1
+        kwargs.setdefault('timeout', self.timeout(read_timeout))
+        _sending.handle = handle
+        try:
+            return session.request(method, f"{base_url.rstrip('/')}{path}", **kwargs)
+        finally:
+            _sending.handle = None
+
+    def set_read_timeout(self, response, seconds):
+        """Change how long reads of an open streaming response may block"""
+        connection = getattr(response.raw, '_connection', None)
+        sock = getattr(connection, 'sock', None)
+        if sock is not None:
+            sock.settimeout(seconds)
+
+    def get(self, base_url, path, **kwargs):
+        return self.request('GET', base_url, path, **kwargs)
+
+    def post(self, base_url, path, **kwargs):
+        return self.request('POST', base_url, path, **kwargs)
+
+    def get_stats(self):
+        """Report request counts and connection reuse for every backend URL"""
+        stats = {}
+        with self._lock:
+            sessions = list(self._sessions.items())
+            request_counts = dict(self._requests)
+
+        for base_url, session in sessions:
+            adapter = session.get_adapter(base_url)
+            connections_opened = 0
+            idle_connections = 0
+            for key in adapter.poolmanager.pools.keys():
+                pool = adapter.poolmanager.pools.get(key)
+                if pool is None:
+                    continue
+                connections_opened += pool.num_connections
+                if pool.pool is not None:
+                    # Empty slots in the pool queue are None placeholders
+                    idle_connections += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+
+            total_requests = request_counts.get(base_url, 0)
+            reused = max(total_requests - connections_opened, 0)
+            stats[base_url] = {
+                'requests': total_requests,
+                'connections_opened': connections_opened,
+                'idle_connections': idle_connections,
+                'reuse_rate': round(reused / total_requests, 3) if total_requests else 0.0,
+                'pool_size': self.pool_size,
+            }
+
+        return stats
+
+
+# Global HTTP pool shared by all backend calls
+http_pool = HTTPPool()
@@ -0,0 +1,119 @@
+import logging
+import threading
+import time
+from django.conf import settings
+from django.utils import timezone
+from .http_pool import http_pool
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_model_name(name):
+    """Ollama reports untagged models as name:latest"""
+    return name if ':' in name else f"{name}:latest"
+
+
+class ModelResidencyManager:
+    """Keep the configured Ollama models loaded on every backend and report their load state
+
+    Models are warmed when the app starts, every generation asks Ollama to keep the
+    model loaded for keep_alive, and a background check re-warms any model that Ollama
+    unloaded after an idle period or a restart.
+    """
+
+    def __init__(self, service, models=None, keep_alive=None, check_interval=None):
+        self.service = service
+        self.models = models or getattr(settings, 'OLLAMA_RESIDENT_MODELS', None) or service.get_ollama_models()
+        self.keep_alive = keep_alive or getattr(settings, 'OLLAMA_KEEP_ALIVE', '30m')
+        self.check_interval = check_interval or getattr(settings, 'OLLAMA_RESIDENCY_CHECK_INTERVAL', 60)
+        self._state = {
+            (base_url, model): {'state': 'unknown', 'last_warm_at': None, 'last_warm_seconds': None, 'expires_at': None, 'message': None}
+            for base_url in service.backends.base_urls for model in self.models
+        }
+        self._last_used = {model: None for model in self.models}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Warm the models and start the residency check thread once per process"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='ollama-residency', daemon=True)
+            self._thread.start()
+
+    def warm(self, model, base_url=None):
+        """Load a model into Ollama memory without generating any tokens (on every backend if none is given)"""
+        if base_url is None:
+            return all([self.warm(model, url) for url in self.service.backends.base_urls])
+        
+        self._update(base_url, model, state='loading')
+        # Load with the context size requests will use, or the first request reloads the model
+        payload = {"model": model, "prompt": "", "stream": False, "keep_alive": self.keep_alive}
+        num_ctx = self.service.get_num_ctx(model)
+        if num_ctx:
+            payload["options"] = {"num_ctx": num_ctx}
+        started = time.monotonic()
+        try:
+            response = http_pool.post(
+                base_url,
+                "/api/generate",
+                json=payload,
+                read_timeout=getattr(settings, 'OLLAMA_READ_TIMEOUT', 300)
+            )
+            response.raise_for_status()
+            self._update(base_url, model, state='loaded', last_warm_at=timezone.now(), last_warm_seconds=round(time.monotonic() - started, 2), message=None)
+            logger.info(f"Warmed Ollama model {model} on {base_url} in {time.monotonic() - started:.1f}s")
+            return True
+        except Exception as e:
+            self._update(base_url, model, state='error', message=str(e))
+            logger.warning(f"Could not warm Ollama model {model} on {base_url}: {e}")
+            return False
+
+    def warm_all(self):
+        """Warm every configured model, returning True if all of them loaded"""
+        return all([self.warm(model) for model in self.models])
+
+    def check(self):
+        """Refresh load state from every backend and re-warm models that are no longer resident"""
+        for base_url in self.service.backends.base_urls:
+            try:
+                response = http_pool.get(base_url, "/api/ps", read_timeout=10)
+                response.raise_for_status()
+                loaded = {normalize_model_name(entry.get('name', '')): entry for entry in response.json().get('models', [])}
+            except Exception as e:
+                for model in self.models:
+                    self._update(base_url, model, state='error', message=str(e))
+                continue
+
+            for model in self.models:
+                entry = loaded.get(normalize_model_name(model))
+                if entry:
+                    self._update(base_url, model, state='loaded', expires_at=entry.get('expires_at'), message=None)
+                else:
+                    self._update(base_url, model, state='unloaded', expires_at=None)
+                    self.warm(model, base_url)
+
+    def note_used(self, model):
+        """Record that a generation used this model"""
+        with self._lock:
+            if model in self._last_used:
+                self._last_used[model] = timezone.now()
+
+    def get_status(self):
+        with self._lock:
+            backends = {}
+            for (base_url, model), state in self._state.items():
+                backends.setdefault(base_url, {})[model] = {key: value.isoformat() if hasattr(value, 'isoformat') else value for key, value in state.items()}
+            last_used = {model: value.isoformat() if value else None for model, value in self._last_used.items()}
+            return {'keep_alive': self.keep_alive, 'last_used_at': last_used, 'backends': backends}
+
+    def _update(self, base_url, model, **fields):
+        with self._lock:
+            self._state.setdefault((base_url, model), {}).update(fields)
+
+    def _run(self):
+        self.warm_all()
+        while True:
+            time.sleep(self.check_interval)
+            self.check()
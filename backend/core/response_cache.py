@@ -0,0 +1,198 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(provider, model, messages, temperature, max_tokens, response_format=None):
+    """Hash everything that determines a model response into a cache key"""
+    params = {
+        'provider': provider,
+        'model': model,
+        'messages': messages,
+        'temperature': temperature,
+        'max_tokens': max_tokens,
+    }
+    if response_format is not None:
+        params['response_format'] = response_format
+    raw = json.dumps(params, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class MemoryResponseCache:
+    """In-process LRU of responses, evicted by total size in bytes"""
+
+    name = 'memory'
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous.encode('utf-8'))
+            self._entries[key] = value
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.encode('utf-8'))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def get_stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._size, 'max_bytes': self.max_bytes}
+
+
+class SQLiteResponseCache:
+    """On-disk response cache in a SQLite file, evicting least recently used rows by size"""
+
+    name = 'sqlite'
+
+    def __init__(self, path, max_bytes):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses '
+            '(key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)')
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute('UPDATE responses SET last_used = ? WHERE key = ?', (time.time(), key))
+            self._conn.commit()
+            return row[0]
+
+    def set(self, key, value):
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses (key, value, size, last_used) VALUES (?, ?, ?, ?)',
+                (key, value, size, time.time())
+            )
+            total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+            if total > self.max_bytes:
+                # Drop the least recently used rows until the cache fits again
+                rows = self._conn.execute('SELECT key, size FROM responses ORDER BY last_used').fetchall()
+                stale = []
+                for stale_key, stale_size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    stale.append((stale_key,))
+                    total -= stale_size
+                self._conn.executemany('DELETE FROM responses WHERE key = ?', stale)
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM responses')
+            self._conn.commit()
+
+    def get_stats(self):
+        with self._lock:
+            entries, size = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+        return {'entries': entries, 'bytes': size, 'max_bytes': self.max_bytes, 'path': self.path}
+
+
+class ResponseCache:
+    """Front end for the configured response cache backend, tracking hits and misses"""
+
+    def __init__(self, backend=None, max_temperature=None):
+        self.backend = backend
+        self.max_temperature = max_temperature if max_temperature is not None else getattr(settings, 'AI_RESPONSE_CACHE_MAX_TEMPERATURE', 0.3)
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'errors': 0}
+        self._lock = threading.Lock()
+
+    def accepts(self, temperature):
+        """Only near-deterministic generations are worth caching"""
+        return self.backend is not None and temperature <= self.max_temperature
+
+    def get(self, key):
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"Response cache read failed: {e}")
+            self._count('errors')
+            return None
+        self._count('hits' if value is not None else 'misses')
+        return value
+
+    def set(self, key, value):
+        try:
+            self.backend.set(key, value)
+            self._count('stores')
+        except Exception as e:
+            logger.warning(f"Response cache write failed: {e}")
+            self._count('errors')
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        stats['backend'] = self.backend.name if self.backend else 'none'
+        stats['max_temperature'] = self.max_temperature
+        if self.backend is not None:
+            stats.update(self.backend.get_stats())
+        return stats
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+
+def create_response_cache():
+    """Build the response cache selected by AI_RESPONSE_CACHE_BACKEND"""
+    backend_name = getattr(settings, 'AI_RESPONSE_CACHE_BACKEND', 'memory')
+    max_bytes = getattr(settings, 'AI_RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+
+    backend = None
+    if backend_name == 'memory':
+        backend = MemoryResponseCache(max_bytes)
+    elif backend_name == 'sqlite':
+        path = getattr(settings, 'AI_RESPONSE_CACHE_PATH', settings.BASE_DIR / 'ai_response_cache.sqlite3')
+        backend = SQLiteResponseCache(path, max_bytes)
+    elif backend_name != 'none':
+        raise ValueError(f"Unsupported response cache backend: {backend_name}")
+
+    return ResponseCache(backend)
+
+
+# Global response cache
+response_cache = create_response_cache()
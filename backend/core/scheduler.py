@@ -0,0 +1,242 @@
+import hashlib
+import itertools
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from django.conf import settings
+from .streams import StreamCancelled
+
+# Lower numbers are served first
+PRIORITY_CLASSES = {
+    'interactive': 0,
+    'drafting': 1,
+    'bulk': 2,
+}
+
+# Priority class for each kind of AI task
+TASK_PRIORITIES = {
+    'chat': 'interactive',
+    'drafting': 'drafting',
+    'classification': 'bulk',
+}
+
+# Client key for calls made outside a request (management commands, warmup)
+DEFAULT_CLIENT = 'internal'
+
+
+def get_client_key(request):
+    """Identify the caller of a view for fair queuing: API key, then user, then session, then address"""
+    api_key = request.META.get('HTTP_X_API_KEY')
+    if api_key:
+        return f"api:{hashlib.sha256(api_key.encode()).hexdigest()[:12]}"
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    session = getattr(request, 'session', None)
+    if session is not None and session.session_key:
+        return f"session:{hashlib.sha256(session.session_key.encode()).hexdigest()[:12]}"
+    return f"ip:{request.META.get('REMOTE_ADDR', 'unknown')}"
+
+
+def parse_client_weights(value):
+    """Parse 'client=weight,client=weight' into a dict of weights"""
+    weights = {}
+    for item in (value or '').split(','):
+        client, _, weight = item.strip().rpartition('=')
+        if client and weight:
+            weights[client] = float(weight)
+    return weights
+
+
+class PriorityScheduler:
+    """Admit requests to one provider by priority class, fairly across clients, up to a concurrency limit
+
+    Priority classes are strict. Within a class, clients are served by weighted fair
+    queuing: each request gets a virtual finish tag of max(virtual time, the client's
+    previous tag) + 1 / weight, and the lowest tag goes next. A client that sends many
+    requests at once therefore interleaves with others instead of blocking them, and a
+    client at its concurrency cap is passed over until one of its requests completes.
+    """
+
+    def __init__(self, name, max_concurrency, client_max_concurrency=0, client_weights=None, max_tracked_clients=256):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.client_max_concurrency = client_max_concurrency
+        self.client_weights = client_weights or {}
+        self.max_tracked_clients = max_tracked_clients
+        self._running = 0
+        self._waiting = []
+        self._clients = OrderedDict()
+        self._virtual_time = 0.0
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._metrics = {
+            priority: {'admitted': 0, 'total_wait': 0.0, 'max_wait': 0.0, 'recent_waits': deque(maxlen=200)}
+            for priority in PRIORITY_CLASSES
+        }
+
+    @contextmanager
+    def slot(self, task, client=None, cancel=None, acquired=False):
+        """Hold one of the provider's slots for the duration of the block
+
+        With acquired set, the slot was already taken with try_acquire and is only released.
+        """
+        client = client or DEFAULT_CLIENT
+        if not acquired:
+            self.acquire(task, client, cancel)
+        try:
+            yield
+        finally:
+            self.release(client)
+
+    def acquire(self, task, client=None, cancel=None):
+        """Block until a slot is free and this request is the next one due
+
+        Raises StreamCancelled, leaving the queue, if cancel is cancelled while waiting.
+        """
+        client = client or DEFAULT_CLIENT
+        priority = TASK_PRIORITIES.get(task, 'drafting')
+        started = time.monotonic()
+        if cancel is not None:
+            cancel.check()
+        unregister = cancel.on_cancel(self._wake_all) if cancel is not None else None
+        try:
+            self._admit(priority, client, started, cancel)
+        finally:
+            if unregister is not None:
+                unregister()
+
+    def _admit(self, priority, client, started, cancel):
+        with self._condition:
+            state = self._client_state(client)
+            start_tag = max(self._virtual_time, state['finish_tag'])
+            state['finish_tag'] = start_tag + 1.0 / self.client_weights.get(client, 1.0)
+            entry = (PRIORITY_CLASSES[priority], state['finish_tag'], next(self._sequence), client, start_tag)
+            self._waiting.append(entry)
+            state['queued'] += 1
+
+            while self._running >= self.max_concurrency or self._next_entry() != entry:
+                if cancel is not None and cancel.cancelled:
+                    self._waiting.remove(entry)
+                    state['queued'] -= 1
+                    self._condition.notify_all()
+                    raise StreamCancelled("Request cancelled while queued")
+                self._condition.wait()
+            self._waiting.remove(entry)
+            state['queued'] -= 1
+            self._admitted(priority, state, start_tag, time.monotonic() - started)
+            # The next waiter may also fit if more than one slot is free
+            self._condition.notify_all()
+
+    def try_acquire(self, task, client=None):
+        """Take a slot only if one is free right now and nobody is queued for it; returns whether it did
+
+        Checking for a free slot and taking it are one step, so a caller that must not
+        queue (a hedge) cannot find the slot gone by the time it starts.
+        """
+        client = client or DEFAULT_CLIENT
+        priority = TASK_PRIORITIES.get(task, 'drafting')
+        with self._condition:
+            state = self._client_state(client)
+            if self._running >= self.max_concurrency or self._waiting:
+                return False
+            if self.client_max_concurrency and state['running'] >= self.client_max_concurrency:
+                return False
+            start_tag = max(self._virtual_time, state['finish_tag'])
+            state['finish_tag'] = start_tag + 1.0 / self.client_weights.get(client, 1.0)
+            self._admitted(priority, state, start_tag, 0.0)
+            return True
+
+    def _admitted(self, priority, state, start_tag, waited):
+        """Count a request admitted after waiting `waited` seconds as running"""
+        self._running += 1
+        self._virtual_time = max(self._virtual_time, start_tag)
+        state['running'] += 1
+        state['admitted'] += 1
+        state['total_wait'] += waited
+        metrics = self._metrics[priority]
+        metrics['admitted'] += 1
+        metrics['total_wait'] += waited
+        metrics['max_wait'] = max(metrics['max_wait'], waited)
+        metrics['recent_waits'].append(waited)
+
+    def release(self, client=None):
+        with self._condition:
+            self._running -= 1
+            self._clients[client or DEFAULT_CLIENT]['running'] -= 1
+            self._condition.notify_all()
+
+    def _wake_all(self):
+        with self._condition:
+            self._condition.notify_all()
+
+    def _next_entry(self):
+        """The waiting entry due next among clients below their concurrency cap"""
+        eligible = [
+            entry for entry in self._waiting
+            if not self.client_max_concurrency or self._clients[entry[3]]['running'] < self.client_max_concurrency
+        ]
+        return min(eligible) if eligible else None
+
+    def _client_state(self, client):
+        state = self._clients.get(client)
+        if state is None:
+            state = {'finish_tag': 0.0, 'running': 0, 'queued': 0, 'admitted': 0, 'total_wait': 0.0}
+            self._clients[client] = state
+            # Forget the least recently seen idle clients
+            for other in list(self._clients):
+                if len(self._clients) <= self.max_tracked_clients:
+                    break
+                if other != client and not self._clients[other]['running'] and not self._clients[other]['queued']:
+                    del self._clients[other]
+        self._clients.move_to_end(client)
+        return state
+
+    def get_stats(self):
+        with self._condition:
+            depth = {priority: 0 for priority in PRIORITY_CLASSES}
+            rank_to_priority = {rank: priority for priority, rank in PRIORITY_CLASSES.items()}
+            for entry in self._waiting:
+                depth[rank_to_priority[entry[0]]] += 1
+
+            classes = {}
+            for priority, metrics in self._metrics.items():
+                recent = sorted(metrics['recent_waits'])
+                classes[priority] = {
+                    'queue_depth': depth[priority],
+                    'admitted': metrics['admitted'],
+                    'avg_wait_ms': round(metrics['total_wait'] / metrics['admitted'] * 1000, 1) if metrics['admitted'] else 0.0,
+                    'p95_wait_ms': round(recent[min(int(len(recent) * 0.95), len(recent) - 1)] * 1000, 1) if recent else 0.0,
+                    'max_wait_ms': round(metrics['max_wait'] * 1000, 1),
+                }
+
+            clients = {}
+            for client, state in self._clients.items():
+                clients[client] = {
+                    'weight': self.client_weights.get(client, 1.0),
+                    'running': state['running'],
+                    'queued': state['queued'],
+                    'admitted': state['admitted'],
+                    'avg_wait_ms': round(state['total_wait'] / state['admitted'] * 1000, 1) if state['admitted'] else 0.0,
+                }
+
+            return {
+                'running': self._running,
+                'max_concurrency': self.max_concurrency,
+                'client_max_concurrency': self.client_max_concurrency,
+                'classes': classes,
+                'clients': clients,
+            }
+
+
+def create_schedulers():
+    """One scheduler per provider, sized to what that backend serves in parallel"""
+    client_max_concurrency = getattr(settings, 'AI_CLIENT_MAX_CONCURRENCY', 0)
+    client_weights = parse_client_weights(getattr(settings, 'AI_CLIENT_WEIGHTS', ''))
+    # Ollama capacity grows with the number of backends in the pool
+    ollama_backends = len(getattr(settings, 'MISTRAL_BASE_URLS', None) or [None])
+    return {
+        'mistral': PriorityScheduler('mistral', getattr(settings, 'AI_MISTRAL_MAX_CONCURRENCY', 2) * ollama_backends, client_max_concurrency, client_weights),
+        'openai': PriorityScheduler('openai', getattr(settings, 'AI_OPENAI_MAX_CONCURRENCY', 16), client_max_concurrency, client_weights),
+    }
@@ -136,6 +136,151 @@ AI_PROVIDER = os.getenv('AI_PROVIDER', 'mistral')  # Default to Mistral for MVP
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 MISTRAL_API_KEY = os.getenv('MISTRAL_API_KEY', 'local')  # Use 'local' for local Mistral installation
 MISTRAL_BASE_URL = os.getenv('MISTRAL_BASE_URL', 'http://localhost:11434')  # Default Ollama URL
+MISTRAL_BASE_URLS = [u.strip() for u in os.getenv('MISTRAL_BASE_URLS', MISTRAL_BASE_URL).split(',') if u.strip()]  # Ollama hosts to balance across
+MISTRAL_NUM_CTX = int(os.getenv('MISTRAL_NUM_CTX', '4096'))  # Context window requested from Ollama
+
+# Model tiers per task, e.g. a small model to classify clauses and larger ones to chat and draft
+# NDAs (every tier defaults to the mistral model, so no other model has to be pulled).
+# Each task has its own Ollama and OpenAI model and max_tokens/num_ctx defaults; an Ollama
+# model shared by several tasks is always run with the largest of their num_ctx values
+AI_TASK_MODELS = {
+    'classification': {
+        'mistral': os.getenv('AI_CLASSIFICATION_MODEL', 'mistral'),
+        'openai': os.getenv('AI_CLASSIFICATION_OPENAI_MODEL', 'gpt-4o-mini'),
+        'max_tokens': int(os.getenv('AI_CLASSIFICATION_MAX_TOKENS', '300')),
+        'num_ctx': int(os.getenv('AI_CLASSIFICATION_NUM_CTX', str(MISTRAL_NUM_CTX))),
+    },
+    'chat': {
+        'mistral': os.getenv('AI_CHAT_MODEL', 'mistral'),
+        'openai': os.getenv('AI_CHAT_OPENAI_MODEL', 'gpt-4'),
+        'max_tokens': int(os.getenv('AI_CHAT_MAX_TOKENS', '500')),
+        'num_ctx': int(os.getenv('AI_CHAT_NUM_CTX', str(MISTRAL_NUM_CTX))),
+    },
+    'drafting': {
+        'mistral': os.getenv('AI_DRAFTING_MODEL', 'mistral'),
+        'openai': os.getenv('AI_DRAFTING_OPENAI_MODEL', 'gpt-4'),
+        'max_tokens': int(os.getenv('AI_DRAFTING_MAX_TOKENS', '2000')),
+        'num_ctx': int(os.getenv('AI_DRAFTING_NUM_CTX', str(MISTRAL_NUM_CTX))),
+    },
+}
+
+# Background provider health checks (status endpoints serve the cached result)
+AI_HEALTH_CHECK_INTERVAL = float(os.getenv('AI_HEALTH_CHECK_INTERVAL', '30'))  # Seconds between probes
+
+# Provider circuit breakers (open after the failure rate is reached within the window)
+AI_CIRCUIT_FAILURE_RATE = float(os.getenv('AI_CIRCUIT_FAILURE_RATE', '0.5'))  # Failure fraction that opens the circuit
+AI_CIRCUIT_WINDOW_SIZE = int(os.getenv('AI_CIRCUIT_WINDOW_SIZE', '20'))  # Recent calls considered
+AI_CIRCUIT_MINIMUM_CALLS = int(os.getenv('AI_CIRCUIT_MINIMUM_CALLS', '3'))  # Calls needed before the circuit can open
+AI_CIRCUIT_OPEN_SECONDS = float(os.getenv('AI_CIRCUIT_OPEN_SECONDS', '30'))  # Time before a half-open probe is allowed
+AI_CIRCUIT_HALF_OPEN_PROBES = int(os.getenv('AI_CIRCUIT_HALF_OPEN_PROBES', '1'))  # Concurrent probe calls when half-open
+
+# Request scheduler (chat is admitted before NDA drafting, drafting before bulk redlining)
+AI_MISTRAL_MAX_CONCURRENCY = int(os.getenv('AI_MISTRAL_MAX_CONCURRENCY', '2'))  # Concurrent generations per Ollama backend (match OLLAMA_NUM_PARALLEL)
+AI_OPENAI_MAX_CONCURRENCY = int(os.getenv('AI_OPENAI_MAX_CONCURRENCY', '16'))  # Concurrent OpenAI completions
+AI_CLIENT_MAX_CONCURRENCY = int(os.getenv('AI_CLIENT_MAX_CONCURRENCY', '0'))  # Concurrent calls per client and provider (0 = no cap)
+AI_CLIENT_WEIGHTS = os.getenv('AI_CLIENT_WEIGHTS', '')  # Fair-share weights, e.g. 'api:3f2a9c1b7d4e=2,user:1=3' (default weight 1)
+
+# Stall detection: a stream is aborted when its first token takes longer than the first-token
+# timeout, no further token arrives for the idle timeout, or the deadline passes (all per task
+# type). A Mistral stream that stalls before its first token is retried on another backend;
+# once the deadline has passed the request fails without any retry or fallback
+AI_STREAM_TIMEOUTS = {
+    'chat': {
+        'first_token': float(os.getenv('AI_CHAT_FIRST_TOKEN_TIMEOUT', '45')),  # Seconds allowed before the first token
+        'idle': float(os.getenv('AI_CHAT_IDLE_TIMEOUT', '30')),  # Seconds allowed between tokens
+        'deadline': float(os.getenv('AI_CHAT_DEADLINE', '120')),  # Seconds allowed for the whole generation
+    },
+    'drafting': {
+        'first_token': float(os.getenv('AI_DRAFTING_FIRST_TOKEN_TIMEOUT', '60')),
+        'idle': float(os.getenv('AI_DRAFTING_IDLE_TIMEOUT', '30')),
+        'deadline': float(os.getenv('AI_DRAFTING_DEADLINE', '300')),
+    },
+    'classification': {
+        'first_token': float(os.getenv('AI_CLASSIFICATION_FIRST_TOKEN_TIMEOUT', '45')),
+        'idle': float(os.getenv('AI_CLASSIFICATION_IDLE_TIMEOUT', '30')),
+        'deadline': float(os.getenv('AI_CLASSIFICATION_DEADLINE', '120')),
+    },
+}
+
+# Streaming responses send a keep-alive comment when idle, so a client that has gone away is
+# noticed and its generation cancelled
+SSE_HEARTBEAT_INTERVAL = float(os.getenv('SSE_HEARTBEAT_INTERVAL', '5'))  # Seconds
+
+# Single-flight: identical AI requests running at the same time share one generation
+AI_SINGLE_FLIGHT_ENABLED = os.getenv('AI_SINGLE_FLIGHT_ENABLED', 'True').lower() == 'true'
+
+# Hedged requests: if Ollama has not produced a first token in time, the same request is
+# sent to another Ollama backend (or OpenAI) and whichever streams first is used
+AI_HEDGE_ENABLED = os.getenv('AI_HEDGE_ENABLED', 'False').lower() == 'true'
+AI_HEDGE_AFTER_SECONDS = float(os.getenv('AI_HEDGE_AFTER_SECONDS', '8'))  # Time-to-first-token budget before hedging
+AI_HEDGE_TASKS = [t.strip() for t in os.getenv('AI_HEDGE_TASKS', 'chat,drafting').split(',') if t.strip()]  # Tasks that may be hedged
+
+# AI response cache ('memory', 'sqlite' or 'none'); only calls at or below the temperature limit are cached
+AI_RESPONSE_CACHE_BACKEND = os.getenv('AI_RESPONSE_CACHE_BACKEND', 'memory')
+AI_RESPONSE_CACHE_MAX_BYTES = int(os.getenv('AI_RESPONSE_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+AI_RESPONSE_CACHE_MAX_TEMPERATURE = float(os.getenv('AI_RESPONSE_CACHE_MAX_TEMPERATURE', '0.3'))
+AI_RESPONSE_CACHE_PATH = os.getenv('AI_RESPONSE_CACHE_PATH', str(BASE_DIR / 'ai_response_cache.sqlite3'))
+
+# Ollama HTTP connection pool
+OLLAMA_POOL_SIZE = int(os.getenv('OLLAMA_POOL_SIZE', '10'))  # Keep-alive connections per backend URL
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv('OLLAMA_CONNECT_TIMEOUT', '5'))  # Seconds to establish a connection
+OLLAMA_READ_TIMEOUT = float(os.getenv('OLLAMA_READ_TIMEOUT', '300'))  # Seconds to wait for response data
+
+# Ollama backend pool (least outstanding requests, document affinity, ejection of failed or slow hosts)
+OLLAMA_BACKEND_FAILURE_THRESHOLD = int(os.getenv('OLLAMA_BACKEND_FAILURE_THRESHOLD', '3'))  # Consecutive failures before a host is ejected
+OLLAMA_BACKEND_EJECT_SECONDS = float(os.getenv('OLLAMA_BACKEND_EJECT_SECONDS', '30'))  # How long an ejected host gets no traffic
+OLLAMA_BACKEND_SLOW_FACTOR = float(os.getenv('OLLAMA_BACKEND_SLOW_FACTOR', '3'))  # Eject a host this many times slower to first token than the fastest
+OLLAMA_BACKEND_SLOW_MIN_SECONDS = float(os.getenv('OLLAMA_BACKEND_SLOW_MIN_SECONDS', '2'))  # Never eject for slowness below this first-token time
+OLLAMA_AFFINITY_SLACK = int(os.getenv('OLLAMA_AFFINITY_SLACK', '2'))  # Extra in-flight requests tolerated to keep a document on its host
+
+# Ollama model residency (models are warmed at startup and kept loaded)
+OLLAMA_RESIDENT_MODELS = [m.strip() for m in os.getenv('OLLAMA_RESIDENT_MODELS', '').split(',') if m.strip()]  # Defaults to the Ollama models of all task tiers
+OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '30m')  # Sent with every request, e.g. '30m' or '-1' to never unload
+OLLAMA_RESIDENCY_CHECK_INTERVAL = float(os.getenv('OLLAMA_RESIDENCY_CHECK_INTERVAL', '60'))  # Seconds between load checks
+
+# Chat sessions reuse the Ollama context of earlier turns on the same document
+CHAT_SESSION_MAX_SESSIONS = int(os.getenv('CHAT_SESSION_MAX_SESSIONS', '64'))  # Contexts kept in memory
+CHAT_SESSION_TTL = int(os.getenv('CHAT_SESSION_TTL', '1800'))  # Seconds before an idle session is dropped
+
+# Chat retrieval (documents above the budget are reduced to their best-matching chunks)
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv('CHAT_CONTEXT_TOKEN_BUDGET', '2000'))  # Document tokens sent per question
+CHAT_RETRIEVAL_TOP_K = int(os.getenv('CHAT_RETRIEVAL_TOP_K', '8'))  # Maximum chunks sent per question
+RETRIEVAL_CHUNK_TOKENS = int(os.getenv('RETRIEVAL_CHUNK_TOKENS', '200'))  # Target chunk size when indexing
+
+# Clause segmentation (numbered clauses, recitals and paragraphs; headings label the clauses below them)
+REDLINING_MAX_CLAUSE_CHARS = int(os.getenv('REDLINING_MAX_CLAUSE_CHARS', '1500'))  # Longer clauses are split at sentence ends
+REDLINING_MIN_CLAUSE_CHARS = int(os.getenv('REDLINING_MIN_CLAUSE_CHARS', '20'))  # Shorter unnumbered fragments are skipped
+
+# Revised versions: clauses of a new version are paired with the previous version's by wording,
+# then by similarity; verdicts of unchanged clauses are reused, changed and inserted ones re-analyzed
+REDLINING_REVISION_MATCH_RATIO = float(os.getenv('REDLINING_REVISION_MATCH_RATIO', '0.6'))  # Word overlap for an edited clause to count as changed rather than inserted
+
+# Local clause triage (rule file of known safe and risky phrasings; confident matches skip the model)
+REDLINING_TRIAGE_ENABLED = os.getenv('REDLINING_TRIAGE_ENABLED', 'True').lower() == 'true'
+REDLINING_TRIAGE_RULES_PATH = os.getenv('REDLINING_TRIAGE_RULES_PATH', '')  # Defaults to prompts/redlining/triage_rules.json
+REDLINING_TRIAGE_MIN_CONFIDENCE = int(os.getenv('REDLINING_TRIAGE_MIN_CONFIDENCE', '85'))  # Weaker rules only escalate
+REDLINING_TRIAGE_MAX_SAFE_CHARS = int(os.getenv('REDLINING_TRIAGE_MAX_SAFE_CHARS', '400'))  # Longer clauses are never passed as green locally
+REDLINING_TRIAGE_MIN_SAFE_COVERAGE = float(os.getenv('REDLINING_TRIAGE_MIN_SAFE_COVERAGE', '0.6'))  # Share of a multi-sentence clause the safe phrasings must cover to pass it as green
+
+# Local clause classifier (trained on cached verdicts with `python manage.py train_clause_classifier`;
+# unused until a model file exists)
+REDLINING_CLASSIFIER_ENABLED = os.getenv('REDLINING_CLASSIFIER_ENABLED', 'True').lower() == 'true'
+REDLINING_CLASSIFIER_PATH = os.getenv('REDLINING_CLASSIFIER_PATH') or str(BASE_DIR / 'clause_classifier.npz')
+REDLINING_CLASSIFIER_THRESHOLD = float(os.getenv('REDLINING_CLASSIFIER_THRESHOLD', '0.9'))  # Less confident clauses go to the model
+
+# Redlining concurrency (keep the Mistral worker count at or below Ollama's OLLAMA_NUM_PARALLEL)
+REDLINING_MISTRAL_WORKERS = int(os.getenv('REDLINING_MISTRAL_WORKERS', '2'))  # Parallel clause analyses per Ollama backend
+REDLINING_OPENAI_WORKERS = int(os.getenv('REDLINING_OPENAI_WORKERS', '8'))  # Parallel clause analyses on OpenAI
+
+# Batched clause analysis (clauses per request are also capped by the model context size)
+REDLINING_MAX_BATCH_SIZE = int(os.getenv('REDLINING_MAX_BATCH_SIZE', '8'))  # Set to 1 to analyze clauses individually
+OPENAI_CONTEXT_TOKENS = int(os.getenv('OPENAI_CONTEXT_TOKENS', '8192'))  # Context window of the OpenAI model
+
+# Clause verdict cache
+REDLINING_CACHE_ENABLED = os.getenv('REDLINING_CACHE_ENABLED', 'True').lower() == 'true'
+REDLINING_CACHE_TTL = int(os.getenv('REDLINING_CACHE_TTL', str(30 * 24 * 3600)))  # Seconds before a verdict expires
+REDLINING_CACHE_MAX_ENTRIES = int(os.getenv('REDLINING_CACHE_MAX_ENTRIES', '50000'))  # Rows kept in the database
+REDLINING_CACHE_LRU_SIZE = int(os.getenv('REDLINING_CACHE_LRU_SIZE', '2048'))  # Verdicts kept in process memory
 
 # Default Jurisdiction
 DEFAULT_JURISDICTION = 'India'
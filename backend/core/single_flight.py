@@ -0,0 +1,116 @@
+import threading
+from .streams import CancellationToken, StreamCancelled
+
+
+class _Flight:
+    """One upstream generation and the tokens it has produced so far"""
+
+    def __init__(self):
+        self.tokens = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.cancel = CancellationToken()
+
+
+class SingleFlight:
+    """Merge concurrent identical AI requests onto one upstream generation
+
+    The first request for a key starts the generation in a background thread. Requests
+    with the same key arriving while it runs subscribe to it instead: they replay the
+    tokens produced so far, then follow it live, and all of them get the same tokens or
+    the same error. The generation is only cancelled once every subscriber has gone, so
+    one caller disconnecting does not cut off the others.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._condition = threading.Condition()
+        self.stats = {'flights': 0, 'coalesced': 0, 'abandoned': 0}
+
+    def stream(self, key, start_stream, cancel=None):
+        """Yield the tokens of the generation for key, starting it with start_stream(cancel) unless one is running
+
+        The caller's own cancel token only unsubscribes this caller; start_stream
+        receives a token that is cancelled when the last subscriber leaves.
+        """
+        with self._condition:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+                self.stats['flights'] += 1
+            else:
+                self.stats['coalesced'] += 1
+            flight.subscribers += 1
+        if leader:
+            threading.Thread(target=self._run, args=(key, flight, start_stream), name='single-flight', daemon=True).start()
+        return self._follow(key, flight, cancel)
+
+    def _follow(self, key, flight, cancel):
+        unregister = cancel.on_cancel(self._wake_all) if cancel is not None else None
+        position = 0
+        try:
+            while True:
+                with self._condition:
+                    while position == len(flight.tokens) and not flight.done:
+                        if cancel is not None and cancel.cancelled:
+                            raise StreamCancelled("Request cancelled")
+                        self._condition.wait()
+                    tokens = flight.tokens[position:]
+                    done = flight.done
+                position += len(tokens)
+                for token in tokens:
+                    if cancel is not None:
+                        cancel.check()
+                    yield token
+                if done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+        finally:
+            if unregister is not None:
+                unregister()
+            self._leave(key, flight)
+
+    def _run(self, key, flight, start_stream):
+        error = None
+        try:
+            for token in start_stream(flight.cancel):
+                with self._condition:
+                    flight.tokens.append(token)
+                    self._condition.notify_all()
+        except Exception as e:
+            error = e
+        finally:
+            with self._condition:
+                flight.done = True
+                flight.error = error
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                self._condition.notify_all()
+
+    def _leave(self, key, flight):
+        with self._condition:
+            flight.subscribers -= 1
+            abandoned = not flight.subscribers and not flight.done
+            if abandoned:
+                # Nobody wants the result any more; later identical requests start afresh
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                self.stats['abandoned'] += 1
+        if abandoned:
+            flight.cancel.cancel()
+
+    def _wake_all(self):
+        with self._condition:
+            self._condition.notify_all()
+
+    def get_stats(self):
+        with self._condition:
+            stats = dict(self.stats)
+            stats['in_flight'] = len(self._flights)
+        requests = stats['flights'] + stats['coalesced']
+        stats['coalesce_rate'] = round(stats['coalesced'] / requests, 3) if requests else 0.0
+        return stats
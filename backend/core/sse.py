@@ -0,0 +1,50 @@
+import queue
+import threading
+from django.conf import settings
+from django.db import connection
+from .streams import StreamCancelled
+
+
+def relay_events(events, cancel, heartbeat_interval=None):
+    """Relay the SSE chunks of a generator to the client, cancelling its AI work on disconnect
+
+    The generator runs in a worker thread while this one writes to the client,
+    sending a comment line whenever nothing has been sent for heartbeat_interval
+    seconds. A disconnected client is only noticed when a write fails, so the
+    heartbeats make that happen even while the model is still thinking. When the
+    server then closes this stream, `cancel` is cancelled, which aborts the
+    upstream generation and any queued work straight away.
+    """
+    heartbeat_interval = heartbeat_interval or getattr(settings, 'SSE_HEARTBEAT_INTERVAL', 5)
+    chunks = queue.Queue()
+    finished = threading.Event()
+
+    def pump():
+        try:
+            for chunk in events:
+                if cancel.cancelled:
+                    break
+                chunks.put(chunk)
+        except StreamCancelled:
+            pass
+        finally:
+            events.close()
+            connection.close()
+            finished.set()
+            chunks.put(None)
+
+    threading.Thread(target=pump, name='sse-relay', daemon=True).start()
+    try:
+        while True:
+            try:
+                chunk = chunks.get(timeout=heartbeat_interval)
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        if not finished.is_set():
+            # The client went away before the stream finished
+            cancel.cancel()
@@ -0,0 +1,205 @@
+import queue
+import socket
+import threading
+import time
+
+
+class StreamCancelled(Exception):
+    """A provider stream was cancelled on purpose; not a provider failure"""
+
+
+class StreamStalled(Exception):
+    """A provider stream took too long to its first token or went idle between tokens"""
+
+
+class StreamDeadlineExceeded(Exception):
+    """A request ran out of its per-task deadline
+
+    The time is spent, so it is neither retried nor counted as a provider failure.
+    """
+
+
+class CancellationToken:
+    """Lets a caller stop an AI request from another thread, e.g. when its client disconnects"""
+
+    def __init__(self):
+        self.cancelled = False
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        """Cancel once, running every registered callback"""
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            callbacks = list(self._callbacks)
+            self._callbacks.clear()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def on_cancel(self, callback):
+        """Run callback on cancellation (now, if already cancelled); returns a function that unregisters it"""
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(callback)
+                return lambda: self._discard(callback)
+        callback()
+        return lambda: None
+
+    def check(self):
+        if self.cancelled:
+            raise StreamCancelled("Request cancelled")
+
+    def _discard(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+def abort_stream(handle):
+    """Cancel the streaming response published in handle, from any thread
+
+    Shutting the socket down unblocks a read that is still waiting for the next
+    token, so the provider sees the disconnect and stops generating. A request still
+    waiting for its response headers is cut off through the connection it was sent
+    on (see core.http_pool), or, where that is not published, abandoned as soon as
+    the headers arrive.
+    """
+    handle['cancelled'] = True
+    response = handle.get('response')
+    if response is None:
+        _shutdown(getattr(handle.get('connection'), 'sock', None))
+        return
+    raw = getattr(response, 'raw', None)
+    if raw is None:
+        # OpenAI streams wrap an httpx response
+        raw = getattr(response, 'response', None)
+    _shutdown(getattr(getattr(raw, '_connection', None), 'sock', None))
+    try:
+        (raw or response).close()
+    except Exception:
+        pass
+
+
+def _shutdown(sock):
+    """Shut a socket down so that any thread blocked reading it returns at once"""
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class HedgeStats:
+    """Counts of hedged requests and which copy won"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'hedged': 0, 'hedge_wins': 0, 'primary_wins': 0, 'no_capacity': 0, 'failed': 0}
+
+    def record(self, *events):
+        with self._lock:
+            for event in events:
+                self.stats[event] += 1
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats['hedge_rate'] = round(stats['hedged'] / stats['requests'], 3) if stats['requests'] else 0.0
+        stats['hedge_win_rate'] = round(stats['hedge_wins'] / stats['hedged'], 3) if stats['hedged'] else 0.0
+        return stats
+
+
+def race_streams(start_primary, start_hedge, hedge_after, stats, cancel=None):
+    """Yield tokens from the primary stream, hedging if its first token takes longer than hedge_after
+
+    start_primary(handle) and start_hedge(handle, primary_handle) return token
+    generators and publish their live response in handle so it can be aborted;
+    start_hedge returns None when there is no spare capacity to hedge on. Whichever
+    stream produces a token first is used, and marked 'won' in its handle, and the
+    other is cancelled; the cancel token stops both.
+    """
+    events = queue.Queue()
+    handles = {}
+    running = set()
+    unregister = []
+
+    def run(name, stream):
+        try:
+            for token in stream:
+                events.put((name, 'token', token))
+            events.put((name, 'done', None))
+        except Exception as e:
+            events.put((name, 'error', e))
+
+    def start(name, starter):
+        handle = {}
+        stream = starter(handle)
+        if stream is None:
+            return False
+        handles[name] = handle
+        running.add(name)
+        if cancel is not None:
+            unregister.append(cancel.on_cancel(lambda: abort_stream(handle)))
+        threading.Thread(target=run, args=(name, stream), name=f"hedge-{name}", daemon=True).start()
+        return True
+
+    stats.record('requests')
+    start('primary', start_primary)
+    deadline = time.monotonic() + hedge_after
+    hedged = False
+    winner = None
+    errors = {}
+    try:
+        # Wait for the first token from either stream
+        while winner is None:
+            timeout = None if hedged else max(deadline - time.monotonic(), 0)
+            try:
+                name, kind, value = events.get(timeout=timeout)
+            except queue.Empty:
+                hedged = True
+                started = start('hedge', lambda handle: start_hedge(handle, handles['primary']))
+                stats.record('hedged' if started else 'no_capacity')
+                continue
+
+            if kind == 'error':
+                errors[name] = value
+                running.discard(name)
+                if not running:
+                    stats.record('failed')
+                    raise errors.get('primary', value)
+                continue
+
+            winner = name
+            handles[winner]['won'] = True
+            stats.record('hedge_wins' if name == 'hedge' else 'primary_wins')
+            for loser in running - {winner}:
+                abort_stream(handles[loser])
+            running.intersection_update({winner})
+            if kind == 'done':
+                return
+            yield value
+
+        # Then follow the winner to the end
+        while True:
+            name, kind, value = events.get()
+            if name != winner:
+                continue
+            if kind == 'token':
+                yield value
+            elif kind == 'done':
+                running.discard(winner)
+                return
+            else:
+                running.discard(winner)
+                raise value
+    finally:
+        # Nothing still running is wanted any more, e.g. when the consumer went away
+        for name in running:
+            abort_stream(handles[name])
+        for remove in unregister:
+            remove()
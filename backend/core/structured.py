@@ -0,0 +1,53 @@
+import json
+
+
+def extract_json(text, kind=dict):
+    """Return the first JSON object (or array, with kind=list) embedded in text, or None
+
+    Tolerates prose or code fences around the JSON and stray brackets before it.
+    """
+    decoder = json.JSONDecoder()
+    opener = '{' if kind is dict else '['
+    start = text.find(opener)
+    while start != -1:
+        try:
+            value, _ = decoder.raw_decode(text, start)
+            if isinstance(value, kind):
+                return value
+        except json.JSONDecodeError:
+            pass
+        start = text.find(opener, start + 1)
+    return None
+
+
+def stop_after_json(tokens):
+    """Yield tokens up to the bracket that closes the first JSON object or array, then close the stream
+
+    This is the stop sequence for structured responses: whatever the model would
+    write after the JSON is never generated, since closing the stream aborts it.
+    """
+    depth = 0
+    in_string = False
+    escaped = False
+    try:
+        for token in tokens:
+            for i, char in enumerate(token):
+                if in_string:
+                    if escaped:
+                        escaped = False
+                    elif char == '\\':
+                        escaped = True
+                    elif char == '"':
+                        in_string = False
+                elif char == '"' and depth:
+                    in_string = True
+                elif char in '{[':
+                    depth += 1
+                elif char in '}]' and depth:
+                    depth -= 1
+                    if not depth:
+                        yield token[:i + 1]
+                        return
+            yield token
+    finally:
+        tokens.close()
@@ -0,0 +1,243 @@
+import json
+import socketserver
+import threading
+import time
+from unittest import mock
+import requests
+from django.test import SimpleTestCase, override_settings
+from .ai_service import AIService
+from .chat_sessions import chat_sessions
+from .response_cache import response_cache
+from .streams import StreamDeadlineExceeded, StreamStalled
+
+BACKENDS = ['http://ollama-a:11434', 'http://ollama-b:11434']
+
+
+class FakeResponse:
+    """A streaming Ollama response that sends `tokens` and then, if stall is set, times out"""
+
+    def __init__(self, tokens, stall=None):
+        self.tokens = tokens
+        self.stall = stall
+
+    def raise_for_status(self):
+        pass
+
+    def iter_lines(self):
+        for token in self.tokens:
+            yield json.dumps({'response': token}).encode()
+        if self.stall is not None:
+            time.sleep(self.stall)
+            raise requests.exceptions.ReadTimeout("Read timed out.")
+        yield json.dumps({'done': True}).encode()
+
+    def close(self):
+        pass
+
+
+class MissingModelResponse(FakeResponse):
+    def __init__(self):
+        super().__init__([])
+
+    def raise_for_status(self):
+        response = requests.Response()
+        response.status_code = 404
+        raise requests.exceptions.HTTPError("404 Client Error: Not Found", response=response)
+
+
+class FakeOllama:
+    """Stands in for http_pool; each backend answers, stalls before the first token or midway, or lacks the model"""
+
+    def __init__(self, behaviours):
+        self.behaviours = behaviours
+        self.calls = []
+
+    def post(self, base_url, path, json=None, stream=False, read_timeout=None, handle=None):
+        self.calls.append(base_url)
+        behaviour = self.behaviours[base_url]
+        if behaviour == 'stall':
+            # No headers until the first token, so the read timeout fires
+            time.sleep(read_timeout)
+            raise requests.exceptions.ReadTimeout("Read timed out.")
+        if behaviour == 'stall_midway':
+            return FakeResponse(['Hello', ' world'], stall=0.05)
+        if behaviour == 'missing_model':
+            return MissingModelResponse()
+        return FakeResponse(['Hello', ' world'])
+
+    def set_read_timeout(self, response, seconds):
+        pass
+
+
+class SilentOllama(socketserver.ThreadingTCPServer):
+    """A real Ollama stand-in on localhost; reads each request, then answers it or never sends headers"""
+
+    daemon_threads = True
+
+    def __init__(self, answer):
+        self.answer = answer
+        self.disconnected = threading.Event()
+        super().__init__(('127.0.0.1', 0), SilentOllamaHandler)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class SilentOllamaHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        length = 0
+        while (line := self.rfile.readline().strip()):
+            if line.lower().startswith(b'content-length:'):
+                length = int(line.split(b':')[1])
+        self.rfile.read(length)
+        if self.server.answer:
+            body = b''.join(json.dumps(data).encode() + b'\n' for data in [{'response': 'Hello'}, {'response': ' world'}, {'done': True}])
+            self.wfile.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nConnection: close\r\nContent-Length: %d\r\n\r\n%s' % (len(body), body))
+            return
+        # Wait for the client to give up on the request
+        self.connection.settimeout(10)
+        try:
+            self.connection.recv(1)
+        except OSError:
+            return
+        self.server.disconnected.set()
+
+
+def stream_timeouts(first_token, idle, deadline):
+    return {'chat': {'first_token': first_token, 'idle': idle, 'deadline': deadline}}
+
+
+@override_settings(AI_PROVIDER='mistral', MISTRAL_BASE_URLS=BACKENDS, OPENAI_API_KEY=None, AI_HEDGE_ENABLED=False, AI_SINGLE_FLIGHT_ENABLED=False)
+class StallAndDeadlineTests(SimpleTestCase):
+    def generate(self, behaviours):
+        service = AIService()
+        fake = FakeOllama(behaviours)
+        with mock.patch('core.ai_service.http_pool', fake):
+            response = "".join(service.stream_response([{'role': 'user', 'content': 'Hi'}], use_cache=False, task='chat'))
+        return service, fake, response
+
+    def failures(self, service):
+        return {url: stats['failures'] for url, stats in service.get_backend_stats().items()}
+
+    @override_settings(AI_STREAM_TIMEOUTS=stream_timeouts(first_token=0.05, idle=0.05, deadline=5))
+    def test_stall_before_first_token_moves_to_another_backend(self):
+        # Equally loaded backends are picked at random; start on the stalling one
+        with mock.patch('core.backends.random.choice', lambda urls: urls[0]):
+            service, fake, response = self.generate({BACKENDS[0]: 'stall', BACKENDS[1]: 'ok'})
+        self.assertEqual(response, 'Hello world')
+        self.assertEqual(fake.calls, BACKENDS)
+        self.assertEqual(self.failures(service), {BACKENDS[0]: 1, BACKENDS[1]: 0})
+
+    @override_settings(AI_STREAM_TIMEOUTS=stream_timeouts(first_token=0.05, idle=0.05, deadline=5))
+    def test_stall_after_first_token_is_not_restarted(self):
+        with self.assertRaises(StreamStalled):
+            self.generate({url: 'stall_midway' for url in BACKENDS})
+
+    @override_settings(AI_STREAM_TIMEOUTS=stream_timeouts(first_token=5, idle=5, deadline=0.05))
+    def test_spent_deadline_is_neither_retried_nor_a_failure(self):
+        service = AIService()
+        fake = FakeOllama({url: 'stall' for url in BACKENDS})
+        with mock.patch('core.ai_service.http_pool', fake):
+            with self.assertRaises(StreamDeadlineExceeded):
+                "".join(service.stream_response([{'role': 'user', 'content': 'Hi'}], use_cache=False, task='chat'))
+        self.assertEqual(len(fake.calls), 1)
+        self.assertEqual(sum(self.failures(service).values()), 0)
+        self.assertEqual(service.get_circuit_states()['mistral']['window_calls'], 0)
+
+    @override_settings(AI_STREAM_TIMEOUTS=stream_timeouts(first_token=0.05, idle=0.05, deadline=0.08))
+    def test_retry_that_runs_out_of_deadline_is_not_charged_to_its_backend(self):
+        service = AIService()
+        fake = FakeOllama({url: 'stall' for url in BACKENDS})
+        with mock.patch('core.ai_service.http_pool', fake):
+            with self.assertRaises(StreamDeadlineExceeded):
+                "".join(service.stream_response([{'role': 'user', 'content': 'Hi'}], use_cache=False, task='chat'))
+        failures = self.failures(service)
+        self.assertEqual(failures[fake.calls[0]], 1)
+        self.assertEqual(failures[fake.calls[1]], 0)
+        self.assertEqual(service.get_circuit_states()['mistral']['window_calls'], 0)
+
+    @override_settings(MISTRAL_BASE_URLS=BACKENDS[:1], AI_STREAM_TIMEOUTS=stream_timeouts(first_token=0.05, idle=0.05, deadline=5))
+    def test_stalled_conversation_turn_is_not_rerun_without_its_context(self):
+        service = AIService()
+        fake = FakeOllama({BACKENDS[0]: 'stall'})
+        model = service.get_task_model('chat', 'mistral')
+        chat_sessions.set('stalled-turn', model, BACKENDS[0], [1, 2, 3])
+        messages = [{'role': 'user', 'content': 'Hi'}]
+        with mock.patch('core.ai_service.http_pool', fake):
+            # Without OpenAI configured, the fallback fails too
+            with self.assertRaises(Exception):
+                "".join(service.stream_response(messages, session_key='stalled-turn', followup=messages, task='chat'))
+        self.assertEqual(fake.calls, BACKENDS[:1])
+
+
+@override_settings(AI_PROVIDER='mistral', MISTRAL_BASE_URLS=BACKENDS, OPENAI_API_KEY=None, AI_HEDGE_ENABLED=False, AI_SINGLE_FLIGHT_ENABLED=False)
+class MissingModelTests(SimpleTestCase):
+    def test_missing_model_is_not_a_backend_or_provider_failure(self):
+        service = AIService()
+        fake = FakeOllama({url: 'missing_model' for url in BACKENDS})
+        with mock.patch('core.ai_service.http_pool', fake):
+            for _ in range(3):
+                with self.assertRaises(Exception):
+                    "".join(service.stream_response([{'role': 'user', 'content': 'Hi'}], use_cache=False, task='classification'))
+        self.assertEqual(sorted(set(fake.calls)), BACKENDS)
+        self.assertEqual(sum(stats['failures'] for stats in service.get_backend_stats().values()), 0)
+        self.assertEqual(service.get_circuit_states()['mistral']['state'], 'closed')
+        self.assertEqual(service.get_circuit_states()['mistral']['window_calls'], 0)
+
+
+@override_settings(AI_PROVIDER='mistral', MISTRAL_BASE_URLS=BACKENDS, OPENAI_API_KEY=None, AI_HEDGE_ENABLED=False, AI_SINGLE_FLIGHT_ENABLED=False)
+class ResponseCacheTests(SimpleTestCase):
+    def generate(self, behaviours):
+        service = AIService()
+        service.openai_client = object()
+        messages = [{'role': 'user', 'content': 'Hi'}]
+        with mock.patch('core.ai_service.http_pool', FakeOllama(behaviours)), \
+                mock.patch.object(service, '_stream_openai_response', return_value=iter(['From OpenAI'])), \
+                mock.patch.object(response_cache, 'get', return_value=None), \
+                mock.patch.object(response_cache, 'set') as cache_set:
+            response = service.generate_response(messages, task='chat')
+        request = service._build_request(messages, None, None, 0.3, None, None, 'chat', None, None, None, None)
+        return service, response, request, cache_set
+
+    def test_answer_is_cached_under_the_provider_that_gave_it(self):
+        service, response, request, cache_set = self.generate({url: 'ok' for url in BACKENDS})
+        self.assertEqual(response, 'Hello world')
+        cache_set.assert_called_once_with(service._get_cache_key(request, True), 'Hello world')
+
+    def test_fallback_answer_is_not_cached_as_the_configured_provider(self):
+        service, response, request, cache_set = self.generate({url: 'missing_model' for url in BACKENDS})
+        self.assertEqual(response, 'From OpenAI')
+        key, value = cache_set.call_args.args
+        self.assertNotEqual(key, service._get_cache_key(request, True))
+        self.assertEqual(key, service._get_store_key(dict(request, served_by={'provider': 'openai'}), 'any'))
+
+
+@override_settings(AI_PROVIDER='mistral', OPENAI_API_KEY=None, AI_HEDGE_ENABLED=True, AI_HEDGE_TASKS=['chat'], AI_HEDGE_AFTER_SECONDS=0.1, AI_SINGLE_FLIGHT_ENABLED=False,
+                   AI_STREAM_TIMEOUTS=stream_timeouts(first_token=5, idle=5, deadline=10))
+class HedgeTests(SimpleTestCase):
+    def test_losing_hedge_is_cut_off_before_its_first_token(self):
+        silent, answering = SilentOllama(answer=False), SilentOllama(answer=True)
+        self.addCleanup(silent.stop)
+        self.addCleanup(answering.stop)
+        with self.settings(MISTRAL_BASE_URLS=[silent.url, answering.url]):
+            service = AIService()
+        # Start the primary on the backend that never sends headers
+        with mock.patch('core.backends.random.choice', lambda urls: urls[0]):
+            response = "".join(service.stream_response([{'role': 'user', 'content': 'Hi'}], use_cache=False, task='chat'))
+
+        self.assertEqual(response, 'Hello world')
+        self.assertEqual(service.get_hedge_stats()['hedge_wins'], 1)
+        # Well before the first-token timeout, the loser has hung up and given back its backend
+        self.assertTrue(silent.disconnected.wait(1))
+        for _ in range(100):
+            if service.get_backend_stats()[silent.url]['outstanding'] == 0:
+                break
+            time.sleep(0.01)
+        self.assertEqual(service.get_backend_stats()[silent.url]['outstanding'], 0)
+        self.assertEqual(service.get_backend_stats()[silent.url]['failures'], 0)
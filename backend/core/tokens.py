@@ -0,0 +1,3 @@
+def estimate_tokens(text):
+    """Estimate the token count of a text (about four characters per token)"""
+    return len(text) // 4 + 1
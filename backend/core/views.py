@@ -4,19 +4,31 @@ from rest_framework import status
 from django.views.decorators.csrf import csrf_exempt
 import json
 from .ai_service import ai_service
+from .http_pool import http_pool
+from .response_cache import response_cache
+from .chat_sessions import chat_sessions
 from .jurisdictions import get_jurisdictions_list, get_default_jurisdiction, get_jurisdiction_details
 
 
 @api_view(['GET'])
 def ai_status(request):
-    """Get current AI provider status and test connection"""
+    """Get current AI provider status from the background health check"""
     try:
         current_provider = ai_service.get_current_provider()
-        connection_test = ai_service.test_connection()
+        connection_test = ai_service.get_health()
         
         return Response({
             'current_provider': current_provider,
-            'connection_status': connection_test
+            'connection_status': connection_test,
+            'http_pool': http_pool.get_stats(),
+            'response_cache': response_cache.get_stats(),
+            'circuit_breakers': ai_service.get_circuit_states(),
+            'model_residency': ai_service.residency.get_status(),
+            'chat_sessions': chat_sessions.get_stats(),
+            'scheduler': ai_service.get_scheduler_stats(),
+            'ollama_backends': ai_service.get_backend_stats(),
+            'hedging': ai_service.get_hedge_stats(),
+            'single_flight': ai_service.get_single_flight_stats()
         })
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -36,7 +48,7 @@ def switch_ai_provider(request):
             }, status=status.HTTP_400_BAD_REQUEST)
         
         result = ai_service.switch_provider(provider)
-        connection_test = ai_service.test_connection()
+        connection_test = ai_service.get_health()
         
         return Response({
             'message': result,
@@ -50,9 +62,10 @@ def switch_ai_provider(request):
 
 @api_view(['GET'])
 def test_ai_connection(request):
-    """Test connection to current AI provider"""
+    """Test connection to current AI provider (pass ?refresh=true to re-probe now)"""
     try:
-        connection_test = ai_service.test_connection()
+        refresh = request.GET.get('refresh', 'false').lower() == 'true'
+        connection_test = ai_service.get_health(refresh=refresh)
         return Response(connection_test)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
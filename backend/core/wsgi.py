@@ -13,4 +13,9 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
-application = get_wsgi_application() 
\ No newline at end of file
+application = get_wsgi_application() 
+
+# Start background AI workers (health checks, model warmup) in the serving process only
+from core.ai_service import ai_service  # noqa: E402
+
+ai_service.start_background_services()
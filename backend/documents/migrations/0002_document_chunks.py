@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('text', models.TextField()),
+                ('start_offset', models.PositiveIntegerField()),
+                ('end_offset', models.PositiveIntegerField()),
+                ('token_count', models.PositiveIntegerField()),
+                ('term_frequencies', models.JSONField(default=dict)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='documents.document')),
+            ],
+            options={
+                'ordering': ['document', 'position'],
+            },
+        ),
+    ]
@@ -36,4 +36,19 @@ class ChatMessage(models.Model):
     timestamp = models.DateTimeField(default=timezone.now)
     
     class Meta:
-        ordering = ['timestamp'] 
\ No newline at end of file
+        ordering = ['timestamp'] 
+
+
+class DocumentChunk(models.Model):
+    """Clause- or paragraph-sized piece of a document, indexed for retrieval"""
+    
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='chunks')
+    position = models.PositiveIntegerField()
+    text = models.TextField()
+    start_offset = models.PositiveIntegerField()
+    end_offset = models.PositiveIntegerField()
+    token_count = models.PositiveIntegerField()
+    term_frequencies = models.JSONField(default=dict)
+    
+    class Meta:
+        ordering = ['document', 'position']
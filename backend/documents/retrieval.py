@@ -0,0 +1,183 @@
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+from django.conf import settings
+from core.tokens import estimate_tokens
+from .models import DocumentChunk
+
+# Lines that open a new clause or section
+HEADING_PATTERN = re.compile(r'^\s*(\d+(\.\d+)*[.)]?\s+\S|\(?[a-z]\)\s+\S|(ARTICLE|SECTION|SCHEDULE|WHEREAS)\b|[A-Z][A-Z \-&,]{3,}$)')
+SENTENCE_PATTERN = re.compile(r'[^.!?]+(?:[.!?]+|$)')
+WORD_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'has', 'have', 'in', 'is', 'it', 'its',
+    'of', 'on', 'or', 'that', 'the', 'this', 'to', 'was', 'were', 'will', 'with', 'what', 'which', 'who',
+    'does', 'do', 'any', 'all', 'such', 'shall', 'may', 'can', 'i', 'me', 'my', 'we', 'our', 'you', 'your',
+}
+
+
+def tokenize(text):
+    """Lowercased index terms of a text, without stopwords"""
+    return [word for word in WORD_PATTERN.findall(text.lower()) if word not in STOPWORDS]
+
+
+def chunk_document(content, max_chunk_tokens=None):
+    """Split document content into clause/paragraph chunks of at most max_chunk_tokens
+
+    Returns a list of (start_offset, end_offset) spans into content.
+    """
+    max_chunk_tokens = max_chunk_tokens or getattr(settings, 'RETRIEVAL_CHUNK_TOKENS', 200)
+
+    # Paragraph spans, with over-long paragraphs split at sentence boundaries
+    pieces = []
+    for line in re.finditer(r'[^\n]+', content):
+        if not line.group().strip():
+            continue
+        if estimate_tokens(line.group()) <= max_chunk_tokens:
+            pieces.append((line.start(), line.end()))
+            continue
+        for sentence in SENTENCE_PATTERN.finditer(line.group()):
+            if sentence.group().strip():
+                pieces.append((line.start() + sentence.start(), line.start() + sentence.end()))
+
+    # Merge consecutive pieces until the budget is reached or a new clause starts
+    spans = []
+    for start, end in pieces:
+        if spans:
+            current_start, current_end = spans[-1]
+            merged_tokens = estimate_tokens(content[current_start:end])
+            starts_clause = HEADING_PATTERN.match(content[start:end]) is not None
+            if merged_tokens <= max_chunk_tokens and not (starts_clause and estimate_tokens(content[current_start:current_end]) >= max_chunk_tokens // 4):
+                spans[-1] = (current_start, end)
+                continue
+        spans.append((start, end))
+
+    return spans
+
+
+def build_document_index(document):
+    """Chunk a document and store its retrieval index, replacing any earlier one"""
+    content = document.content or ''
+    chunks = []
+    for position, (start, end) in enumerate(chunk_document(content)):
+        text = content[start:end].strip()
+        chunks.append(DocumentChunk(
+            document=document,
+            position=position,
+            text=text,
+            start_offset=start,
+            end_offset=end,
+            token_count=estimate_tokens(text),
+            term_frequencies=dict(Counter(tokenize(text))),
+        ))
+
+    DocumentChunk.objects.filter(document=document).delete()
+    DocumentChunk.objects.bulk_create(chunks)
+    index_cache.invalidate(document.id)
+    return chunks
+
+
+class BM25Index:
+    """Okapi BM25 ranking over the chunks of one document"""
+
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.lengths = [sum(chunk.term_frequencies.values()) for chunk in chunks]
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0
+        document_frequency = Counter()
+        for chunk in chunks:
+            document_frequency.update(chunk.term_frequencies.keys())
+        total = len(chunks)
+        self.idf = {term: math.log(1 + (total - df + 0.5) / (df + 0.5)) for term, df in document_frequency.items()}
+
+    def search(self, query):
+        """Return (score, chunk) pairs for chunks matching the query, best first"""
+        terms = set(tokenize(query))
+        results = []
+        for chunk, length in zip(self.chunks, self.lengths):
+            score = 0.0
+            for term in terms:
+                frequency = chunk.term_frequencies.get(term)
+                if not frequency:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * length / self.average_length) if self.average_length else self.k1
+                score += self.idf[term] * frequency * (self.k1 + 1) / (frequency + norm)
+            if score > 0:
+                results.append((score, chunk))
+        results.sort(key=lambda result: (-result[0], result[1].position))
+        return results
+
+
+class IndexCache:
+    """In-process LRU of loaded BM25 indexes by document id"""
+
+    def __init__(self, max_documents=32):
+        self.max_documents = max_documents
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, document):
+        with self._lock:
+            index = self._indexes.get(document.id)
+            if index is not None:
+                self._indexes.move_to_end(document.id)
+                return index
+
+        chunks = list(document.chunks.all())
+        if not chunks and document.content:
+            # Documents uploaded before indexing existed are indexed on first use
+            chunks = build_document_index(document)
+        index = BM25Index(chunks)
+
+        with self._lock:
+            self._indexes[document.id] = index
+            while len(self._indexes) > self.max_documents:
+                self._indexes.popitem(last=False)
+        return index
+
+    def invalidate(self, document_id):
+        with self._lock:
+            self._indexes.pop(document_id, None)
+
+
+index_cache = IndexCache()
+
+
+def select_document_context(document, question, token_budget=None, top_k=None):
+    """Pick the document text to send with a question
+
+    Returns (text, positions). Documents that fit the token budget are sent whole,
+    with positions None; longer ones are reduced to the best-ranked chunks, in
+    document order, and positions lists the chunks chosen.
+    """
+    token_budget = token_budget or getattr(settings, 'CHAT_CONTEXT_TOKEN_BUDGET', 2000)
+    top_k = top_k or getattr(settings, 'CHAT_RETRIEVAL_TOP_K', 8)
+    content = document.content or ''
+    if estimate_tokens(content) <= token_budget:
+        return content, None
+
+    index = index_cache.get(document)
+    selected = []
+    used = 0
+    for score, chunk in index.search(question):
+        if len(selected) >= top_k:
+            break
+        if used + chunk.token_count > token_budget:
+            continue
+        selected.append(chunk)
+        used += chunk.token_count
+
+    if not selected:
+        # Nothing matched the question, so fall back to the opening of the document
+        for chunk in index.chunks:
+            if used + chunk.token_count > token_budget:
+                break
+            selected.append(chunk)
+            used += chunk.token_count
+
+    selected.sort(key=lambda chunk: chunk.position)
+    return "\n...\n".join(chunk.text for chunk in selected), [chunk.position for chunk in selected]
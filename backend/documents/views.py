@@ -9,7 +9,15 @@ import json
 import os
 from .models import Document, ChatMessage
 from .utils import process_document, extract_text_from_file
+from .retrieval import build_document_index, select_document_context
 from core.ai_service import ai_service
+from core.scheduler import get_client_key
+from core.sse import relay_events
+from core.streams import CancellationToken
+
+
+CHAT_SYSTEM_PROMPT = """You are a legal AI assistant for Clausemint. You help users understand legal documents, 
+        explain clauses, and provide legal insights. Always be helpful, accurate, and professional."""
 
 
 def index(request):
@@ -42,6 +50,9 @@ def upload_document(request):
         document.processed = True
         document.save()
         
+        # Index the document so chat can retrieve just the relevant passages
+        build_document_index(document)
+        
         return Response({
             'id': document.id,
             'title': document.title,
@@ -92,15 +103,8 @@ def chat_message(request):
         )
         
         # Generate AI response
-        system_prompt = """You are a legal AI assistant for Clausemint. You help users understand legal documents, 
-        explain clauses, and provide legal insights. Always be helpful, accurate, and professional."""
-        
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"Document content: {document.content}\n\nUser question: {message}"}
-        ]
-        
-        ai_response = ai_service.generate_response(messages, max_tokens=500)
+        messages, session_options = build_chat_request(document, message)
+        ai_response = ai_service.generate_response(messages, task='chat', client=get_client_key(request), affinity_key=f"document:{document.id}", **session_options)
         
         # Save AI response
         ChatMessage.objects.create(
@@ -143,13 +147,9 @@ def chat_message_streaming(request):
         )
         
         # Generate AI response
-        system_prompt = """You are a legal AI assistant for Clausemint. You help users understand legal documents, 
-        explain clauses, and provide legal insights. Always be helpful, accurate, and professional."""
-        
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"Document content: {document.content}\n\nUser question: {message}"}
-        ]
+        messages, session_options = build_chat_request(document, message)
+        client = get_client_key(request)
+        cancel = CancellationToken()
         
         def generate_chat_stream():
             """Generate streaming chat response"""
@@ -157,8 +157,12 @@ def chat_message_streaming(request):
                 # Send initial status
                 yield f"data: {json.dumps({'status': 'started', 'message': 'AI is thinking...'})}\n\n"
                 
-                # Generate content using streaming
-                ai_response = ai_service.generate_response(messages, max_tokens=500)
+                # Forward tokens to the client as they are generated
+                ai_response = ""
+                for token in ai_service.stream_response(messages, task='chat', client=client, affinity_key=f"document:{document.id}", cancel=cancel, **session_options):
+                    ai_response += token
+                    yield f"data: {json.dumps({'status': 'token', 'token': token})}\n\n"
+                ai_response = ai_response.strip()
                 
                 # Save AI response
                 ChatMessage.objects.create(
@@ -175,7 +179,7 @@ def chat_message_streaming(request):
         
         # Return streaming response
         response = StreamingHttpResponse(
-            generate_chat_stream(),
+            relay_events(generate_chat_stream(), cancel),
             content_type='text/event-stream'
         )
         response['Cache-Control'] = 'no-cache'
@@ -206,4 +210,34 @@ def get_chat_history(request, document_id):
         return Response(data)
         
     except Document.DoesNotExist:
-        return Response({'error': 'Document not found'}, status=status.HTTP_404_NOT_FOUND) 
\ No newline at end of file
+        return Response({'error': 'Document not found'}, status=status.HTTP_404_NOT_FOUND) 
+
+
+def build_chat_request(document, message):
+    """Build the messages and session options for a chat question
+
+    Follow-up questions reuse the model's cached view of the document context they
+    were asked about: the whole document, or for long documents the set of excerpts
+    retrieved for the question, so questions about the same passages share a session.
+    """
+    document_text, positions = select_document_context(document, message)
+    
+    if positions is None:
+        messages = [
+            {"role": "system", "content": CHAT_SYSTEM_PROMPT},
+            {"role": "user", "content": f"Document content: {document_text}\n\nUser question: {message}"}
+        ]
+        session_key = f"document:{document.id}"
+    else:
+        # Long documents are reduced to the passages most relevant to this question
+        messages = [
+            {"role": "system", "content": CHAT_SYSTEM_PROMPT},
+            {"role": "user", "content": f"Relevant document excerpts: {document_text}\n\nUser question: {message}"}
+        ]
+        session_key = f"document:{document.id}:excerpts:{','.join(map(str, positions))}"
+    
+    session_options = {
+        'session_key': session_key,
+        'followup': [{"role": "user", "content": message}]
+    }
+    return messages, session_options
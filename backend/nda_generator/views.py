@@ -14,18 +14,19 @@ from docx.shared import Inches
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from core.ai_service import ai_service
 from core.jurisdictions import get_default_jurisdiction
+from core.scheduler import get_client_key
+from core.sse import relay_events
+from core.streams import CancellationToken
 from .utils import load_nda_prompt
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 
-def generate_nda_streaming(messages, max_tokens=2000, temperature=0.3):
-    """Generate NDA content using streaming"""
+def generate_nda_streaming(messages, max_tokens=None, temperature=0.3, client=None, cancel=None):
+    """Yield NDA content tokens as they are generated"""
     try:
-        # Use the AI service with streaming
-        response = ai_service._generate_mistral_response(messages, max_tokens=max_tokens, temperature=temperature)
-        return response
+        yield from ai_service.stream_response(messages, max_tokens=max_tokens, temperature=temperature, task='drafting', client=client, cancel=cancel)
     except Exception as e:
         logger.error(f"Streaming generation error: {e}")
         raise e
@@ -77,17 +78,23 @@ def generate_nda_streaming_view(request):
             {"role": "user", "content": formatted_prompt}
         ]
         
+        client = get_client_key(request)
+        cancel = CancellationToken()
+        
         def generate_stream():
             """Generate streaming response"""
             try:
                 # Send initial status
                 yield f"data: {json.dumps({'status': 'started', 'message': 'Starting NDA generation...'})}\n\n"
                 
-                # Generate content using streaming
-                content = generate_nda_streaming(messages, max_tokens=2000, temperature=0.3)
+                # Forward tokens to the client as they are generated
+                content = ""
+                for token in generate_nda_streaming(messages, temperature=0.3, client=client, cancel=cancel):
+                    content += token
+                    yield f"data: {json.dumps({'status': 'token', 'token': token})}\n\n"
                 
                 # Send the complete content
-                yield f"data: {json.dumps({'status': 'completed', 'content': content, 'parameters': {
+                parameters = {
                     'party_a': party_a,
                     'party_b': party_b,
                     'party_c': party_c,
@@ -95,7 +102,8 @@ def generate_nda_streaming_view(request):
                     'purpose': purpose,
                     'confidentiality_period': confidentiality_period,
                     'jurisdiction': jurisdiction
-                }})}\n\n"
+                }
+                yield f"data: {json.dumps({'status': 'completed', 'content': content.strip(), 'parameters': parameters})}\n\n"
                 
                 # Log successful generation
                 logger.info(f"Streaming NDA generated successfully for {party_a} and {party_b}")
@@ -107,7 +115,7 @@ def generate_nda_streaming_view(request):
         
         # Return streaming response
         response = StreamingHttpResponse(
-            generate_stream(),
+            relay_events(generate_stream(), cancel),
             content_type='text/event-stream'
         )
         response['Cache-Control'] = 'no-cache'
@@ -176,7 +184,7 @@ def generate_nda(request):
             {"role": "user", "content": formatted_prompt}
         ]
         
-        nda_content = ai_service.generate_response(messages, max_tokens=2000, temperature=0.3)
+        nda_content = ai_service.generate_response(messages, temperature=0.3, task='drafting', client=get_client_key(request))
         
         # Log successful generation
         logger.info(f"NDA generated successfully for {party_a} and {party_b}")
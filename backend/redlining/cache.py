@@ -0,0 +1,161 @@
+import hashlib
+import logging
+import re
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError
+from django.db.models import F
+from django.utils import timezone
+from core.ai_service import ai_service
+from .models import ClauseVerdict
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_clause_text(clause_text):
+    """Normalize clause text so trivially different copies share a cache entry"""
+    return re.sub(r'\s+', ' ', clause_text).strip().casefold()
+
+
+class VerdictCache:
+    """Clause verdict cache backed by the database with an in-process LRU in front"""
+
+    def __init__(self, lru_size=None, ttl=None, max_entries=None):
+        self.lru_size = lru_size or getattr(settings, 'REDLINING_CACHE_LRU_SIZE', 2048)
+        self.ttl = ttl or getattr(settings, 'REDLINING_CACHE_TTL', 30 * 24 * 3600)
+        self.max_entries = max_entries or getattr(settings, 'REDLINING_CACHE_MAX_ENTRIES', 50000)
+        self.enabled = getattr(settings, 'REDLINING_CACHE_ENABLED', True)
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_purge = 0
+        self.stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+    def make_key(self, clause_text, clause_type, prompt_version, provider=None, model=None):
+        """Build the content-addressed key for a clause verdict"""
+        provider = provider or ai_service.get_current_provider()
+        model = model or ai_service.get_task_model('classification', provider)
+        raw = '\x1f'.join([normalize_clause_text(clause_text), clause_type, prompt_version, provider, model])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, clause_text, clause_type, prompt_version):
+        """Return a copy of the cached verdict for a clause, or None"""
+        if not self.enabled:
+            return None
+
+        key = self.make_key(clause_text, clause_type, prompt_version)
+        now = timezone.now()
+
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry and now - entry[1] < timedelta(seconds=self.ttl):
+                self._lru.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return dict(entry[0])
+
+        cutoff = now - timedelta(seconds=self.ttl)
+        try:
+            row = ClauseVerdict.objects.filter(cache_key=key, created_at__gte=cutoff).first()
+            if row is not None:
+                ClauseVerdict.objects.filter(pk=row.pk).update(last_used_at=now, hit_count=F('hit_count') + 1)
+        except DatabaseError as e:
+            logger.warning(f"Verdict cache read failed: {e}")
+            row = None
+
+        if row is None:
+            with self._lock:
+                self._lru.pop(key, None)
+                self.stats['misses'] += 1
+            return None
+
+        with self._lock:
+            self._remember(key, row.verdict, row.created_at)
+            self.stats['db_hits'] += 1
+        return dict(row.verdict)
+
+    def set(self, clause_text, clause_type, prompt_version, verdict):
+        """Store a verdict for a clause"""
+        if not self.enabled:
+            return
+
+        provider = ai_service.get_current_provider()
+        model = ai_service.get_task_model('classification', provider)
+        key = self.make_key(clause_text, clause_type, prompt_version, provider, model)
+        now = timezone.now()
+        verdict = {k: v for k, v in verdict.items() if k not in ('clause_id', 'clause_text')}
+
+        fields = {
+            'clause_text': clause_text,
+            'clause_type': clause_type,
+            'prompt_version': prompt_version,
+            'provider': provider,
+            'model': model,
+            'verdict': verdict,
+            'created_at': now,
+            'last_used_at': now,
+        }
+        # Plain update-then-insert rather than update_or_create: SQLite cannot upgrade the
+        # read lock taken inside its transaction while other workers are writing
+        try:
+            if not ClauseVerdict.objects.filter(cache_key=key).update(**fields):
+                ClauseVerdict.objects.create(cache_key=key, **fields)
+        except IntegrityError:
+            # Another worker stored the same clause first
+            pass
+        except DatabaseError as e:
+            logger.warning(f"Verdict cache write failed: {e}")
+            return
+
+        with self._lock:
+            self._remember(key, verdict, now)
+            self.stats['stores'] += 1
+            self._writes_since_purge += 1
+            purge = self._writes_since_purge >= 100
+            if purge:
+                self._writes_since_purge = 0
+
+        if purge:
+            self.purge()
+
+    def purge(self):
+        """Delete expired rows and trim the table to the least recently used max_entries"""
+        cutoff = timezone.now() - timedelta(seconds=self.ttl)
+        deleted, _ = ClauseVerdict.objects.filter(created_at__lt=cutoff).delete()
+
+        overflow = ClauseVerdict.objects.count() - self.max_entries
+        if overflow > 0:
+            stale_ids = list(ClauseVerdict.objects.order_by('last_used_at').values_list('id', flat=True)[:overflow])
+            deleted += ClauseVerdict.objects.filter(id__in=stale_ids).delete()[0]
+
+        with self._lock:
+            self.stats['evictions'] += deleted
+        return deleted
+
+    def clear(self):
+        """Drop every cached verdict"""
+        ClauseVerdict.objects.all().delete()
+        with self._lock:
+            self._lru.clear()
+
+    def get_stats(self):
+        """Hit/miss counters and sizes for the verdict cache"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['memory_entries'] = len(self._lru)
+        lookups = stats['memory_hits'] + stats['db_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['memory_hits'] + stats['db_hits']) / lookups, 3) if lookups else 0.0
+        stats['db_entries'] = ClauseVerdict.objects.count()
+        stats['enabled'] = self.enabled
+        return stats
+
+    def _remember(self, key, verdict, stored_at):
+        """Insert into the in-process LRU, evicting the oldest entry when full"""
+        self._lru[key] = (verdict, stored_at)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+
+# Global clause verdict cache
+verdict_cache = VerdictCache()
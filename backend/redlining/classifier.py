@@ -0,0 +1,206 @@
+import logging
+import os
+import re
+import threading
+import time
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from .models import ClauseVerdict
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r"[a-z][a-z0-9']+")
+
+RISK_LEVELS = ('red', 'amber', 'green')
+
+
+def clause_terms(clause_text):
+    """Words and word pairs of a clause, the features of the classifier"""
+    words = TOKEN_RE.findall(clause_text.casefold())
+    return words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+
+
+def load_training_data(model=None):
+    """(clause texts, risk levels) of cached model verdicts, most recent verdict per clause text"""
+    rows = ClauseVerdict.objects.exclude(clause_text='').order_by('created_at')
+    if model:
+        rows = rows.filter(model=model)
+    labelled = {}
+    for clause_text, verdict in rows.values_list('clause_text', 'verdict').iterator():
+        # Failed analyses are fallbacks, not model verdicts
+        if verdict.get('risk_level') in RISK_LEVELS and verdict.get('confidence'):
+            labelled[clause_text] = verdict['risk_level']
+    return list(labelled), list(labelled.values())
+
+
+class ClauseClassifier:
+    """TF-IDF features and a softmax regression trained on verdicts the model has already given
+
+    Clauses are held as sparse (row, column, value) triples, so a whole document
+    is scored with a few vectorized NumPy operations no matter how large the
+    vocabulary is. The trained model is kept in an .npz file and reloaded when the
+    file changes, so retraining takes effect without a restart.
+    """
+
+    def __init__(self, path=None, threshold=None):
+        self.path = path or getattr(settings, 'REDLINING_CLASSIFIER_PATH', str(settings.BASE_DIR / 'clause_classifier.npz'))
+        self.threshold = threshold or getattr(settings, 'REDLINING_CLASSIFIER_THRESHOLD', 0.9)
+        self.enabled = getattr(settings, 'REDLINING_CLASSIFIER_ENABLED', True)
+        self.vocabulary = {}
+        self.idf = None
+        self.weights = None
+        self.bias = None
+        self.classes = list(RISK_LEVELS)
+        self.meta = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+        self.stats = {'clauses': 0, 'local': 0, 'escalated': 0, 'seconds': 0.0}
+
+    def vectorize(self, texts):
+        """Sparse L2-normalized TF-IDF rows of texts as (rows, columns, values) arrays"""
+        rows, columns, counts = [], [], []
+        for i, text in enumerate(texts):
+            terms = {}
+            for term in clause_terms(text):
+                column = self.vocabulary.get(term)
+                if column is not None:
+                    terms[column] = terms.get(column, 0) + 1
+            rows.extend([i] * len(terms))
+            columns.extend(terms)
+            counts.extend(terms.values())
+        rows = np.array(rows, dtype=np.int64)
+        columns = np.array(columns, dtype=np.int64)
+        values = (1.0 + np.log(np.array(counts, dtype=np.float64))) * self.idf[columns]
+        norms = np.sqrt(np.bincount(rows, weights=values * values, minlength=len(texts)))
+        values /= np.maximum(norms[rows], 1e-12)
+        return rows, columns, values
+
+    def predict_proba(self, texts):
+        """Probability of every risk level for each text, as an array of shape (texts, classes)"""
+        rows, columns, values = self.vectorize(texts)
+        return self._softmax(self._scores(rows, columns, values, len(texts)))
+
+    def fit(self, texts, labels, epochs=300, learning_rate=2.0, l2=1e-4, min_df=2, max_features=50000):
+        """Train on texts and their risk levels; returns the classifier"""
+        document_frequency = {}
+        for text in texts:
+            for term in set(clause_terms(text)):
+                document_frequency[term] = document_frequency.get(term, 0) + 1
+        terms = sorted((term for term, df in document_frequency.items() if df >= min_df), key=lambda term: -document_frequency[term])[:max_features]
+        self.vocabulary = {term: i for i, term in enumerate(terms)}
+        df = np.array([document_frequency[term] for term in terms], dtype=np.float64)
+        self.idf = np.log((1.0 + len(texts)) / (1.0 + df)) + 1.0
+
+        rows, columns, values = self.vectorize(texts)
+        targets = np.array([self.classes.index(label) for label in labels])
+        one_hot = np.eye(len(self.classes))[targets]
+        # Red clauses are rare; weight each class equally so they are not drowned out
+        counts = np.bincount(targets, minlength=len(self.classes))
+        sample_weights = (len(targets) / (len(self.classes) * np.maximum(counts, 1)))[targets][:, None] / len(targets)
+
+        self.weights = np.zeros((len(terms), len(self.classes)))
+        self.bias = np.zeros(len(self.classes))
+        for _ in range(epochs):
+            probabilities = self._softmax(self._scores(rows, columns, values, len(texts)))
+            error = (probabilities - one_hot) * sample_weights
+            gradient = np.stack([np.bincount(columns, weights=values * error[rows, c], minlength=len(terms)) for c in range(len(self.classes))], axis=1)
+            self.weights -= learning_rate * (gradient + l2 * self.weights)
+            self.bias -= learning_rate * error.sum(axis=0)
+        return self
+
+    def save(self, path=None, **meta):
+        """Write the trained model to an .npz file"""
+        path = path or self.path
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        meta = {'trained_at': timezone.now().isoformat(), **meta}
+        with open(path, 'wb') as f:
+            np.savez_compressed(
+                f, terms=np.array(terms, dtype=str), idf=self.idf, weights=self.weights, bias=self.bias,
+                classes=np.array(self.classes, dtype=str),
+                meta_keys=np.array(list(meta), dtype=str), meta_values=np.array([str(v) for v in meta.values()], dtype=str),
+            )
+        return path
+
+    def load(self, path=None):
+        """Load a model written by save()"""
+        with np.load(path or self.path) as data:
+            self.vocabulary = {term: i for i, term in enumerate(data['terms'].tolist())}
+            self.idf = data['idf']
+            self.weights = data['weights']
+            self.bias = data['bias']
+            self.classes = data['classes'].tolist()
+            self.meta = dict(zip(data['meta_keys'].tolist(), data['meta_values'].tolist()))
+        return self
+
+    def is_ready(self):
+        """Whether a trained model is available, (re)loading the model file if it changed"""
+        if not self.enabled:
+            return False
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return self.weights is not None
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    try:
+                        self.load()
+                        logger.info(f"Loaded clause classifier from {self.path} ({len(self.vocabulary)} terms)")
+                    except (OSError, ValueError, KeyError) as e:
+                        logger.warning(f"Clause classifier could not be loaded from {self.path}: {e}")
+                    self._mtime = mtime
+        return self.weights is not None
+
+    def classify(self, texts):
+        """Local verdicts for the texts the classifier is confident about, as {index: analysis}"""
+        if not texts or not self.is_ready():
+            return {}
+        started = time.perf_counter()
+        with self._lock:
+            # Not while a retrained model is being swapped in
+            probabilities = self.predict_proba(texts)
+        best = probabilities.argmax(axis=1)
+        verdicts = {}
+        for i in np.flatnonzero(probabilities[np.arange(len(texts)), best] >= self.threshold):
+            risk_level = self.classes[best[i]]
+            confidence = round(float(probabilities[i, best[i]]) * 100)
+            verdicts[int(i)] = {
+                'risk_level': risk_level,
+                'explanation': f'Classified locally from clauses previously reviewed by the model ({confidence}% confidence)',
+                'suggestions': 'No changes needed' if risk_level == 'green' else 'Manual review recommended',
+                'confidence': confidence,
+                'source': 'classifier',
+            }
+        with self._lock:
+            self.stats['clauses'] += len(texts)
+            self.stats['local'] += len(verdicts)
+            self.stats['escalated'] += len(texts) - len(verdicts)
+            self.stats['seconds'] += time.perf_counter() - started
+        return verdicts
+
+    def get_stats(self):
+        """Get classifier statistics"""
+        with self._lock:
+            stats = dict(self.stats)
+        stats['seconds'] = round(stats['seconds'], 4)
+        stats['enabled'] = self.enabled
+        stats['ready'] = self.is_ready()
+        stats['threshold'] = self.threshold
+        stats['terms'] = len(self.vocabulary)
+        stats['local_rate'] = round(stats['local'] / stats['clauses'], 3) if stats['clauses'] else 0.0
+        stats.update(self.meta)
+        return stats
+
+    def _scores(self, rows, columns, values, count):
+        scores = np.stack([np.bincount(rows, weights=values * self.weights[columns, c], minlength=count) for c in range(len(self.classes))], axis=1)
+        return scores + self.bias
+
+    @staticmethod
+    def _softmax(scores):
+        exp = np.exp(scores - scores.max(axis=1, keepdims=True))
+        return exp / exp.sum(axis=1, keepdims=True)
+
+
+# Global clause classifier
+clause_classifier = ClauseClassifier()
@@ -0,0 +1,252 @@
+import re
+from bisect import bisect_left
+from collections import Counter
+from difflib import SequenceMatcher
+from .revisions import align_clauses
+from .segmenter import NUMBER_RE, segment_clauses
+
+WORD_DIFF_RE = re.compile(r'\s+|\w+|[^\w\s]')
+
+# Gaps without unique clauses larger than this (old x new clauses) are not searched for common clauses
+MAX_GAP_PRODUCT = 250000
+
+
+def clause_key(clause_text):
+    """Comparison key of a clause: its text without the clause number, whitespace collapsed"""
+    text = clause_text.strip()
+    marker = NUMBER_RE.match(text)
+    if marker:
+        text = text[marker.end():]
+    return ' '.join(text.split())
+
+
+def diff_sequences(a, b):
+    """Opcodes ('equal', 'replace', 'insert' or 'delete', i1, i2, j1, j2) that turn sequence a into b
+
+    Patience diff: common prefixes and suffixes are matched first, then the longest
+    increasing run of elements that occur exactly once on both sides anchors the
+    rest, and the gaps between anchors are diffed the same way. Only small gaps
+    without any unique element fall back to difflib, so a long document costs
+    O(n log n) rather than the quadratic time of diffing it in one go.
+    """
+    opcodes = []
+    stack = [('range', 0, len(a), 0, len(b))]
+    while stack:
+        item = stack.pop()
+        if item[0] != 'range':
+            opcodes.append(item)
+            continue
+        _, i1, i2, j1, j2 = item
+        # Common prefix and suffix
+        start = 0
+        while i1 + start < i2 and j1 + start < j2 and a[i1 + start] == b[j1 + start]:
+            start += 1
+        end = 0
+        while i2 - end > i1 + start and j2 - end > j1 + start and a[i2 - end - 1] == b[j2 - end - 1]:
+            end += 1
+        pieces = []
+        if start:
+            pieces.append(('equal', i1, i1 + start, j1, j1 + start))
+        pieces.extend(_diff_middle(a, b, i1 + start, i2 - end, j1 + start, j2 - end))
+        if end:
+            pieces.append(('equal', i2 - end, i2, j2 - end, j2))
+        stack.extend(reversed(pieces))
+    return _merge(opcodes)
+
+
+def _diff_middle(a, b, i1, i2, j1, j2):
+    """Pieces of a range with no common prefix or suffix: anchored sub-ranges, or final opcodes"""
+    if i1 == i2 and j1 == j2:
+        return []
+    if i1 == i2:
+        return [('insert', i1, i2, j1, j2)]
+    if j1 == j2:
+        return [('delete', i1, i2, j1, j2)]
+
+    counts_a = Counter(a[i1:i2])
+    counts_b = Counter(b[j1:j2])
+    positions_b = {b[j]: j for j in range(j1, j2) if counts_b[b[j]] == 1}
+    unique = [(i, positions_b[a[i]]) for i in range(i1, i2) if counts_a[a[i]] == 1 and a[i] in positions_b]
+    anchors = _longest_increasing(unique)
+    if not anchors:
+        if (i2 - i1) * (j2 - j1) > MAX_GAP_PRODUCT:
+            return [('replace', i1, i2, j1, j2)]
+        matcher = SequenceMatcher(None, a[i1:i2], b[j1:j2], autojunk=False)
+        return [(tag, i1 + a1, i1 + a2, j1 + b1, j1 + b2) for tag, a1, a2, b1, b2 in matcher.get_opcodes()]
+
+    pieces = []
+    last_i, last_j = i1, j1
+    for i, j in anchors:
+        pieces.append(('range', last_i, i, last_j, j))
+        pieces.append(('equal', i, i + 1, j, j + 1))
+        last_i, last_j = i + 1, j + 1
+    pieces.append(('range', last_i, i2, last_j, j2))
+    return pieces
+
+
+def _longest_increasing(pairs):
+    """Longest run of (i, j) pairs, in order of i, whose j also increases"""
+    tails = []
+    tail_indices = []
+    previous = [None] * len(pairs)
+    for index, (_, j) in enumerate(pairs):
+        position = bisect_left(tails, j)
+        if position:
+            previous[index] = tail_indices[position - 1]
+        if position == len(tails):
+            tails.append(j)
+            tail_indices.append(index)
+        else:
+            tails[position] = j
+            tail_indices[position] = index
+    run = []
+    index = tail_indices[-1] if tail_indices else None
+    while index is not None:
+        run.append(pairs[index])
+        index = previous[index]
+    return run[::-1]
+
+
+def _merge(opcodes):
+    merged = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if i1 == i2 and j1 == j2:
+            continue
+        if merged and merged[-1][0] == tag:
+            merged[-1] = (tag, merged[-1][1], i2, merged[-1][3], j2)
+        else:
+            merged.append((tag, i1, i2, j1, j2))
+    return merged
+
+
+def diff_words(old_text, new_text):
+    """Word-level diff of two clauses as a list of {'op': 'equal', 'delete' or 'insert', 'text'}"""
+    old_tokens = WORD_DIFF_RE.findall(old_text)
+    new_tokens = WORD_DIFF_RE.findall(new_text)
+    diff = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, old_tokens, new_tokens, autojunk=False).get_opcodes():
+        if tag == 'equal':
+            _append(diff, 'equal', ''.join(old_tokens[i1:i2]))
+        else:
+            _append(diff, 'delete', ''.join(old_tokens[i1:i2]))
+            _append(diff, 'insert', ''.join(new_tokens[j1:j2]))
+    return diff
+
+
+def _append(diff, op, text):
+    if not text:
+        return
+    if diff and diff[-1]['op'] == op:
+        diff[-1]['text'] += text
+    else:
+        diff.append({'op': op, 'text': text})
+
+
+def iter_clause_changes(old, new):
+    """Yield (change, old index, new index) for every clause of two segmented versions, in document order
+
+    change is 'unchanged', 'changed', 'inserted' or 'deleted'. Within a replaced run
+    of clauses, edited clauses are paired with their originals by similarity.
+    """
+    old_keys = [clause_key(segment['text']) for segment in old]
+    new_keys = [clause_key(segment['text']) for segment in new]
+    for tag, i1, i2, j1, j2 in diff_sequences(old_keys, new_keys):
+        if tag == 'equal':
+            for offset in range(i2 - i1):
+                yield 'unchanged', i1 + offset, j1 + offset
+        elif tag == 'delete':
+            for i in range(i1, i2):
+                yield 'deleted', i, None
+        elif tag == 'insert':
+            for j in range(j1, j2):
+                yield 'inserted', None, j
+        else:
+            alignment, removed = align_clauses([segment['text'] for segment in old[i1:i2]], [segment['text'] for segment in new[j1:j2]])
+            removed = set(removed)
+            next_old = 0
+            for offset, (revision, previous) in enumerate(alignment):
+                j = j1 + offset
+                if previous is None:
+                    yield 'inserted', None, j
+                    continue
+                # Clauses removed before this one's original
+                for k in range(next_old, previous):
+                    if k in removed:
+                        yield 'deleted', i1 + k, None
+                next_old = max(next_old, previous + 1)
+                yield ('unchanged' if old_keys[i1 + previous] == new_keys[j] else 'changed'), i1 + previous, j
+            for k in range(next_old, i2 - i1):
+                if k in removed:
+                    yield 'deleted', i1 + k, None
+
+
+def iter_section_diffs(old_text, new_text, totals=None):
+    """Yield the clause-level diff of two contract versions one section at a time
+
+    Sections follow the top-level clause numbers (or headings) of the revised
+    version. A deleted clause is reported in the section it was removed from: the
+    open section if that section holds clauses of the same original section,
+    otherwise a section of its own numbered and headed as in the original, so a
+    section deleted as a whole is reported under its own heading. Each section is
+    a dict with its 'section' number, 'heading', the count of 'unchanged' clauses
+    and its 'changes'; word-level diffs of changed clauses are only computed when
+    their section is yielded. Sections without changes are counted but not
+    yielded. Clause and section counts for the whole document are added to
+    `totals` as the diff proceeds.
+    """
+    old = segment_clauses(old_text)
+    new = segment_clauses(new_text)
+    totals = totals if totals is not None else {}
+    totals.update({'unchanged': 0, 'changed': 0, 'inserted': 0, 'deleted': 0, 'sections': 0, 'changed_sections': 0})
+    section = None
+    for change, i, j in iter_clause_changes(old, new):
+        segment = new[j] if j is not None else old[i]
+        if j is not None:
+            key = ('revised', _section_key(segment))
+        elif section is not None and _section_key(segment) in section['original_keys']:
+            key = section['key']
+        else:
+            key = ('original', _section_key(segment))
+        if section is None or key != section['key']:
+            if section is not None and section['changes']:
+                totals['changed_sections'] += 1
+                yield _render_section(section, old, new)
+            totals['sections'] += 1
+            section = {'key': key, 'section': _top_number(segment), 'heading': segment['heading'], 'unchanged': 0, 'changes': [], 'original_keys': set()}
+        if i is not None:
+            # Original sections whose clauses are in this one
+            section['original_keys'].add(_section_key(old[i]))
+        totals[change] += 1
+        if change == 'unchanged':
+            section['unchanged'] += 1
+        else:
+            section['changes'].append((change, i, j))
+    if section is not None and section['changes']:
+        totals['changed_sections'] += 1
+        yield _render_section(section, old, new)
+
+
+def _render_section(section, old, new):
+    changes = []
+    for change, i, j in section['changes']:
+        entry = {'change': change}
+        if j is not None:
+            entry.update({'clause_number': new[j]['number'], 'start': new[j]['start'], 'end': new[j]['end']})
+        if i is not None:
+            entry.update({'previous_clause_number': old[i]['number'], 'previous_start': old[i]['start'], 'previous_end': old[i]['end']})
+        if change == 'changed':
+            entry['diff'] = diff_words(old[i]['text'], new[j]['text'])
+        elif change == 'inserted':
+            entry['text'] = new[j]['text']
+        else:
+            entry['text'] = old[i]['text']
+        changes.append(entry)
+    return {'section': section['section'], 'heading': section['heading'], 'unchanged': section['unchanged'], 'changes': changes}
+
+
+def _top_number(segment):
+    return segment['number'].split('.')[0].split('(')[0] if segment['number'] else None
+
+
+def _section_key(segment):
+    return _top_number(segment) or segment['heading']
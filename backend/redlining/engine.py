@@ -0,0 +1,118 @@
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connection
+from core.ai_service import ai_service
+from core.streams import CancellationToken
+from .cache import verdict_cache
+from .classifier import clause_classifier
+from .triage import triage_engine
+from .utils import CLAUSE_PROMPT_VERSION, analyze_clause_batch, failed_analysis, iter_clause_analysis, plan_clause_batches
+
+
+class ClauseAnalysisEngine:
+    """Analyze document clauses concurrently with a bounded worker pool"""
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+
+    def get_worker_count(self):
+        """Size the worker pool to what the active provider can serve in parallel"""
+        if self.max_workers:
+            return self.max_workers
+        if ai_service.get_current_provider() == 'openai':
+            return getattr(settings, 'REDLINING_OPENAI_WORKERS', 8)
+        return getattr(settings, 'REDLINING_MISTRAL_WORKERS', 2) * len(ai_service.backends)
+
+    def iter_events(self, clauses, include_tokens=True, client=None, cancel=None):
+        """Yield ('token', clause_id, text) and ('result', clause_id, analysis) events as they complete
+
+        Clauses the local triage rules or the trained classifier are confident about never
+        reach the model. The rest are packed into multi-clause batches where the model context allows;
+        token events are only produced for clauses analyzed on their own. All model calls
+        count against the fair share of `client`. If the caller stops iterating early, or
+        `cancel` is cancelled, queued clauses are dropped and in-flight analyses aborted.
+        """
+        cancel = cancel or CancellationToken()
+        pending = []
+        for i, clause in enumerate(clauses):
+            if not clause.strip():
+                continue
+            # Boilerplate and known risky phrasings are classified by the local rules
+            local = triage_engine.classify(clause)
+            if local is not None:
+                yield 'result', i, local
+                continue
+            # Verdicts for previously seen clauses are returned without a model call
+            cached = verdict_cache.get(clause, 'general', CLAUSE_PROMPT_VERSION)
+            if cached is not None:
+                yield 'result', i, cached
+            else:
+                pending.append((i, clause))
+
+        # The trained classifier scores the remaining clauses in one batch and answers those it is sure of
+        local = clause_classifier.classify([clause for _, clause in pending])
+        for j in sorted(local):
+            yield 'result', pending[j][0], local[j]
+        pending = [item for j, item in enumerate(pending) if j not in local]
+        if not pending:
+            return
+
+        events = queue.Queue()
+
+        def single_worker(clause_id, clause_text):
+            try:
+                cancel.check()
+                for event, payload in iter_clause_analysis(clause_text, client=client, cancel=cancel, screened=True):
+                    if event == 'result' or include_tokens:
+                        events.put((event, clause_id, payload))
+            except Exception as e:
+                events.put(('result', clause_id, failed_analysis(e)))
+            finally:
+                connection.close()
+
+        def batch_worker(batch):
+            try:
+                cancel.check()
+                analyses = analyze_clause_batch(batch, client=client, cancel=cancel)
+            except Exception as e:
+                analyses = {clause_id: failed_analysis(e) for clause_id, _ in batch}
+            finally:
+                connection.close()
+            for clause_id, _ in batch:
+                events.put(('result', clause_id, analyses[clause_id]))
+
+        batches = plan_clause_batches(pending)
+        executor = ThreadPoolExecutor(max_workers=min(self.get_worker_count(), len(batches)))
+        remaining = len(pending)
+        try:
+            for batch in batches:
+                if len(batch) > 1:
+                    executor.submit(batch_worker, batch)
+                else:
+                    executor.submit(single_worker, *batch[0])
+
+            while remaining:
+                event, clause_id, payload = events.get()
+                if event == 'result':
+                    remaining -= 1
+                yield event, clause_id, payload
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            if remaining:
+                # Abandoned before every clause was analyzed: free the model right away
+                cancel.cancel()
+
+    def analyze(self, clauses, client=None):
+        """Analyze all clauses and return results in clause order"""
+        results = {}
+        for event, clause_id, analysis in self.iter_events(clauses, include_tokens=False, client=client):
+            analysis['clause_id'] = clause_id
+            analysis['clause_text'] = clauses[clause_id]
+            results[clause_id] = analysis
+
+        return [results[clause_id] for clause_id in sorted(results)]
+
+
+# Global clause analysis engine
+clause_engine = ClauseAnalysisEngine()
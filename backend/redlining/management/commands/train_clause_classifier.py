@@ -0,0 +1,78 @@
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from core.ai_service import ai_service
+from redlining.classifier import ClauseClassifier, clause_classifier, load_training_data
+from redlining.utils import CLAUSE_VERDICT_SCHEMA, build_clause_messages
+
+
+class Command(BaseCommand):
+    help = "Train the local clause classifier on cached model verdicts and report how it compares with the model"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', help="Only train on verdicts of this model")
+        parser.add_argument('--holdout', type=float, default=0.2, help="Share of clauses held out to evaluate against the model's verdicts")
+        parser.add_argument('--min-samples', type=int, default=200, help="Refuse to train on fewer labelled clauses")
+        parser.add_argument('--epochs', type=int, default=300)
+        parser.add_argument('--threshold', type=float, default=clause_classifier.threshold, help="Confidence above which the local verdict is used")
+        parser.add_argument('--llm-sample', type=int, default=0, help="Held-out clauses to send to the model to measure its latency")
+        parser.add_argument('--output', default=clause_classifier.path, help="Where to write the trained model")
+        parser.add_argument('--dry-run', action='store_true', help="Evaluate without writing the model")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        texts, labels = load_training_data(options['model'])
+        if len(texts) < options['min_samples']:
+            raise CommandError(f"Only {len(texts)} labelled clauses in the verdict cache, {options['min_samples']} required")
+
+        samples = list(zip(texts, labels))
+        random.Random(options['seed']).shuffle(samples)
+        held_out = int(len(samples) * options['holdout'])
+        train, test = samples[held_out:], samples[:held_out]
+        self.stdout.write(f"{len(samples)} labelled clauses: " + ", ".join(f"{level} {labels.count(level)}" for level in ('red', 'amber', 'green')))
+
+        if test:
+            started = time.perf_counter()
+            classifier = ClauseClassifier(threshold=options['threshold']).fit(*zip(*train), epochs=options['epochs'])
+            self.stdout.write(f"Trained on {len(train)} clauses in {time.perf_counter() - started:.1f}s")
+            self.evaluate(classifier, test, options)
+
+        started = time.perf_counter()
+        classifier = ClauseClassifier(threshold=options['threshold']).fit(texts, labels, epochs=options['epochs'])
+        self.stdout.write(f"Trained on all {len(texts)} clauses in {time.perf_counter() - started:.1f}s ({len(classifier.vocabulary)} terms)")
+        if options['dry_run']:
+            return
+        path = classifier.save(options['output'], samples=len(texts), model=options['model'] or 'all')
+        self.stdout.write(self.style.SUCCESS(f"Saved clause classifier to {path}"))
+
+    def evaluate(self, classifier, test, options):
+        """Agreement with the model's verdicts on held-out clauses, and latency of both"""
+        texts = [text for text, _ in test]
+        started = time.perf_counter()
+        probabilities = classifier.predict_proba(texts)
+        elapsed = time.perf_counter() - started
+        predicted = [classifier.classes[i] for i in probabilities.argmax(axis=1)]
+        confident = probabilities.max(axis=1) >= options['threshold']
+
+        pairs = [(label, prediction) for (_, label), prediction in zip(test, predicted)]
+        local = [pair for pair, is_confident in zip(pairs, confident) if is_confident]
+        agreement = sum(1 for label, prediction in pairs if label == prediction) / len(pairs)
+        local_agreement = sum(1 for label, prediction in local if label == prediction) / len(local) if local else 0.0
+        # A red clause passed locally as anything else is the costly mistake
+        missed_red = sum(1 for label, prediction in local if label == 'red' and prediction != 'red')
+
+        self.stdout.write(f"\nHeld out {len(test)} clauses")
+        self.stdout.write(f"  Agreement with the model: {agreement:.1%} overall, {local_agreement:.1%} above the {options['threshold']} threshold")
+        self.stdout.write(f"  Answered locally: {len(local)}/{len(test)} ({len(local) / len(test):.0%}), red clauses missed: {missed_red}")
+        self.stdout.write(f"  Classifier latency: {elapsed * 1000:.1f} ms for the batch, {elapsed / len(test) * 1e6:.0f} µs per clause")
+
+        if options['llm_sample']:
+            latencies = []
+            for text, _ in test[:options['llm_sample']]:
+                started = time.monotonic()
+                ai_service.generate_response(build_clause_messages(text), temperature=0.3, use_cache=False, task='classification', response_format=CLAUSE_VERDICT_SCHEMA)
+                latencies.append(time.monotonic() - started)
+            mean = statistics.mean(latencies)
+            self.stdout.write(f"  Model latency: {mean * 1000:.0f} ms per clause over {len(latencies)} clauses ({mean / (elapsed / len(test)):.0f}x the classifier)")
+        self.stdout.write("")
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('redlining', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clauseverdict',
+            name='clause_text',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
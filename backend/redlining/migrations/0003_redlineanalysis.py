@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('redlining', '0002_clauseverdict_clause_text'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RedlineAnalysis',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('content_hash', models.CharField(db_index=True, max_length=64)),
+                ('results', models.JSONField(default=list)),
+                ('summary', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('previous', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='revisions', to='redlining.redlineanalysis')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
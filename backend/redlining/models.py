@@ -0,0 +1,40 @@
+from django.db import models
+from django.utils import timezone
+
+
+class ClauseVerdict(models.Model):
+    """Cached AI verdict for a clause, keyed by its normalized text and the analysis setup"""
+    
+    cache_key = models.CharField(max_length=64, unique=True)
+    clause_text = models.TextField(blank=True, default='')
+    clause_type = models.CharField(max_length=50, default='general')
+    prompt_version = models.CharField(max_length=20)
+    provider = models.CharField(max_length=20)
+    model = models.CharField(max_length=100)
+    verdict = models.JSONField()
+    created_at = models.DateTimeField(default=timezone.now)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+    hit_count = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.provider}/{self.model} {self.cache_key[:12]}"
+    
+    class Meta:
+        ordering = ['-last_used_at']
+
+
+class RedlineAnalysis(models.Model):
+    """Clause verdicts of one analyzed version of a document, the baseline for redlining its next version"""
+    
+    previous = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='revisions')
+    version = models.PositiveIntegerField(default=1)
+    content_hash = models.CharField(max_length=64, db_index=True)
+    results = models.JSONField(default=list)
+    summary = models.JSONField(default=dict)
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"Analysis {self.pk} (version {self.version})"
+    
+    class Meta:
+        ordering = ['-created_at']
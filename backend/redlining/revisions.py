@@ -0,0 +1,129 @@
+import hashlib
+import re
+from collections import defaultdict, deque
+from difflib import SequenceMatcher
+from django.conf import settings
+from .segmenter import NUMBER_RE
+from .utils import FAILED_EXPLANATION_PREFIX, UNPARSED_EXPLANATION
+
+WORD_RE = re.compile(r'\w+')
+
+# Result fields that describe where a clause sits rather than what it says
+LOCATION_FIELDS = ('clause_id', 'clause_text', 'start', 'end', 'clause_number', 'heading', 'revision', 'previous_clause_id')
+
+
+def clause_words(clause_text):
+    """Words of a clause without its number, ignoring case, whitespace and punctuation"""
+    text = clause_text.strip()
+    marker = NUMBER_RE.match(text)
+    if marker:
+        text = text[marker.end():]
+    return WORD_RE.findall(text.casefold())
+
+
+def clause_hash(clause_text):
+    """Hash of a clause's wording, stable across renumbering and reformatting"""
+    return hashlib.sha1(' '.join(clause_words(clause_text)).encode('utf-8')).hexdigest()
+
+
+def align_clauses(previous_texts, texts, match_ratio=None, max_candidates=50):
+    """Align the clauses of a new version with those of the previous one
+
+    Clauses with the same wording are paired by hash, in order, wherever they moved.
+    Each remaining clause is then compared with the unpaired previous clauses between
+    its paired neighbours, and paired with the most similar one if at least
+    match_ratio of their words line up. Returns one (revision, previous index) pair
+    per clause, where revision is 'unchanged', 'changed' or 'inserted', and the
+    indices of previous clauses that were removed.
+    """
+    match_ratio = match_ratio or getattr(settings, 'REDLINING_REVISION_MATCH_RATIO', 0.6)
+    by_hash = defaultdict(deque)
+    for j, text in enumerate(previous_texts):
+        by_hash[clause_hash(text)].append(j)
+
+    matches = [None] * len(texts)
+    revisions = ['inserted'] * len(texts)
+    for i, text in enumerate(texts):
+        candidates = by_hash.get(clause_hash(text))
+        if candidates:
+            matches[i] = candidates.popleft()
+            revisions[i] = 'unchanged'
+    unpaired = sorted(j for candidates in by_hash.values() for j in candidates)
+
+    if unpaired:
+        # Nearest paired previous index before and after every clause bound its candidates
+        before = [-1] * len(texts)
+        last = -1
+        for i, j in enumerate(matches):
+            before[i] = last
+            if j is not None:
+                last = j
+        after = [len(previous_texts)] * len(texts)
+        last = len(previous_texts)
+        for i in range(len(texts) - 1, -1, -1):
+            after[i] = last
+            if matches[i] is not None:
+                last = matches[i]
+
+        words = {}
+        available = set(unpaired)
+        for i, text in enumerate(texts):
+            if matches[i] is not None or not available:
+                continue
+            candidates = [j for j in unpaired if before[i] < j < after[i] and j in available][:max_candidates]
+            current = clause_words(text)
+            best, best_ratio = None, match_ratio
+            for j in candidates:
+                if j not in words:
+                    words[j] = clause_words(previous_texts[j])
+                matcher = SequenceMatcher(None, words[j], current, autojunk=False)
+                if matcher.real_quick_ratio() < best_ratio or matcher.quick_ratio() < best_ratio:
+                    continue
+                ratio = matcher.ratio()
+                if ratio >= best_ratio:
+                    best, best_ratio = j, ratio
+            if best is not None:
+                matches[i] = best
+                revisions[i] = 'changed'
+                available.discard(best)
+                for k in range(i + 1, len(texts)):
+                    # Later clauses are only paired after this one
+                    if before[k] >= best:
+                        break
+                    before[k] = best
+                    if matches[k] is not None:
+                        break
+
+    paired = {j for j in matches if j is not None}
+    removed = [j for j in range(len(previous_texts)) if j not in paired]
+    return list(zip(revisions, matches)), removed
+
+
+def can_carry_forward(previous_result):
+    """Whether a previous clause result is a verdict, rather than a placeholder for a failed or unparsed analysis"""
+    if previous_result.get('source') == 'fallback' or previous_result.get('confidence') == 0:
+        return False
+    # Placeholders stored before they were marked with their source
+    explanation = previous_result.get('explanation') or ''
+    return explanation != UNPARSED_EXPLANATION and not explanation.startswith(FAILED_EXPLANATION_PREFIX)
+
+
+def carry_forward(previous_result):
+    """The verdict of a previous clause result, without its location in the old version"""
+    return {k: v for k, v in previous_result.items() if k not in LOCATION_FIELDS}
+
+
+def revision_summary(alignment, removed, reused):
+    """Counts of unchanged, changed, inserted and removed clauses, and of verdicts reused versus recomputed
+
+    reused is the number of unchanged clauses whose previous verdict was carried forward.
+    """
+    revisions = [revision for revision, _ in alignment]
+    return {
+        'unchanged_clauses': revisions.count('unchanged'),
+        'changed_clauses': revisions.count('changed'),
+        'inserted_clauses': revisions.count('inserted'),
+        'removed_clauses': len(removed),
+        'reused_verdicts': reused,
+        'recomputed_verdicts': len(revisions) - reused,
+    }
@@ -0,0 +1,172 @@
+import re
+from django.conf import settings
+from .cache import normalize_clause_text
+
+# Clause numbers at the start of a line: 1. / 2) / 1.2 / 1.2.3. / Section 4 / Article IV / Clause 7
+NUMBER_RE = re.compile(
+    r'(?:(?:section|article|clause)\s+(?P<word>\d{1,3}(?:\.\d{1,3})*|[ivxlc]{1,6})\b[.:]?'
+    r'|(?P<decimal>\d{1,3}(?:\.\d{1,3})+)\.?(?=\s)'
+    r'|(?P<single>\d{1,3})[.)](?=\s))\s*',
+    re.IGNORECASE
+)
+
+# Sub-items inside a clause: (a) / (iv) / (2) / a. / b)
+ITEM_RE = re.compile(r'(?:\((?P<paren>[a-z]{1,4}|\d{1,2})\)|(?P<bare>[a-z])[.)])\s+', re.IGNORECASE)
+
+# A heading run into the clause text: "2. Confidentiality. The Receiving Party shall..."
+INLINE_HEADING_RE = re.compile(r'([A-Z][^.:;,]{0,60})[.:]\s+(?=\S)')
+
+RECITAL_RE = re.compile(r'(?:whereas\b|now,?\s+therefore\b)', re.IGNORECASE)
+
+BLANK_LINE_RE = re.compile(r'\n[ \t\r\f\v]*\n')
+
+SENTENCE_END_RE = re.compile(r'(?<=[.;])\s+(?=[A-Z(])')
+
+
+def segment_clauses(text, max_chars=None, min_chars=None):
+    """Split a contract into unique clauses with their character offsets, in one pass over its lines
+
+    A clause starts at every numbered line (1., 2.3, Section 4, Article IV), every
+    recital (WHEREAS, NOW THEREFORE) and every paragraph. Lettered sub-items such as
+    (a) stay with the clause they belong to unless it would grow past max_chars, and
+    headings are attached to the clauses below them instead of being clauses
+    themselves. Paragraphs are separated by blank lines, or by line breaks in text
+    that has no blank lines. Paragraphs longer than max_chars are split at sentence
+    ends. Repeated clauses (ignoring case and whitespace) are only returned once.
+
+    Returns dicts with 'text' (always text[start:end]), 'start', 'end', 'number'
+    (e.g. '3.2' or '3.2(a)', or the number of the section heading above), 'heading'
+    and 'kind' ('numbered', 'recital', 'paragraph' or 'item').
+    """
+    max_chars = max_chars or getattr(settings, 'REDLINING_MAX_CLAUSE_CHARS', 1500)
+    min_chars = min_chars or getattr(settings, 'REDLINING_MIN_CLAUSE_CHARS', 20)
+    blank_separated = BLANK_LINE_RE.search(text) is not None
+
+    segments = []
+    current = None
+    heading = None
+    section = None
+    after_break = True
+    position = 0
+    for line in text.split('\n'):
+        line_start = position + len(line) - len(line.lstrip())
+        stripped = line.strip()
+        line_end = line_start + len(stripped)
+        position += len(line) + 1
+
+        if not stripped:
+            after_break = True
+            continue
+        paragraph_start = after_break or not blank_separated
+        after_break = False
+
+        marker = NUMBER_RE.match(stripped)
+        number = None
+        if marker:
+            number = marker.group('word') or marker.group('decimal') or marker.group('single')
+        body = stripped[marker.end():] if marker else stripped
+
+        if RECITAL_RE.match(stripped):
+            current = _open(segments, current, line_start, line_end, None, heading, 'recital')
+            continue
+        if _is_heading(body):
+            current = _close(segments, current)
+            heading = body.rstrip('.:').strip() or heading
+            section = number
+            continue
+        if marker:
+            inline = INLINE_HEADING_RE.match(body)
+            inline_heading = inline.group(1) if inline and _is_heading(inline.group(1)) else None
+            if '.' not in number:
+                # A top-level clause starts a new section
+                section = number
+                heading = inline_heading
+            current = _open(segments, current, line_start, line_end, number, inline_heading or heading, 'numbered')
+            continue
+
+        item = ITEM_RE.match(stripped)
+        if item and current is not None:
+            parent = current['parent'] if current['kind'] == 'item' else current['number']
+            if line_end - current['start'] <= max_chars:
+                # Items read as part of the sentence that introduces them
+                current['end'] = line_end
+                continue
+            label = item.group('paren') or item.group('bare')
+            current = _open(segments, current, line_start, line_end, f"{parent}({label})" if parent else None, heading, 'item')
+            current['parent'] = parent
+            continue
+
+        if paragraph_start or current is None:
+            current = _open(segments, current, line_start, line_end, section, heading, 'paragraph')
+        else:
+            # A wrapped line of the clause in progress
+            current['end'] = line_end
+    _close(segments, current)
+
+    clauses = []
+    seen = set()
+    for segment in segments:
+        for start, end in _split_long(text, segment['start'], segment['end'], max_chars):
+            clause_text = text[start:end]
+            if len(clause_text) < min_chars and segment['kind'] == 'paragraph':
+                continue
+            if not any(char.isalpha() for char in clause_text):
+                continue
+            key = normalize_clause_text(clause_text)
+            if key in seen:
+                continue
+            seen.add(key)
+            clauses.append({
+                'text': clause_text,
+                'start': start,
+                'end': end,
+                'number': segment['number'],
+                'heading': segment['heading'],
+                'kind': segment['kind'],
+            })
+    return clauses
+
+
+def _open(segments, current, start, end, number, heading, kind):
+    _close(segments, current)
+    return {'start': start, 'end': end, 'number': number, 'heading': heading, 'kind': kind, 'parent': None}
+
+
+def _close(segments, current):
+    if current is not None:
+        segments.append(current)
+    return None
+
+
+def _is_heading(text):
+    """Whether a line (without its number) reads as a heading rather than clause text"""
+    words = text.rstrip('.:').split()
+    if not words or len(words) > 10 or len(text) > 100 or text[-1] in ',;':
+        return False
+    if text.endswith('.') and len(words) > 4:
+        # A short sentence
+        return False
+    if not any(char.isalpha() for char in text):
+        return False
+    if text.isupper():
+        return True
+    return all(word[0].isupper() for word in words if len(word) > 3 and word[0].isalpha())
+
+
+def _split_long(text, start, end, max_chars):
+    """Split text[start:end] at sentence ends into spans of at most max_chars where possible"""
+    if end - start <= max_chars:
+        return [(start, end)]
+    spans = []
+    span_start = start
+    last_break = None
+    for match in SENTENCE_END_RE.finditer(text, start, end):
+        if match.start() - span_start > max_chars and last_break is not None:
+            spans.append((span_start, last_break[0]))
+            span_start = last_break[1]
+        last_break = (match.start(), match.end())
+    if end - span_start > max_chars and last_break is not None and last_break[1] > span_start:
+        spans.append((span_start, last_break[0]))
+        span_start = last_break[1]
+    spans.append((span_start, end))
+    return spans
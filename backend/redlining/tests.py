@@ -0,0 +1,182 @@
+import json
+import os
+import random
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+from django.test import SimpleTestCase
+from core.ai_service import ai_service
+from .cache import verdict_cache
+from .classifier import clause_classifier
+from .compare import diff_sequences, diff_words, iter_section_diffs
+from .engine import ClauseAnalysisEngine
+from .triage import TriageEngine, triage_engine
+from .utils import failed_analysis
+from .views import reuse_previous_verdicts
+
+ORIGINAL = """1. Definitions
+1.1 Confidential Information means any information disclosed by either party.
+1.2 Affiliate means any entity controlling a party.
+
+2. Non-Solicitation
+2.1 Neither party shall solicit the employees of the other party for two years.
+2.2 This clause does not apply to general advertisements for open positions.
+
+3. Term
+3.1 This Agreement remains in force for three years from the Effective Date.
+"""
+
+
+class SectionDiffTests(SimpleTestCase):
+    def test_deleted_section_is_reported_under_its_own_heading(self):
+        revised = ORIGINAL.replace(
+            "2. Non-Solicitation\n"
+            "2.1 Neither party shall solicit the employees of the other party for two years.\n"
+            "2.2 This clause does not apply to general advertisements for open positions.\n\n",
+            ""
+        ).replace("3. Term\n3.1", "2. Term\n2.1")
+        totals = {}
+        sections = list(iter_section_diffs(ORIGINAL, revised, totals))
+
+        self.assertEqual(len(sections), 1)
+        self.assertEqual(sections[0]['section'], '2')
+        self.assertEqual(sections[0]['heading'], 'Non-Solicitation')
+        self.assertEqual([change['change'] for change in sections[0]['changes']], ['deleted', 'deleted'])
+        self.assertEqual([change['previous_clause_number'] for change in sections[0]['changes']], ['2.1', '2.2'])
+        self.assertEqual(totals['deleted'], 2)
+        self.assertEqual(totals['unchanged'], 3)
+
+    def test_deleted_clause_stays_in_its_surviving_section(self):
+        revised = ORIGINAL.replace("1.2 Affiliate means any entity controlling a party.\n", "")
+        sections = list(iter_section_diffs(ORIGINAL, revised))
+
+        self.assertEqual(len(sections), 1)
+        self.assertEqual(sections[0]['heading'], 'Definitions')
+        self.assertEqual(sections[0]['unchanged'], 1)
+        self.assertEqual([change['previous_clause_number'] for change in sections[0]['changes']], ['1.2'])
+
+
+class ClauseDiffTests(SimpleTestCase):
+    def apply(self, a, b, opcodes):
+        """Rebuild b from a and the opcodes, checking they cover both sequences in order"""
+        rebuilt, i, j = [], 0, 0
+        for tag, i1, i2, j1, j2 in opcodes:
+            self.assertEqual((i1, j1), (i, j))
+            if tag == 'equal':
+                self.assertEqual(a[i1:i2], b[j1:j2])
+                rebuilt.extend(a[i1:i2])
+            else:
+                rebuilt.extend(b[j1:j2])
+            i, j = i2, j2
+        self.assertEqual((i, j), (len(a), len(b)))
+        return rebuilt
+
+    def test_opcodes_turn_one_sequence_into_the_other(self):
+        rng = random.Random(7)
+        for _ in range(200):
+            a = [rng.choice('abcdefgh') for _ in range(rng.randint(0, 30))]
+            b = [rng.choice('abcdefgh') for _ in range(rng.randint(0, 30))]
+            self.assertEqual(self.apply(a, b, diff_sequences(a, b)), b)
+
+    def test_single_edit_in_a_long_document_is_isolated(self):
+        a = [f"clause {i}" for i in range(20000)]
+        b = a[:12000] + ["clause 12000, as amended"] + a[12001:]
+        opcodes = diff_sequences(a, b)
+        self.assertEqual(opcodes, [('equal', 0, 12000, 0, 12000), ('replace', 12000, 12001, 12000, 12001), ('equal', 12001, 20000, 12001, 20000)])
+
+    def test_word_diff_reproduces_both_versions(self):
+        old = "The Recipient shall keep the information secret for two years."
+        new = "The Recipient shall keep all information strictly secret for five years."
+        diff = diff_words(old, new)
+        self.assertEqual(''.join(part['text'] for part in diff if part['op'] != 'insert'), old)
+        self.assertEqual(''.join(part['text'] for part in diff if part['op'] != 'delete'), new)
+        self.assertIn({'op': 'insert', 'text': 'five'}, diff)
+
+    def test_changed_and_inserted_clauses_are_reported_with_renumbering_ignored(self):
+        revised = ORIGINAL.replace("1.2 Affiliate means any entity controlling a party.\n", "").replace(
+            "2.1 Neither party shall solicit the employees of the other party for two years.",
+            "2.1 Neither party shall solicit the employees of the other party for one year."
+        ).replace("3.1 This Agreement", "3.1 This Agreement may be terminated on notice.\n3.2 This Agreement")
+        totals = {}
+        sections = {section['section']: section for section in iter_section_diffs(ORIGINAL, revised, totals)}
+
+        self.assertEqual([change['change'] for change in sections['2']['changes']], ['changed'])
+        self.assertIn({'op': 'insert', 'text': 'one'}, sections['2']['changes'][0]['diff'])
+        self.assertEqual([(change['change'], change['clause_number']) for change in sections['3']['changes']], [('inserted', '3.1')])
+        self.assertEqual(sections['3']['unchanged'], 1)
+        self.assertEqual({key: totals[key] for key in ('unchanged', 'changed', 'inserted', 'deleted')}, {'unchanged': 3, 'changed': 1, 'inserted': 1, 'deleted': 1})
+
+
+class TriageTests(SimpleTestCase):
+    def setUp(self):
+        self.engine = TriageEngine()
+
+    def assertEscalated(self, clause_text):
+        self.assertIsNone(self.engine.classify(clause_text))
+
+    def test_standard_boilerplate_is_green(self):
+        for clause_text, rule in [
+            ("This Agreement constitutes the entire agreement between the parties with respect to its subject matter and supersedes all prior agreements.", 'entire_agreement'),
+            ("If any provision of this Agreement is held invalid or unenforceable, the remaining provisions shall continue in full force and effect.", 'severability'),
+            ("Upon request, the Receiving Party shall promptly return or destroy all Confidential Information in its possession.", 'return_or_destroy'),
+        ]:
+            verdict = self.engine.classify(clause_text)
+            self.assertEqual((verdict['risk_level'], verdict['rule']), ('green', rule))
+
+    def test_boilerplate_phrase_does_not_vouch_for_extra_obligations(self):
+        self.assertEscalated("Upon request, the Recipient shall return or destroy all Confidential Information, failing which the Recipient shall pay a penalty of USD 1,000,000 per day.")
+        self.assertEscalated("This Agreement constitutes the entire agreement between the parties and the Recipient irrevocably waives all rights to seek any remedy.")
+        self.assertEscalated("Notices shall be in writing. The Discloser may terminate this Agreement immediately and retain all fees paid.")
+        self.assertEscalated("2. The Recipient shall (a) keep the Confidential Information secret; (b) not disclose it to any third party; and (c) not use information unless it becomes publicly available through no fault of the Recipient.")
+
+    def test_every_matching_rule_is_checked(self):
+        rules = {'rules': [
+            {'id': 'safe', 'verdict': 'green', 'confidence': 95, 'patterns': ['counterparts of this'], 'explanation': ''},
+            {'id': 'risky', 'verdict': 'red', 'confidence': 95, 'patterns': ['this agreement'], 'explanation': ''},
+        ]}
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump(rules, f)
+        self.addCleanup(os.remove, f.name)
+        engine = TriageEngine(rules_path=f.name)
+        # The matches overlap, so a single combined scan would only see the first rule
+        self.assertEqual({rule['id'] for rule in engine.match("Counterparts of this Agreement")[0]}, {'safe', 'risky'})
+        self.assertIsNone(engine.classify("Counterparts of this Agreement"))
+
+
+class ClauseAnalysisEngineTests(SimpleTestCase):
+    def test_clause_sent_to_the_model_is_screened_once(self):
+        clause = "The Recipient shall not reverse engineer any sample provided by the Discloser."
+        verdict = '{"risk_level": "amber", "explanation": "Review", "suggestions": "", "confidence": 70}'
+        with mock.patch.object(verdict_cache, 'get', return_value=None) as cache_get, \
+                mock.patch.object(verdict_cache, 'set'), \
+                mock.patch.object(triage_engine, 'classify', wraps=triage_engine.classify) as classify, \
+                mock.patch.object(clause_classifier, 'classify', return_value={}), \
+                mock.patch.object(ai_service, 'stream_response', return_value=iter([verdict])):
+            results = ClauseAnalysisEngine(max_workers=1).analyze([clause])
+
+        self.assertEqual(results[0]['risk_level'], 'amber')
+        self.assertEqual(classify.call_count, 1)
+        self.assertEqual(cache_get.call_count, 1)
+
+
+class ReusePreviousVerdictsTests(SimpleTestCase):
+    CLAUSES = [
+        "1. The Recipient shall keep the Confidential Information secret.",
+        "2. This Agreement is governed by the laws of England.",
+        "3. The Recipient may disclose information required by law.",
+    ]
+
+    def test_only_real_verdicts_are_carried_forward(self):
+        previous = SimpleNamespace(results=[
+            {'clause_id': 0, 'clause_text': self.CLAUSES[0], 'risk_level': 'green', 'explanation': 'Standard', 'suggestions': '', 'confidence': 90},
+            dict(failed_analysis(TimeoutError("timed out")), clause_id=1, clause_text=self.CLAUSES[1]),
+            # An unparsed response stored before placeholders were marked with their source
+            {'clause_id': 2, 'clause_text': self.CLAUSES[2], 'risk_level': 'amber', 'explanation': 'Unable to parse AI response', 'suggestions': 'Manual review recommended', 'confidence': 50},
+        ])
+        results, alignment, removed = reuse_previous_verdicts(previous, self.CLAUSES)
+
+        self.assertEqual(list(results), [0])
+        self.assertEqual(results[0]['risk_level'], 'green')
+        self.assertNotIn('clause_text', results[0])
+        self.assertEqual([revision for revision, _ in alignment], ['unchanged'] * 3)
+        self.assertEqual(removed, [])
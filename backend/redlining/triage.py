@@ -0,0 +1,153 @@
+import json
+import logging
+import re
+import threading
+from pathlib import Path
+from django.conf import settings
+from .segmenter import NUMBER_RE, SENTENCE_END_RE
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES_PATH = Path(__file__).parent.parent / 'prompts' / 'redlining' / 'triage_rules.json'
+
+
+class TriageEngine:
+    """Classify clauses locally against known safe and risky phrasings before they reach the model
+
+    Every rule is matched on its own, so all rules a clause matches are known, and
+    the clause type keywords get a combined expression. A clause gets a local
+    verdict only when all rules it matches agree and one of them is confident
+    enough. A green verdict also requires the safe phrasing to account for the
+    clause: the clause must be short, have no obligation or remedy language (the
+    rule file's operative terms) outside the matched text, and be either a single
+    sentence or mostly matched text, so that a boilerplate phrase cannot vouch for
+    the rest of the clause. Everything else goes to the model.
+    """
+
+    def __init__(self, rules_path=None, min_confidence=None, max_safe_chars=None, min_safe_coverage=None):
+        self.rules_path = rules_path or getattr(settings, 'REDLINING_TRIAGE_RULES_PATH', '') or DEFAULT_RULES_PATH
+        self.min_confidence = min_confidence or getattr(settings, 'REDLINING_TRIAGE_MIN_CONFIDENCE', 85)
+        self.max_safe_chars = max_safe_chars or getattr(settings, 'REDLINING_TRIAGE_MAX_SAFE_CHARS', 400)
+        self.min_safe_coverage = min_safe_coverage or getattr(settings, 'REDLINING_TRIAGE_MIN_SAFE_COVERAGE', 0.6)
+        self.enabled = getattr(settings, 'REDLINING_TRIAGE_ENABLED', True)
+        self.rules = []
+        self.clause_types = []
+        self.matchers = []
+        self.type_matcher = None
+        self.operative_matcher = None
+        self._lock = threading.Lock()
+        self.stats = {'clauses': 0, 'green': 0, 'amber': 0, 'red': 0, 'escalated': 0}
+        self.load()
+
+    def load(self, rules_path=None):
+        """(Re)load the rule file and compile its rules and clause types"""
+        self.rules_path = rules_path or self.rules_path
+        try:
+            with open(self.rules_path, encoding='utf-8') as f:
+                config = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Triage rules could not be loaded from {self.rules_path}: {e}")
+            config = {}
+
+        rules = config.get('rules', [])
+        clause_types = config.get('clause_types', [])
+        operative_terms = config.get('operative_terms', [])
+        try:
+            self.matchers = [self._compile(rule['patterns']) for rule in rules]
+            self.type_matcher = self._compile(rf"(?P<t{i}>\b(?:{'|'.join(keywords)}))" for i, (_, keywords) in enumerate(clause_types))
+            self.operative_matcher = self._compile(rf"\b(?:{term})" for term in operative_terms)
+        except (re.error, KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Triage rules in {self.rules_path} are invalid: {e}")
+            self.matchers, self.type_matcher, self.operative_matcher = [], None, None
+            rules, clause_types = [], []
+
+        self.rules = rules
+        self.clause_types = [clause_type for clause_type, _ in clause_types]
+
+    def _compile(self, alternatives):
+        pattern = '|'.join(alternatives)
+        return re.compile(pattern, re.IGNORECASE | re.MULTILINE) if pattern else None
+
+    def match(self, clause_text):
+        """Return (matched rules, clause type) for a clause"""
+        return [rule for rule, _ in self._matches(clause_text)], self._clause_type(clause_text)
+
+    def _matches(self, clause_text):
+        """Every rule that matches a clause, with the (start, end) spans of its matches"""
+        matches = []
+        for rule, matcher in zip(self.rules, self.matchers):
+            spans = [match.span() for match in matcher.finditer(clause_text) if match.end() > match.start()]
+            if spans:
+                matches.append((rule, spans))
+        return matches
+
+    def _clause_type(self, clause_text):
+        types = set()
+        if self.type_matcher is not None:
+            types = {int(match.lastgroup[1:]) for match in self.type_matcher.finditer(clause_text)}
+        # Types keep the priority order of the rule file, not the order they appear in the clause
+        return self.clause_types[min(types)] if types else 'general'
+
+    def classify(self, clause_text):
+        """Return a local verdict for a clause, or None if it has to be escalated to the model"""
+        if not self.enabled:
+            return None
+
+        clause_text = clause_text.strip()
+        verdict = self._decide(clause_text, self._matches(clause_text))
+        with self._lock:
+            self.stats['clauses'] += 1
+            self.stats[verdict['risk_level'] if verdict else 'escalated'] += 1
+        if verdict is not None:
+            verdict['clause_type'] = self._clause_type(clause_text)
+        return verdict
+
+    def _decide(self, clause_text, matches):
+        rules = [rule for rule, _ in matches]
+        if not rules or len({rule['verdict'] for rule in rules}) > 1:
+            # Nothing known, or known safe and risky phrasings in the same clause
+            return None
+        rule = max(rules, key=lambda rule: rule.get('confidence', 0))
+        if rule.get('confidence', 0) < self.min_confidence:
+            return None
+        if rule['verdict'] == 'green' and not self._is_accounted_for(clause_text, [span for _, spans in matches for span in spans]):
+            return None
+        return {
+            'risk_level': rule['verdict'],
+            'explanation': rule['explanation'],
+            'suggestions': rule.get('suggestions', 'No changes needed' if rule['verdict'] == 'green' else 'Review recommended'),
+            'confidence': rule['confidence'],
+            'source': 'rules',
+            'rule': rule['id'],
+        }
+
+    def _is_accounted_for(self, clause_text, spans):
+        """Whether the matched safe phrasings leave nothing in a clause that needs review"""
+        if len(clause_text) > self.max_safe_chars:
+            return False
+        marker = NUMBER_RE.match(clause_text)
+        start = marker.end() if marker else 0
+        covered = set()
+        for span_start, span_end in spans:
+            covered.update(range(max(span_start, start), span_end))
+        # What is left once the matched text is blanked out must not add obligations or remedies
+        rest = ''.join(' ' if i in covered else char for i, char in enumerate(clause_text))[start:]
+        if self.operative_matcher is not None and self.operative_matcher.search(rest):
+            return False
+        if len(SENTENCE_END_RE.split(clause_text[start:])) == 1:
+            return True
+        return len(covered) / max(len(clause_text) - start, 1) >= self.min_safe_coverage
+
+    def get_stats(self):
+        """Get triage statistics"""
+        with self._lock:
+            stats = dict(self.stats)
+        local = stats['clauses'] - stats['escalated']
+        stats['enabled'] = self.enabled
+        stats['rules'] = len(self.rules)
+        stats['local_rate'] = round(local / stats['clauses'], 3) if stats['clauses'] else 0.0
+        return stats
+
+
+# Global triage engine
+triage_engine = TriageEngine()
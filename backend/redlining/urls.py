@@ -5,4 +5,6 @@ urlpatterns = [
     path('analyze/', views.analyze_document, name='analyze_document'),
     path('analyze/streaming/', views.analyze_document_streaming, name='analyze_document_streaming'),
     path('analyze-clause/', views.analyze_single_clause, name='analyze_single_clause'),
+    path('compare/', views.compare_documents, name='compare_documents'),
+    path('cache/', views.verdict_cache_stats, name='verdict_cache_stats'),
 ] 
\ No newline at end of file
@@ -1,35 +1,21 @@
-import re
+import hashlib
+import json
+from django.conf import settings
 from core.ai_service import ai_service
+from core.streams import StreamCancelled
+from core.structured import extract_json
+from core.tokens import estimate_tokens
+from .cache import verdict_cache
+from .segmenter import segment_clauses
+from .triage import triage_engine
 
 
 def extract_clauses(document_content):
-    """Extract clauses from document content"""
-    # Simple clause extraction - split by common legal section markers
-    clause_patterns = [
-        r'\d+\.\s*[A-Z][^.]*\.',  # Numbered clauses
-        r'[A-Z][^.]*\.',  # Sentences starting with capital letters
-        r'WHEREAS[^.]*\.',  # Whereas clauses
-        r'PROVIDED[^.]*\.',  # Provided clauses
-        r'FURTHER[^.]*\.',  # Further clauses
-    ]
-    
-    clauses = []
-    for pattern in clause_patterns:
-        matches = re.findall(pattern, document_content, re.MULTILINE | re.DOTALL)
-        clauses.extend(matches)
-    
-    # If no clauses found with patterns, split by sentences
-    if not clauses:
-        sentences = re.split(r'[.!?]+', document_content)
-        clauses = [s.strip() for s in sentences if len(s.strip()) > 20]  # Filter short sentences
-    
-    return clauses
+    """Extract the unique clauses of a document in order (see segmenter.segment_clauses for offsets)"""
+    return [segment['text'] for segment in segment_clauses(document_content)]
 
 
-def analyze_clause(clause_text, clause_type='general'):
-    """Analyze a single clause using AI"""
-    try:
-        system_prompt = """You are a legal reviewer specializing in clause analysis. Analyze the following clause and classify it:
+CLAUSE_ANALYSIS_PROMPT = """You are a legal reviewer specializing in clause analysis. Analyze the following clause and classify it:
 - Red: Unfair, risky, or problematic clauses
 - Amber: Ambiguous, unusual, or clauses that need review
 - Green: Standard, fair, and acceptable clauses
@@ -40,59 +26,237 @@ Then provide:
 3. Suggested improvements if red or amber
 4. Confidence score (0-100)
 
-Format your response as JSON:
+Respond only with JSON in this format:
 {
     "risk_level": "red|amber|green",
     "explanation": "brief explanation",
     "suggestions": "improvement suggestions",
     "confidence": 85
 }"""
+
+VERDICT_PROPERTIES = {
+    "risk_level": {"type": "string", "enum": ["red", "amber", "green"]},
+    "explanation": {"type": "string"},
+    "suggestions": {"type": "string"},
+    "confidence": {"type": "integer", "minimum": 0, "maximum": 100},
+}
+
+# Output schema for constrained decoding; risk_level comes first so it is decided first
+CLAUSE_VERDICT_SCHEMA = {
+    "type": "object",
+    "properties": VERDICT_PROPERTIES,
+    "required": list(VERDICT_PROPERTIES),
+}
+
+
+# Explanations of the placeholder verdicts given when a clause could not be analyzed
+UNPARSED_EXPLANATION = 'Unable to parse AI response'
+FAILED_EXPLANATION_PREFIX = 'Analysis failed: '
+
+
+def analyze_clause(clause_text, clause_type='general', client=None, cancel=None, screened=False):
+    """Analyze a single clause using AI"""
+    for event, payload in iter_clause_analysis(clause_text, clause_type, client, cancel, screened):
+        if event == 'result':
+            return payload
+
+
+def iter_clause_analysis(clause_text, clause_type='general', client=None, cancel=None, screened=False):
+    """Analyze a single clause, yielding ('token', text) events and finally ('result', analysis)
+
+    Set `screened` when the caller has already run the clause past the triage rules
+    and the verdict cache, so neither is consulted (or counted) a second time.
+    """
+    try:
+        messages = build_clause_messages(clause_text)
         
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"Analyze this clause: {clause_text}"}
-        ]
+        if not screened:
+            local = triage_engine.classify(clause_text)
+            if local is not None:
+                yield 'result', local
+                return
+            
+            cached = verdict_cache.get(clause_text, clause_type, CLAUSE_PROMPT_VERSION)
+            if cached is not None:
+                yield 'result', cached
+                return
         
-        ai_response = ai_service.generate_response(messages, max_tokens=500, temperature=0.3)
+        ai_response = ""
+        for token in ai_service.stream_response(messages, temperature=0.3, task='classification', client=client, cancel=cancel, response_format=CLAUSE_VERDICT_SCHEMA):
+            ai_response += token
+            yield 'token', token
         
-        # Try to extract JSON from response
-        try:
-            import json
-            analysis = json.loads(ai_response)
-        except json.JSONDecodeError:
+        analysis = parse_clause_analysis(ai_response)
+        if analysis is not None:
+            verdict_cache.set(clause_text, clause_type, CLAUSE_PROMPT_VERSION, analysis)
+        else:
             # Fallback if JSON parsing fails
             analysis = {
                 'risk_level': 'amber',
-                'explanation': 'Unable to parse AI response',
+                'explanation': UNPARSED_EXPLANATION,
                 'suggestions': 'Manual review recommended',
-                'confidence': 50
+                'confidence': 50,
+                'source': 'fallback'
             }
         
-        return analysis
+        yield 'result', analysis
         
     except Exception as e:
         # Fallback analysis
-        return {
-            'risk_level': 'amber',
-            'explanation': f'Analysis failed: {str(e)}',
-            'suggestions': 'Manual review recommended',
-            'confidence': 0
+        yield 'result', failed_analysis(e)
+
+
+def build_clause_messages(clause_text):
+    """Messages asking the model to classify a single clause"""
+    return [
+        {"role": "system", "content": CLAUSE_ANALYSIS_PROMPT},
+        {"role": "user", "content": f"Analyze this clause: {clause_text}"}
+    ]
+
+
+def parse_clause_analysis(ai_response):
+    """Parse the verdict of a single-clause analysis, or None if the response holds no valid verdict"""
+    analysis = extract_json(ai_response)
+    if analysis is None or analysis.get('risk_level') not in ('red', 'amber', 'green'):
+        return None
+    return analysis
+
+
+def failed_analysis(error):
+    """Fallback analysis for a clause whose review raised an error"""
+    return {
+        'risk_level': 'amber',
+        'explanation': f'{FAILED_EXPLANATION_PREFIX}{str(error)}',
+        'suggestions': 'Manual review recommended',
+        'confidence': 0,
+        'source': 'fallback'
+    }
+
+
+BATCH_ANALYSIS_PROMPT = """You are a legal reviewer specializing in clause analysis. You will receive several clauses, each introduced by a tag like [clause 3]. Classify every clause:
+- Red: Unfair, risky, or problematic clauses
+- Amber: Ambiguous, unusual, or clauses that need review
+- Green: Standard, fair, and acceptable clauses
+
+For each clause provide the risk level, a brief explanation, suggested improvements if red or amber, and a confidence score (0-100).
+
+Respond only with JSON: an object whose "verdicts" array holds one object per clause, using the number from its tag as clause_id:
+{
+    "verdicts": [
+        {
+            "clause_id": 3,
+            "risk_level": "red|amber|green",
+            "explanation": "brief explanation",
+            "suggestions": "improvement suggestions",
+            "confidence": 85
         }
+    ]
+}"""
+
+BATCH_VERDICT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "verdicts": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"clause_id": {"type": "integer"}, **VERDICT_PROPERTIES},
+                "required": ["clause_id", *VERDICT_PROPERTIES],
+            },
+        },
+    },
+    "required": ["verdicts"],
+}
+
+# Rough output budget for one verdict in a batched response
+BATCH_TOKENS_PER_VERDICT = 120
+
+# Changes whenever either analysis prompt or output schema changes, invalidating cached verdicts
+CLAUSE_PROMPT_VERSION = hashlib.sha256(
+    (CLAUSE_ANALYSIS_PROMPT + BATCH_ANALYSIS_PROMPT + json.dumps([CLAUSE_VERDICT_SCHEMA, BATCH_VERDICT_SCHEMA], sort_keys=True)).encode('utf-8')
+).hexdigest()[:12]
+
+
+def get_context_tokens():
+    """Context window of the model serving clause analysis"""
+    if ai_service.get_current_provider() == 'openai':
+        return getattr(settings, 'OPENAI_CONTEXT_TOKENS', 8192)
+    return ai_service.get_num_ctx(ai_service.get_task_model('classification', 'mistral')) or 4096
+
+
+def plan_clause_batches(clauses, context_tokens=None, max_batch_size=None):
+    """Group (clause_id, clause_text) pairs into batches that fit the model context"""
+    context_tokens = context_tokens or get_context_tokens()
+    max_batch_size = max_batch_size or getattr(settings, 'REDLINING_MAX_BATCH_SIZE', 8)
+    budget = context_tokens - estimate_tokens(BATCH_ANALYSIS_PROMPT)
+    
+    batches = []
+    current = []
+    used = 0
+    for clause_id, clause_text in clauses:
+        cost = estimate_tokens(clause_text) + BATCH_TOKENS_PER_VERDICT + 8  # tag and separator
+        if current and (len(current) >= max_batch_size or used + cost > budget):
+            batches.append(current)
+            current = []
+            used = 0
+        current.append((clause_id, clause_text))
+        used += cost
+    
+    if current:
+        batches.append(current)
+    return batches
+
+
+def analyze_clause_batch(batch, client=None, cancel=None):
+    """Analyze several (clause_id, clause_text) pairs in one request, returning {clause_id: analysis}
+
+    The clauses are expected to have been screened by the triage rules and the verdict cache already.
+    """
+    results = {}
+    try:
+        clause_block = "\n\n".join(f"[clause {clause_id}]\n{clause_text}" for clause_id, clause_text in batch)
+        messages = [
+            {"role": "system", "content": BATCH_ANALYSIS_PROMPT},
+            {"role": "user", "content": f"Analyze these clauses:\n\n{clause_block}"}
+        ]
+        
+        max_tokens = BATCH_TOKENS_PER_VERDICT * len(batch) + 50
+        ai_response = ai_service.generate_response(messages, max_tokens=max_tokens, temperature=0.3, task='classification', client=client, cancel=cancel, response_format=BATCH_VERDICT_SCHEMA)
+        
+        response = extract_json(ai_response)
+        verdicts = response.get('verdicts') if response is not None else extract_json(ai_response, list)
+        if not isinstance(verdicts, list):
+            verdicts = []
+        
+        expected_ids = {clause_id for clause_id, _ in batch}
+        for verdict in verdicts:
+            if not isinstance(verdict, dict):
+                continue
+            try:
+                clause_id = int(verdict.pop('clause_id'))
+            except (KeyError, TypeError, ValueError):
+                continue
+            if clause_id in expected_ids and verdict.get('risk_level') in ('red', 'amber', 'green'):
+                results[clause_id] = verdict
+        
+        for clause_id, clause_text in batch:
+            if clause_id in results:
+                verdict_cache.set(clause_text, 'general', CLAUSE_PROMPT_VERSION, results[clause_id])
+    except StreamCancelled:
+        raise
+    except Exception as e:
+        print(f"Batched clause analysis failed, falling back to single clauses: {e}")
+    
+    # Clauses the batch did not answer are analyzed individually
+    for clause_id, clause_text in batch:
+        if cancel is not None:
+            cancel.check()
+        if clause_id not in results:
+            results[clause_id] = analyze_clause(clause_text, client=client, cancel=cancel, screened=True)
+    
+    return results
 
 
 def get_clause_type(clause_text):
     """Determine the type of clause based on content"""
-    clause_text_lower = clause_text.lower()
-    
-    if any(word in clause_text_lower for word in ['confidential', 'secret', 'proprietary']):
-        return 'confidentiality'
-    elif any(word in clause_text_lower for word in ['indemnify', 'indemnification', 'liability']):
-        return 'indemnity'
-    elif any(word in clause_text_lower for word in ['intellectual property', 'ip', 'patent', 'copyright']):
-        return 'ip'
-    elif any(word in clause_text_lower for word in ['terminate', 'termination', 'end']):
-        return 'termination'
-    elif any(word in clause_text_lower for word in ['governing law', 'jurisdiction', 'venue']):
-        return 'governing_law'
-    else:
-        return 'general' 
\ No newline at end of file
+    return triage_engine.match(clause_text)[1]
@@ -3,15 +3,33 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.views.decorators.csrf import csrf_exempt
 from django.http import StreamingHttpResponse
+import hashlib
 import json
 from core.ai_service import ai_service
-from .utils import analyze_clause, extract_clauses
+from core.scheduler import get_client_key
+from core.sse import relay_events
+from core.streams import CancellationToken
+from .utils import analyze_clause
+from .segmenter import segment_clauses
+from .engine import clause_engine
+from .cache import verdict_cache
+from .triage import triage_engine
+from .classifier import clause_classifier
+from .models import RedlineAnalysis
+from .revisions import align_clauses, can_carry_forward, carry_forward, revision_summary
+from .compare import iter_section_diffs
+from documents.models import Document
 
 
 @api_view(['POST'])
 @csrf_exempt
 def analyze_document(request):
-    """Analyze document for clause redlining and RAG review"""
+    """Analyze document for clause redlining and RAG review
+
+    With previous_analysis_id, the document is treated as a revision of that analysis:
+    verdicts of unchanged clauses are carried forward and only changed and inserted
+    clauses, and unchanged ones whose previous analysis failed, are analyzed.
+    """
     try:
         data = json.loads(request.body)
         document_content = data.get('content', '')
@@ -19,25 +37,32 @@ def analyze_document(request):
         if not document_content:
             return Response({'error': 'Document content is required'}, status=status.HTTP_400_BAD_REQUEST)
         
+        previous = get_previous_analysis(data)
+        if data.get('previous_analysis_id') and previous is None:
+            return Response({'error': 'Previous analysis not found'}, status=status.HTTP_404_NOT_FOUND)
+        
         # Extract clauses from document
-        clauses = extract_clauses(document_content)
+        segments = segment_clauses(document_content)
+        clauses = [segment['text'] for segment in segments]
+        results, alignment, removed = reuse_previous_verdicts(previous, clauses)
+        reused = len(results)
         
-        # Analyze each clause
-        analysis_results = []
-        for i, clause in enumerate(clauses):
-            if clause.strip():  # Skip empty clauses
-                analysis = analyze_clause(clause)
-                analysis['clause_id'] = i
-                analysis['clause_text'] = clause
-                analysis_results.append(analysis)
+        # Analyze the remaining clauses concurrently, keeping results in clause order
+        pending = [clause_id for clause_id in range(len(clauses)) if clause_id not in results]
+        for result in clause_engine.analyze([clauses[clause_id] for clause_id in pending], client=get_client_key(request)):
+            results[pending[result['clause_id']]] = result
+        analysis_results = [describe_clause(results[clause_id], clause_id, segments, alignment) for clause_id in sorted(results)]
         
         # Generate summary
         summary = generate_analysis_summary(analysis_results)
+        analysis = save_analysis(document_content, analysis_results, summary, previous, alignment, removed, reused)
         
         return Response({
             'analysis': analysis_results,
             'summary': summary,
-            'total_clauses': len(analysis_results)
+            'total_clauses': len(analysis_results),
+            'analysis_id': analysis.pk,
+            'version': analysis.version,
         })
         
     except Exception as e:
@@ -47,7 +72,7 @@ def analyze_document(request):
 @api_view(['POST'])
 @csrf_exempt
 def analyze_document_streaming(request):
-    """Analyze document for clause redlining and RAG review with streaming"""
+    """Analyze document for clause redlining and RAG review with streaming (optionally as a revision, see analyze_document)"""
     try:
         data = json.loads(request.body)
         document_content = data.get('content', '')
@@ -55,6 +80,13 @@ def analyze_document_streaming(request):
         if not document_content:
             return Response({'error': 'Document content is required'}, status=status.HTTP_400_BAD_REQUEST)
         
+        previous = get_previous_analysis(data)
+        if data.get('previous_analysis_id') and previous is None:
+            return Response({'error': 'Previous analysis not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        client = get_client_key(request)
+        cancel = CancellationToken()
+        
         def generate_analysis_stream():
             """Generate streaming analysis response"""
             try:
@@ -62,32 +94,40 @@ def analyze_document_streaming(request):
                 yield f"data: {json.dumps({'status': 'started', 'message': 'Starting document analysis...'})}\n\n"
                 
                 # Extract clauses from document
-                clauses = extract_clauses(document_content)
-                yield f"data: {json.dumps({'status': 'progress', 'message': f'Found {len(clauses)} clauses to analyze...'})}\n\n"
+                segments = segment_clauses(document_content)
+                clauses = [segment['text'] for segment in segments]
+                results, alignment, removed = reuse_previous_verdicts(previous, clauses)
+                reused = len(results)
+                pending = [clause_id for clause_id in range(len(clauses)) if clause_id not in results]
+                if previous is not None:
+                    yield f"data: {json.dumps({'status': 'progress', 'message': f'Found {len(clauses)} clauses, {reused} verdicts reused from version {previous.version}, {len(pending)} to analyze...'})}\n\n"
+                else:
+                    yield f"data: {json.dumps({'status': 'progress', 'message': f'Found {len(clauses)} clauses to analyze...'})}\n\n"
                 
-                # Analyze each clause
-                analysis_results = []
-                for i, clause in enumerate(clauses):
-                    if clause.strip():  # Skip empty clauses
-                        yield f"data: {json.dumps({'status': 'progress', 'message': f'Analyzing clause {i+1}/{len(clauses)}...'})}\n\n"
-                        analysis = analyze_clause(clause)
-                        analysis['clause_id'] = i
-                        analysis['clause_text'] = clause
-                        analysis_results.append(analysis)
+                # Analyze the remaining clauses concurrently and report each one as it completes
+                for event, pending_id, payload in clause_engine.iter_events([clauses[clause_id] for clause_id in pending], client=client, cancel=cancel):
+                    clause_id = pending[pending_id]
+                    if event == 'token':
+                        yield f"data: {json.dumps({'status': 'token', 'clause_id': clause_id, 'token': payload})}\n\n"
+                    else:
+                        results[clause_id] = payload
+                        yield f"data: {json.dumps({'status': 'progress', 'message': f'Analyzed clause {len(results)}/{len(clauses)}...', 'clause_id': clause_id, 'completed': len(results), 'total': len(clauses)})}\n\n"
+                analysis_results = [describe_clause(results[clause_id], clause_id, segments, alignment) for clause_id in sorted(results)]
                 
                 # Generate summary
                 yield f"data: {json.dumps({'status': 'progress', 'message': 'Generating analysis summary...'})}\n\n"
                 summary = generate_analysis_summary(analysis_results)
+                analysis = save_analysis(document_content, analysis_results, summary, previous, alignment, removed, reused)
                 
                 # Send the complete results
-                yield f"data: {json.dumps({'status': 'completed', 'analysis': analysis_results, 'summary': summary, 'total_clauses': len(analysis_results)})}\n\n"
+                yield f"data: {json.dumps({'status': 'completed', 'analysis': analysis_results, 'summary': summary, 'total_clauses': len(analysis_results), 'analysis_id': analysis.pk, 'version': analysis.version})}\n\n"
                 
             except Exception as e:
                 yield f"data: {json.dumps({'status': 'error', 'error': str(e)})}\n\n"
         
         # Return streaming response
         response = StreamingHttpResponse(
-            generate_analysis_stream(),
+            relay_events(generate_analysis_stream(), cancel),
             content_type='text/event-stream'
         )
         response['Cache-Control'] = 'no-cache'
@@ -110,7 +150,7 @@ def analyze_single_clause(request):
         if not clause_text:
             return Response({'error': 'Clause text is required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        analysis = analyze_clause(clause_text, clause_type)
+        analysis = analyze_clause(clause_text, clause_type, client=get_client_key(request))
         
         return Response({
             'analysis': analysis,
@@ -121,6 +161,128 @@ def analyze_single_clause(request):
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['POST'])
+@csrf_exempt
+def compare_documents(request):
+    """Compare two uploaded documents clause by clause, streaming the changes section by section"""
+    try:
+        data = json.loads(request.body)
+        original_id = data.get('original_document_id')
+        revised_id = data.get('revised_document_id')
+        
+        if not original_id or not revised_id:
+            return Response({'error': 'Original and revised document IDs are required'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        original = Document.objects.get(id=original_id)
+        revised = Document.objects.get(id=revised_id)
+        if not original.content or not revised.content:
+            return Response({'error': 'Both documents must have extracted text'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        cancel = CancellationToken()
+        
+        def generate_comparison_stream():
+            """Generate streaming comparison response"""
+            try:
+                yield f"data: {json.dumps({'status': 'started', 'message': f'Comparing {original.title} with {revised.title}...'})}\n\n"
+                
+                # Each section is sent as soon as its clauses have been diffed
+                totals = {}
+                for section in iter_section_diffs(original.content, revised.content, totals):
+                    yield f"data: {json.dumps({'status': 'section', **section})}\n\n"
+                
+                yield f"data: {json.dumps({'status': 'completed', 'summary': totals, 'original_document_id': original.id, 'revised_document_id': revised.id})}\n\n"
+                
+            except Exception as e:
+                yield f"data: {json.dumps({'status': 'error', 'error': str(e)})}\n\n"
+        
+        response = StreamingHttpResponse(
+            relay_events(generate_comparison_stream(), cancel),
+            content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+        
+    except Document.DoesNotExist:
+        return Response({'error': 'Document not found'}, status=status.HTTP_404_NOT_FOUND)
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET', 'DELETE'])
+@csrf_exempt
+def verdict_cache_stats(request):
+    """Get clause verdict cache, local triage and classifier statistics, or clear the cache"""
+    try:
+        if request.method == 'DELETE':
+            verdict_cache.clear()
+        return Response({**verdict_cache.get_stats(), 'triage': triage_engine.get_stats(), 'classifier': clause_classifier.get_stats()})
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def clause_location(segment):
+    """Where a clause sits in the document: character offsets, clause number and heading"""
+    return {
+        'start': segment['start'],
+        'end': segment['end'],
+        'clause_number': segment['number'],
+        'heading': segment['heading'],
+    }
+
+
+def get_previous_analysis(data):
+    """The stored analysis a document is a revision of, if the request names one"""
+    previous_id = data.get('previous_analysis_id')
+    if not previous_id:
+        return None
+    return RedlineAnalysis.objects.filter(pk=previous_id).first()
+
+
+def reuse_previous_verdicts(previous, clauses):
+    """Align clauses with the previous version and carry the verdicts of unchanged clauses forward
+
+    Unchanged clauses whose previous analysis failed or could not be parsed get no
+    verdict, so they are analyzed again. Returns (verdicts by clause id, alignment,
+    removed previous clause ids); the alignment is None when there is no previous version.
+    """
+    if previous is None:
+        return {}, None, []
+    alignment, removed = align_clauses([result['clause_text'] for result in previous.results], clauses)
+    results = {}
+    for clause_id, (revision, previous_id) in enumerate(alignment):
+        if revision == 'unchanged' and can_carry_forward(previous.results[previous_id]):
+            results[clause_id] = carry_forward(previous.results[previous_id])
+    return results, alignment, removed
+
+
+def describe_clause(analysis, clause_id, segments, alignment):
+    """Add the clause text, its location and, for a revision, what changed since the previous version"""
+    analysis['clause_id'] = clause_id
+    analysis['clause_text'] = segments[clause_id]['text']
+    analysis.update(clause_location(segments[clause_id]))
+    if alignment is not None:
+        analysis['revision'], analysis['previous_clause_id'] = alignment[clause_id]
+    return analysis
+
+
+def save_analysis(document_content, analysis_results, summary, previous, alignment, removed, reused=0):
+    """Store an analysis as the baseline for the next version, adding what changed since the previous one (and how many verdicts were reused) to its summary"""
+    if previous is not None:
+        summary['revision'] = revision_summary(alignment, removed, reused)
+        summary['removed'] = [
+            {'previous_clause_id': clause_id, 'clause_text': previous.results[clause_id]['clause_text'], 'clause_number': previous.results[clause_id].get('clause_number')}
+            for clause_id in removed
+        ]
+    return RedlineAnalysis.objects.create(
+        previous=previous,
+        version=previous.version + 1 if previous is not None else 1,
+        content_hash=hashlib.sha256(document_content.encode('utf-8')).hexdigest(),
+        results=analysis_results,
+        summary=summary,
+    )
+
+
 def generate_analysis_summary(analysis_results):
     """Generate a summary of the analysis results"""
     red_count = sum(1 for result in analysis_results if result['risk_level'] == 'red')
@@ -132,6 +294,7 @@ def generate_analysis_summary(analysis_results):
         'red_clauses': red_count,
         'amber_clauses': amber_count,
         'green_clauses': green_count,
+        'triaged_locally': sum(1 for result in analysis_results if result.get('source') in ('rules', 'classifier')),
         'risk_percentage': round((red_count + amber_count) / len(analysis_results) * 100, 1) if analysis_results else 0
     }
     
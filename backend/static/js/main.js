@@ -304,6 +304,7 @@ ndaForm.addEventListener('submit', async (e) => {
         const reader = response.body.getReader();
         const decoder = new TextDecoder();
         let buffer = '';
+        let streamedLength = 0;
         
         while (true) {
             const { done, value } = await reader.read();
@@ -321,6 +322,13 @@ ndaForm.addEventListener('submit', async (e) => {
                         
                         if (data.status === 'started') {
                             updateLoadingMessage('fas fa-cogs', 'AI is generating your document...', 50);
+                        } else if (data.status === 'token') {
+                            // Refresh the progress text periodically while tokens arrive
+                            const previousLength = streamedLength;
+                            streamedLength += data.token.length;
+                            if (previousLength === 0 || Math.floor(streamedLength / 500) > Math.floor(previousLength / 500)) {
+                                updateLoadingMessage('fas fa-stream', `AI is streaming your document in real-time... (${streamedLength} characters)`, 90);
+                            }
                         } else if (data.status === 'completed') {
                             updateLoadingMessage('fas fa-check-circle', 'Document crafted successfully!', 100, 'success');
                             
@@ -1,80 +1,38 @@
 #!/usr/bin/env python
 """
-Warmup script for Mistral AI model
-This helps reduce the first request timeout issue
+Warmup script for Ollama models
+Loads the configured resident models ahead of time. The server does this
+automatically at startup, so this is only needed when running without it.
 """
 
-import requests
-import time
-import json
+import os
+import django
+
+# Setup Django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+
+from core.ai_service import ai_service
+
 
 def warmup_mistral():
-    """Warm up the Mistral model with a simple streaming request"""
-    print("🔥 Warming up Mistral AI model with streaming...")
+    """Warm up every resident model through the residency manager"""
+    print(f"🔥 Warming up Ollama models: {', '.join(ai_service.residency.models)}")
+    success = ai_service.residency.warm_all()
     
-    try:
-        # Simple warmup request with streaming
-        warmup_payload = {
-            "model": "mistral",
-            "prompt": "Hello, please respond with 'Model is ready'",
-            "stream": True,
-            "options": {
-                "temperature": 0.1,
-                "num_predict": 20
-            }
-        }
-        
-        print("Sending streaming warmup request...")
-        response = requests.post(
-            "http://localhost:11434/api/generate",
-            json=warmup_payload,
-            stream=True,
-            timeout=120
-        )
-        
-        if response.status_code == 200:
-            # Collect streaming response
-            full_response = ""
-            print("Receiving streaming response...")
-            for line in response.iter_lines():
-                if line:
-                    try:
-                        data = line.decode('utf-8')
-                        if data.startswith('data: '):
-                            data = data[6:]
-                        
-                        if data.strip() == '[DONE]':
-                            break
-                            
-                        json_data = json.loads(data)
-                        if 'response' in json_data:
-                            chunk = json_data['response']
-                            full_response += chunk
-                            print(f"Received: {chunk}", end='', flush=True)
-                            
-                    except json.JSONDecodeError:
-                        continue
-                    except Exception as e:
-                        print(f"Error parsing streaming response: {e}")
-                        continue
-            
-            print(f"\n✅ Model warmed up successfully!")
-            print(f"Full Response: {full_response}")
-            return True
-        else:
-            print(f"❌ Warmup failed with status: {response.status_code}")
-            return False
-            
-    except requests.exceptions.Timeout:
-        print("⏰ Warmup timed out - this is normal for the first request")
-        return False
-    except Exception as e:
-        print(f"❌ Warmup error: {e}")
-        return False
+    for base_url, models in ai_service.residency.get_status()['backends'].items():
+        print(f"\n{base_url}")
+        for model, state in models.items():
+            if state['state'] == 'loaded':
+                print(f"✅ {model} loaded in {state['last_warm_seconds']}s")
+            else:
+                print(f"❌ {model}: {state['message'] or state['state']}")
+    
+    return success
 
 if __name__ == "__main__":
     print("=" * 50)
-    print("Mistral AI Model Warmup")
+    print("Ollama Model Warmup")
     print("=" * 50)
     
     success = warmup_mistral()
@@ -86,4 +44,4 @@ if __name__ == "__main__":
         print("\n⚠️  Model warmup had issues, but you can still try NDA generation.")
         print("The first request might take longer than usual.")
     
-    print("=" * 50) 
\ No newline at end of file
+    print("=" * 50)